@@ -29,7 +29,7 @@ from xl import covers, player, trax, xdg, providers
 from xl import common
 from xl.nls import gettext as _
 import xlgui
-from xlgui.guiutil import pixbuf_from_data
+from xlgui.cover import PIXBUF_CACHE
 from xlgui.widgets import dialogs, menu
 
 
@@ -91,7 +91,7 @@ class Bookmark:
                 image = covers.MANAGER.get_cover(item, set_only=True)
                 if image:
                     try:
-                        self.__cover_pixbuf = pixbuf_from_data(image, size=(16, 16))
+                        self.__cover_pixbuf = PIXBUF_CACHE.get_pixbuf(image, (16, 16))
                     except GLib.GError:
                         LOGGER.warning('Could not load cover')
             else:
@@ -53,6 +53,7 @@ class LastFMCoverSearch(covers.CoverSearchMethod):
     name = 'lastfm'
     title = 'Last.fm'
     type = 'remote'  # fetches remotely as opposed to locally
+    max_concurrent = 4
 
     url = '{api_rurl}?method={type}.search&{type}={value}&format=json&api_key={api_key}'
 
@@ -31,6 +31,7 @@ from xl import player as xl_player
 from xl import settings as xl_settings
 from xl.nls import gettext as _
 from xlgui import icons
+from xlgui.cover import PIXBUF_CACHE
 from xlgui.guiutil import pixbuf_from_data
 
 from . import notifyprefs
@@ -232,8 +233,10 @@ class Notifier(PlaybackAdapter):
             cover_data = covers.MANAGER.get_cover(
                 track, set_only=True, use_default=True
             )
-            size = DEFAULT_ICON_SIZE if self.settings.resize_covers else None
-            new_icon = pixbuf_from_data(cover_data, size)
+            if self.settings.resize_covers:
+                new_icon = PIXBUF_CACHE.get_pixbuf(cover_data, DEFAULT_ICON_SIZE)
+            else:
+                new_icon = pixbuf_from_data(cover_data)
             self.notification.set_image_from_pixbuf(new_icon)
         return icon_name
 
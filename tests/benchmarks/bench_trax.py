@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for xl.trax
+
+Times the operations that dominate working with a large collection on
+synthetic collections of various sizes, and reports the results as JSON
+so that runs on different commits can be compared:
+
+    python3 tests/benchmarks/bench_trax.py --output before.json
+    git checkout other-branch
+    python3 tests/benchmarks/bench_trax.py --compare before.json
+
+Every benchmark runs in a separate process, so that the peak memory use
+reported for it isn't influenced by the others. The reported time is the
+best of --repeat runs.
+
+This is not collected by pytest; use 'make benchmark' or run it directly.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_SIZES = (10000, 100000, 500000)
+
+#: queries used by the search benchmarks, in the syntax of the search box
+SEARCH_QUERIES = (
+    'artist=="artist 7"',
+    'album="album 1"',
+    'genre==rock ! artist="artist 1"',
+    'title="song 12" | title="song 13"',
+    'love',
+)
+
+GENRES = ('rock', 'pop', 'jazz', 'classical', 'electronic', 'folk', 'metal')
+WORDS = ('love', 'night', 'blue', 'the', 'a', 'fire', 'rain', 'heart', 'road')
+
+
+def make_tags(size, seed=0):
+    """
+    Generates the tags of a synthetic collection
+
+    The distribution roughly follows a real collection: about 12 tracks
+    per album, 4 albums per artist, some shared words in titles.
+
+    :returns: a list of (uri, tags) tuples
+    """
+    rng = random.Random(seed)
+    result = []
+    albums = max(1, size // 12)
+    for i in range(size):
+        album = i * albums // size
+        artist = album // 4
+        title = 'song %d %s %s' % (i % 97, rng.choice(WORDS), rng.choice(WORDS))
+        tags = {
+            'artist': ['artist %d' % artist],
+            'albumartist': ['artist %d' % artist],
+            'album': ['album %d' % album],
+            'title': [title],
+            'tracknumber': ['%d' % (i % 12 + 1)],
+            'discnumber': ['1'],
+            'date': ['%d' % rng.randint(1960, 2020)],
+            'genre': [GENRES[artist % len(GENRES)]],
+            '__length': rng.randint(60, 600),
+            '__playcount': rng.randint(0, 50),
+        }
+        uri = 'file:///bench/artist%d/album%d/%05d.mp3' % (artist, album, i)
+        result.append((uri, tags))
+    return result
+
+
+def make_tracks(size):
+    from xl.trax import Track
+
+    tracks = []
+    for uri, tags in make_tags(size):
+        tr = Track(uri, scan=False)
+        tr.set_tags(notify_changed=False, **tags)
+        tracks.append(tr)
+    return tracks
+
+
+def clear_tracks():
+    from xl.trax import Track
+
+    Track._Track__tracksdict.clear()
+
+
+#
+# Benchmarks
+#
+# Each benchmark is a function taking the collection size that returns
+# a (setup, run) tuple of functions. setup() is called before every run
+# and its result passed to run(); only run() is timed.
+#
+
+
+def bench_track_construction(size):
+    tags = make_tags(size)
+
+    def run(_):
+        from xl.trax import Track
+
+        clear_tracks()
+        for uri, t in tags:
+            tr = Track(uri, scan=False)
+            tr.set_tags(notify_changed=False, **t)
+
+    return None, run
+
+
+def bench_matcher_parse(size):
+    from xl.trax import TracksMatcher
+
+    # parsing doesn't depend on the collection, so scale the number of
+    # queries with it to keep the numbers comparable
+    count = max(1, size // 100)
+
+    def run(_):
+        for i in range(count):
+            TracksMatcher(
+                SEARCH_QUERIES[i % len(SEARCH_QUERIES)],
+                case_sensitive=False,
+                keyword_tags=['artist', 'album', 'title'],
+            )
+
+    return None, run
+
+
+def _search(size, use_index):
+    from xl import trax
+
+    tracks = make_tracks(size)
+    db = trax.TrackDB('bench')
+    db.add_tracks(tracks)
+    index = trax.TrackSearchIndex(db) if use_index else None
+
+    def run(_):
+        for query in SEARCH_QUERIES:
+            for _result in trax.search_tracks_from_string(
+                db,
+                query,
+                case_sensitive=False,
+                keyword_tags=['artist', 'album', 'title'],
+                index=index,
+            ):
+                pass
+
+    return None, run
+
+
+def bench_search(size):
+    return _search(size, use_index=False)
+
+
+def bench_search_indexed(size):
+    return _search(size, use_index=True)
+
+
+def bench_sort(size):
+    from xl import common, trax
+
+    tracks = make_tracks(size)
+    random.Random(1).shuffle(tracks)
+
+    def setup():
+        # sort keys are cached per track; drop them so that every run
+        # measures a cold sort
+        for tr in tracks:
+            tr._sort_cache = None
+        return tracks
+
+    def run(tracks):
+        trax.sort_tracks(common.BASE_SORT_TAGS, tracks)
+
+    return setup, run
+
+
+def bench_trackdb_save(size):
+    from xl import trax
+
+    tmpdir = tempfile.mkdtemp()
+    db = trax.TrackDB('bench')
+    db.add_tracks(make_tracks(size))
+    count = [0]
+
+    def setup():
+        # a new location makes every run write all the tracks
+        count[0] += 1
+        db._dirty = True
+        return os.path.join(tmpdir, 'music%d.db' % count[0])
+
+    def run(location):
+        db.save_to_location(location)
+
+    return setup, run
+
+
+def _trackdb_load(size, snapshot):
+    from xl import trax
+
+    location = os.path.join(tempfile.mkdtemp(), 'music.db')
+    db = trax.TrackDB('bench', location, snapshot=snapshot)
+    db.add_tracks(make_tracks(size))
+    db.save_to_location()
+    del db
+
+    def setup():
+        clear_tracks()
+
+    def run(_):
+        trax.TrackDB('bench', location, snapshot=snapshot)
+
+    return setup, run
+
+
+def bench_trackdb_load(size):
+    return _trackdb_load(size, snapshot=False)
+
+
+def bench_trackdb_load_snapshot(size):
+    return _trackdb_load(size, snapshot=True)
+
+
+BENCHMARKS = {
+    name[len('bench_') :]: func
+    for name, func in globals().items()
+    if name.startswith('bench_')
+}
+
+
+#
+# Running
+#
+
+
+def get_peak_rss():
+    """
+    :returns: the peak resident set size of this process in KiB
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024  # bytes on macOS
+    return rss
+
+
+def run_single(name, size, repeat):
+    """
+    Runs one benchmark in this process
+
+    :returns: the result as a dict
+    """
+    os.environ.setdefault('EXAILE_DIR', ROOT)
+    tmp = tempfile.mkdtemp(prefix='exaile-bench-')
+    # keep settings, caches and databases out of the user's home
+    for var in ('XDG_CONFIG_HOME', 'XDG_DATA_HOME', 'XDG_CACHE_HOME'):
+        os.environ[var] = os.path.join(tmp, var.lower())
+    old_tempdir, tempfile.tempdir = tempfile.tempdir, tmp
+    try:
+        setup, run = BENCHMARKS[name](size)
+        setup_rss = get_peak_rss()
+        times = []
+        for _i in range(repeat):
+            arg = setup() if setup is not None else None
+            start = time.perf_counter()
+            run(arg)
+            times.append(time.perf_counter() - start)
+    finally:
+        tempfile.tempdir = old_tempdir
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        'benchmark': name,
+        'size': size,
+        'seconds': min(times),
+        'times': times,
+        'setup_peak_rss_kib': setup_rss,
+        'peak_rss_kib': get_peak_rss(),
+    }
+
+
+def run_subprocess(name, size, repeat):
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        '--single',
+        name,
+        '--sizes',
+        str(size),
+        '--repeat',
+        str(repeat),
+    ]
+    output = subprocess.run(
+        cmd, stdout=subprocess.PIPE, check=True, universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            universal_newlines=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, results):
+    """
+    Prints how the results changed compared to a previous run
+    """
+    old = {(r['benchmark'], r['size']): r for r in previous['results']}
+    print(
+        '%-24s %8s %10s %10s %7s %10s'
+        % ('benchmark', 'size', 'before', 'after', 'ratio', 'rss ratio'),
+        file=sys.stderr,
+    )
+    for result in results:
+        before = old.get((result['benchmark'], result['size']))
+        if before is None:
+            continue
+        print(
+            '%-24s %8d %9.3fs %9.3fs %6.2fx %9.2fx'
+            % (
+                result['benchmark'],
+                result['size'],
+                before['seconds'],
+                result['seconds'],
+                result['seconds'] / max(before['seconds'], 1e-9),
+                result['peak_rss_kib'] / max(before['peak_rss_kib'], 1),
+            ),
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--sizes',
+        default=','.join(str(s) for s in DEFAULT_SIZES),
+        help="comma separated collection sizes (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--benchmarks',
+        default=','.join(BENCHMARKS),
+        help="comma separated benchmarks to run (default: all)",
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3, help="runs per benchmark (default: 3)"
+    )
+    parser.add_argument('--output', help="write the results to this file")
+    parser.add_argument('--compare', help="results of a previous run to compare to")
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    if args.single:
+        sys.path.insert(0, ROOT)
+        print(json.dumps(run_single(args.single, sizes[0], args.repeat)))
+        return
+
+    names = args.benchmarks.split(',')
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %r" % name)
+
+    results = []
+    for size in sizes:
+        for name in names:
+            result = run_subprocess(name, size, args.repeat)
+            print(
+                '%-24s %8d %9.3fs %8d KiB'
+                % (name, size, result['seconds'], result['peak_rss_kib']),
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
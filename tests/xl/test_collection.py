@@ -0,0 +1,223 @@
+import os
+import threading
+
+from gi.repository import Gio, GLib
+
+from xl import collection, event, trax
+from xl.trax import Track, TrackDB
+
+
+class TestIsUnchanged:
+    def setup_method(self):
+        self.track = Track('file:///tmp/collection-test-unchanged.mp3', scan=False)
+        self.track.set_tags(
+            __modified=100, __filesize=2000, __inode=7, notify_changed=False
+        )
+
+    def is_unchanged(self, monkeypatch, **current):
+        tags = {'__modified': 100, '__filesize': 2000, '__inode': 7}
+        tags.update(current)
+        monkeypatch.setattr(trax.track, 'get_file_info_tags', lambda info: tags)
+        return collection.Library._is_unchanged(self.track, None)
+
+    def test_unchanged(self, monkeypatch):
+        assert self.is_unchanged(monkeypatch)
+        # a file restored with an older mtime is not read again
+        assert self.is_unchanged(monkeypatch, __modified=50)
+
+    def test_changed(self, monkeypatch):
+        assert not self.is_unchanged(monkeypatch, __modified=101)
+        assert not self.is_unchanged(monkeypatch, __filesize=2001)
+        assert not self.is_unchanged(monkeypatch, __inode=8)
+
+    def test_tags_from_older_versions(self, monkeypatch):
+        self.track.set_tags(__filesize=None, __inode=None, notify_changed=False)
+        assert self.is_unchanged(monkeypatch, __filesize=1, __inode=1)
+        self.track.set_tags(__modified=None, notify_changed=False)
+        assert not self.is_unchanged(monkeypatch)
+
+    def test_missing_file_info(self, monkeypatch):
+        def get_file_info_tags(info):
+            raise GLib.Error('no modification time')
+
+        monkeypatch.setattr(trax.track, 'get_file_info_tags', get_file_info_tags)
+        assert not collection.Library._is_unchanged(self.track, None)
+
+
+class TestGetRemovedTracks:
+    def setup_method(self):
+        self.library = collection.Library('file:///music')
+        self.library.collection = TrackDB()
+        self.tracks = {}
+        for path in ('a.mp3', 'b/c.mp3', 'link.mp3', 'dirlink/d.mp3', 'e/f.mp3'):
+            track = Track('file:///music/' + path, scan=False)
+            self.tracks[path] = track
+        self.library.collection.add_tracks(self.tracks.values())
+        self.library.collection.add(Track('file:///other/g.mp3', scan=False))
+
+    def get_removed(self, seen, **kwargs):
+        seen = {'file:///music/' + path for path in seen}
+        removed = self.library._get_removed_tracks(
+            Gio.File.new_for_uri('file:///music'), seen, **kwargs
+        )
+        return sorted(path for path, track in self.tracks.items() if track in removed)
+
+    def test_unseen_tracks(self):
+        assert self.get_removed(['a.mp3', 'b/c.mp3', 'e/f.mp3']) == [
+            'dirlink/d.mp3',
+            'link.mp3',
+        ]
+
+    def test_directories_with_errors(self):
+        errors = [Gio.File.new_for_uri('file:///music/b')]
+        assert self.get_removed(['e/f.mp3'], errors=errors) == [
+            'a.mp3',
+            'dirlink/d.mp3',
+            'link.mp3',
+        ]
+
+    def test_links_within_the_library(self):
+        links = [
+            Gio.File.new_for_uri('file:///music/link.mp3'),
+            Gio.File.new_for_uri('file:///music/dirlink'),
+        ]
+        assert self.get_removed(['a.mp3', 'b/c.mp3'], links=links) == ['e/f.mp3']
+
+
+class TestTransferQueue:
+    def setup_method(self):
+        self.progress = []
+        self.added = []
+        self.remove_callback = None
+
+    def teardown_method(self):
+        if self.remove_callback is not None:
+            self.remove_callback()
+
+    def get_queue(self, tmp_path, monkeypatch, workers=4):
+        monkeypatch.setattr(
+            collection.settings,
+            'get_option',
+            lambda option, default=None: (
+                workers if option == 'collection/transfer_workers' else default
+            ),
+        )
+        target = tmp_path / 'library'
+        target.mkdir()
+        library = collection.Library(Gio.File.new_for_path(str(target)).get_uri())
+        library.collection = TrackDB()
+        library._add_copied = lambda gloc: self.added.append(gloc.get_uri())
+        queue = collection.TransferQueue(library)
+        self.remove_callback = event.add_callback(
+            self.on_progress, 'track_transfer_progress', queue
+        )
+        return queue
+
+    def on_progress(self, type, queue, progress):
+        self.progress.append(progress)
+
+    def get_tracks(self, tmp_path, *paths):
+        tracks = []
+        for i, path in enumerate(paths):
+            path = tmp_path / 'source' / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(bytes([i]) * 4096 * (i + 1))
+            tracks.append(Track(Gio.File.new_for_path(str(path)).get_uri(), scan=False))
+        return tracks
+
+    def get_target(self, queue, track):
+        path = Gio.File.new_for_uri(track.get_loc_for_io()).get_path()
+        library = Gio.File.new_for_uri(queue.library.location).get_path()
+        return os.path.join(library, os.path.basename(path))
+
+    def test_transfer(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch)
+        tracks = self.get_tracks(tmp_path, 'a.mp3', 'b.mp3', 'c.mp3')
+        queue.enqueue(tracks)
+        queue.transfer()
+
+        assert queue.queue == []
+        assert len(self.added) == 3
+        for track in tracks:
+            source = Gio.File.new_for_uri(track.get_loc_for_io()).get_path()
+            with open(source, 'rb') as f, open(
+                self.get_target(queue, track), 'rb'
+            ) as g:
+                assert f.read() == g.read()
+        assert queue.bytes_total == queue.bytes_copied == 4096 * 6
+        assert queue.bytes_skipped == 0
+        assert self.progress[-1] == 100
+        assert all(0 <= progress <= 99.9 for progress in self.progress[:-1])
+
+    def test_skip_present_files(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch)
+        tracks = self.get_tracks(tmp_path, 'a.mp3', 'b.mp3')
+        queue.enqueue(tracks)
+        queue.transfer()
+
+        # same size and modification time
+        target = self.get_target(queue, tracks[0])
+        with open(target, 'r+b') as f:
+            f.write(b'changed')
+        stat = os.stat(Gio.File.new_for_uri(tracks[0].get_loc_for_io()).get_path())
+        os.utime(target, (stat.st_atime, stat.st_mtime))
+
+        queue.enqueue(tracks)
+        queue.transfer()
+        assert queue.queue == []
+        assert queue.bytes_skipped == 4096 * 3
+        assert queue.bytes_copied == 0
+        with open(target, 'rb') as f:
+            assert f.read(7) == b'changed'
+        assert self.progress[-1] == 100
+
+    def test_cancel(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch, workers=1)
+        tracks = self.get_tracks(tmp_path, 'a.mp3', 'b.mp3', 'c.mp3')
+        first = self.get_target(queue, tracks[0])
+        cancelled = threading.Event()
+
+        # hold back the other tracks until the first one was copied
+        is_present = queue._TransferQueue__is_present
+
+        def wait_for_cancel(oldgloc, newgloc):
+            if newgloc.get_path() != first:
+                cancelled.wait(5)
+            return is_present(oldgloc, newgloc)
+
+        def cancel(gloc):
+            self.added.append(gloc.get_uri())
+            queue.cancel()
+            cancelled.set()
+
+        monkeypatch.setattr(queue, '_TransferQueue__is_present', wait_for_cancel)
+        queue.library._add_copied = cancel
+        queue.enqueue(tracks)
+        queue.transfer()
+
+        assert queue.queue == tracks[1:]
+        assert os.path.exists(first)
+        for track in tracks[1:]:
+            assert not os.path.exists(self.get_target(queue, track))
+        assert self.progress[-1] == 100
+
+        # the transfer resumes with the remaining tracks
+        queue.library._add_copied = lambda gloc: self.added.append(gloc.get_uri())
+        queue.transfer()
+        assert queue.queue == []
+        assert len(self.added) == 3
+        for track in tracks:
+            assert os.path.exists(self.get_target(queue, track))
+
+    def test_duplicate_targets(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch)
+        tracks = self.get_tracks(tmp_path, 'x/a.mp3', 'y/a.mp3', 'b.mp3')
+        queue.enqueue(tracks)
+        queue.transfer()
+
+        # the second a.mp3 would have overwritten the first one
+        assert queue.queue == [tracks[1]]
+        assert len(self.added) == 2
+        with open(self.get_target(queue, tracks[0]), 'rb') as f:
+            assert f.read() == bytes([0]) * 4096
+        assert self.progress[-1] == 100
@@ -0,0 +1,237 @@
+import os
+import pickle
+import threading
+import time
+
+from gi.repository import Gio
+
+from xl import covers
+from xl.trax import Track
+
+
+class StandInCoverSearch(covers.CoverSearchMethod):
+    """
+    Finds covers in a dict, blocking until it is allowed to answer
+    """
+
+    name = 'standin'
+    max_concurrent = 2
+
+    def __init__(self, found):
+        self.found = found
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.running = 0
+
+    def find_covers(self, track, limit=-1):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        album = track.get_tag_raw('album')[0]
+        return [album] if album in self.found else []
+
+    def get_cover_data(self, db_string):
+        return self.found[db_string]
+
+
+def wait_for(condition):
+    end = time.monotonic() + 5
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestCoverResolver:
+    def setup_method(self):
+        self.tracks = {}
+
+    def get_manager(self, tmp_path, monkeypatch, found, workers=8):
+        options = {
+            'covers/use_tags': False,
+            'covers/use_localfile': False,
+            'covers/fetch_workers': workers,
+        }
+        monkeypatch.setattr(
+            covers.settings,
+            'get_option',
+            lambda option, default=None: options.get(option, default),
+        )
+        manager = covers.CoverManager(str(tmp_path))
+        # Only search the stand-in, not the methods of covers.MANAGER
+        manager.methods.clear()
+        self.provider = StandInCoverSearch(found)
+        manager.on_provider_added(self.provider)
+        return manager
+
+    def get_track(self, album, number):
+        track = Track('file:///tmp/covers-test-%s%d.mp3' % (album, number), scan=False)
+        track.set_tags(album=album, artist='Artist', notify_changed=False)
+        return track
+
+    def test_coalesce_lookups(self, tmp_path, monkeypatch):
+        manager = self.get_manager(tmp_path, monkeypatch, {'A': b'a', 'B': b'b'})
+        tracks = [self.get_track(album, i) for album in 'ABC' for i in range(3)]
+        futures = [manager.resolver.resolve(track) for track in tracks]
+
+        assert futures[0] is futures[1] is futures[2]
+        assert len(set(futures)) == 3
+
+        # Only two lookups may search the stand-in at the same time
+        assert wait_for(lambda: self.provider.running == 2)
+        time.sleep(0.05)
+        assert self.provider.running == 2
+
+        self.provider.release.set()
+        results = [future.result(5) for future in futures]
+        assert results == [b'a'] * 3 + [b'b'] * 3 + [None] * 3
+        assert self.provider.calls == 3
+        assert manager.get_cover(tracks[4], set_only=True) == b'b'
+        manager.resolver.shutdown()
+
+    def test_inline_lookups(self, tmp_path, monkeypatch):
+        manager = self.get_manager(tmp_path, monkeypatch, {'A': b'a', 'B': b'b'}, 1)
+        tracks = [self.get_track(album, 0) for album in 'AB']
+        futures = [manager.resolver.resolve(track) for track in tracks]
+        # the only worker is busy with A, B is queued
+        assert wait_for(lambda: self.provider.running == 1)
+
+        results = {}
+
+        def get_cover(track):
+            results[track] = manager.get_cover(track)
+
+        threads = [
+            threading.Thread(target=get_cover, args=(track,)) for track in tracks
+        ]
+        for thread in threads:
+            thread.start()
+        # A is waited for, B is taken over from the worker
+        assert wait_for(lambda: self.provider.running == 2)
+
+        self.provider.release.set()
+        for thread in threads:
+            thread.join(5)
+        assert results == {tracks[0]: b'a', tracks[1]: b'b'}
+        assert [future.result(5) for future in futures] == [b'a', b'b']
+        manager.resolver.shutdown()
+        assert self.provider.calls == 2
+
+    def test_shutdown_waits_for_lookups(self, tmp_path, monkeypatch):
+        manager = self.get_manager(tmp_path, monkeypatch, {'A': b'a', 'B': b'b'}, 1)
+        tracks = [self.get_track(album, 0) for album in 'AB']
+        futures = [manager.resolver.resolve(track) for track in tracks]
+        assert wait_for(lambda: self.provider.running == 1)
+
+        threading.Timer(0.1, self.provider.release.set).start()
+        manager.resolver.shutdown()
+        # the running lookup stored its cover, the queued one was dropped
+        assert manager.get_cover(tracks[0], set_only=True) == b'a'
+        assert [future.result(0) for future in futures] == [b'a', None]
+        assert self.provider.calls == 1
+
+    def test_remember_misses(self, tmp_path, monkeypatch):
+        manager = self.get_manager(tmp_path, monkeypatch, {})
+        self.provider.release.set()
+        track = self.get_track('A', 0)
+
+        assert manager.get_cover(track) is None
+        assert manager.get_cover(track) is None
+        assert self.provider.calls == 1
+
+        manager.resolver.miss_ttl = 0
+        manager.resolver.forget_misses()
+        assert manager.get_cover(track) is None
+        assert manager.get_cover(track) is None
+        assert self.provider.calls == 3
+        manager.resolver.shutdown()
+
+        assert manager.get_cover(track) is None
+        assert manager.get_cover(track, use_default=True) is manager.default_cover_data
+        assert self.provider.calls == 3
+
+
+class StandInFileInfo:
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+    def get_file_type(self):
+        return Gio.FileType.REGULAR
+
+
+class StandInDirectory:
+    """
+    Lists file names without accessing the file system
+    """
+
+    def __init__(self, uri, names):
+        self.uri = uri
+        self.names = names
+        self.listed = 0
+
+    def get_uri(self):
+        return self.uri
+
+    def enumerate_children(self, attributes, flags, cancellable):
+        self.listed += 1
+        return [StandInFileInfo(name) for name in self.names]
+
+
+class TestLocalFileCoverFetcher:
+    def setup_method(self):
+        self.fetcher = covers.LocalFileCoverFetcher()
+        self.directory = StandInDirectory('file:///music/a', ['cover.jpg', 'a.mp3'])
+        self.mtime = time.time() - 60
+
+    def test_listings_are_cached(self):
+        assert self.fetcher._get_images(self.directory, self.mtime) == ['cover.jpg']
+        self.directory.names.append('back.png')
+        assert self.fetcher._get_images(self.directory, self.mtime) == ['cover.jpg']
+        assert self.directory.listed == 1
+
+        # the directory was modified since it was listed
+        images = self.fetcher._get_images(self.directory, self.mtime + 1)
+        assert images == ['cover.jpg', 'back.png']
+        assert self.directory.listed == 2
+
+    def test_add_directory(self):
+        self.fetcher.add_directory(self.directory, self.mtime, ['folder.PNG', 'a.mp3'])
+        assert self.fetcher._get_images(self.directory, self.mtime) == ['folder.PNG']
+        assert self.directory.listed == 0
+
+        images = self.fetcher._get_images(self.directory, self.mtime + 1)
+        assert images == ['cover.jpg']
+        assert self.directory.listed == 1
+
+    def test_recent_changes_are_not_cached(self):
+        mtime = time.time()
+        self.fetcher.add_directory(self.directory, mtime, ['folder.png'])
+        assert self.fetcher._get_images(self.directory, mtime) == ['cover.jpg']
+        assert self.fetcher._get_images(self.directory, mtime) == ['cover.jpg']
+        assert self.directory.listed == 2
+
+
+class TestCoverDB:
+    def test_import_pickled_db(self, tmp_path):
+        path = os.path.join(str(tmp_path), 'covers.db')
+        with open(path, 'wb') as f:
+            pickle.dump({'version': 2, 'album\0A': 'cache:a'}, f)
+
+        manager = covers.CoverManager(str(tmp_path))
+        assert manager.db['album\0A'] == 'cache:a'
+        assert manager.db['version'] == 2
+        assert not os.path.exists(path)
+
+        manager.db['album\0B'] = 'cache:b'
+        manager.save()
+        manager.db.close()
+
+        manager = covers.CoverManager(str(tmp_path))
+        assert sorted(manager.db) == ['album\0A', 'album\0B', 'version']
+        manager.db.close()
@@ -97,3 +97,66 @@ def test_thread_events():
     ncb.destroy()
 
     _finish_events()
+
+
+class BatchCallback:
+    def __init__(self, obj=None):
+        self.batches = []
+        event.add_batch_callback(self.on_cb, 'test', obj)
+
+    def on_cb(self, type, events):
+        self.batches.append(events)
+
+
+def test_batch_events(monkeypatch):
+    _init_events()
+    idle = []
+    monkeypatch.setattr(GLib, 'idle_add', lambda fn, *args: idle.append((fn, args)))
+
+    bcb = BatchCallback()
+    obj = NormalCallback()
+    ocb = BatchCallback(obj)
+    other = UiCallback()
+
+    event.log_event('test', other, 1)
+    event.log_event('test', obj, 2)
+    event.log_event('other', obj, 3)
+    assert bcb.batches == []
+    assert obj.called is True
+    assert len(idle) == 1
+
+    fn, args = idle.pop()
+    fn(*args)
+    assert bcb.batches == [[(other, 1), (obj, 2)]]
+    assert ocb.batches == [[(obj, 2)]]
+
+    event.remove_callback(bcb.on_cb, 'test')
+    event.remove_callback(ocb.on_cb, 'test', obj)
+    obj.destroy()
+    other.destroy()
+    assert not event.EVENT_MANAGER.batch_callbacks
+
+    _finish_events()
+
+
+def test_event_profile():
+    _init_events()
+    profile = event.EVENT_MANAGER.profile = event.EventProfile()
+    ncb = NormalCallback()
+
+    on_ui_thread[0] = True
+    event.log_event('test', ncb, None)
+    event.log_event('test', ncb, None)
+    assert ncb.called is True
+
+    [(key, stats)] = profile.stats.items()
+    evty, name, _ui = key
+    calls, total, longest = stats
+    assert evty == 'test'
+    assert name.endswith('NormalCallback.on_cb')
+    assert calls == 2
+    assert total >= longest >= 0
+    assert 'NormalCallback.on_cb' in profile.get_report()
+
+    ncb.destroy()
+    _finish_events()
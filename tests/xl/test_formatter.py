@@ -0,0 +1,47 @@
+from xl import formatter, providers
+from xl.trax import Track
+
+
+class TestFormatter:
+    def test_substitutions(self):
+        f = formatter.Formatter(
+            '$a ${b:prefix=<, suffix=>} ${c:pad=3, padstring=0} $$ $d'
+        )
+        f._substitutions = {'a': 'A', 'b': 'B', 'c': lambda: '7'}
+        assert f.format() == 'A <B> 007 $ $d'
+
+    def test_extract(self):
+        f = formatter.Formatter('$a ${b:x=1\\,2, y}')
+        assert f.extract() == {
+            'a': ('a', {}),
+            'b:x=1\\,2, y': ('b', {'x': '1,2', 'y': True}),
+        }
+
+
+class TestTrackFormatter:
+    def setup_method(self):
+        self.track = Track('file:///tmp/formatter-test.mp3', scan=False)
+        self.track.set_tags(
+            artist='Artist', title='Title', tracknumber='3/12', notify_changed=False
+        )
+
+    def test_format_many(self):
+        f = formatter.TrackFormatter('${tracknumber:pad=2, padstring=0} - $title')
+        assert f.format(self.track) == '03 - Title'
+        assert f.format_many([self.track, self.track]) == ['03 - Title'] * 2
+
+    def test_provider_changes(self):
+        class TitleFormatter(formatter.TagFormatter):
+            def format(self, track, parameters):
+                return 'Formatted'
+
+        f = formatter.TrackFormatter('$title')
+        assert f.format(self.track) == 'Title'
+
+        provider = TitleFormatter('title')
+        providers.register('tag-formatting', provider)
+        try:
+            assert f.format(self.track) == 'Formatted'
+        finally:
+            providers.unregister('tag-formatting', provider)
+        assert f.format(self.track) == 'Title'
@@ -0,0 +1,95 @@
+import os
+
+from xl import lyrics
+
+
+class TestLyricsCache:
+    def setup_method(self):
+        self.flushes = []
+
+    def get_cache(self, tmp_path, monkeypatch, max_entries=3):
+        monkeypatch.setattr(
+            lyrics.GLib,
+            'timeout_add_seconds',
+            lambda delay, fn: self.flushes.append(fn) or 1,
+        )
+        return lyrics.LyricsCache(
+            os.path.join(str(tmp_path), 'lyrics.cache'), max_entries=max_entries
+        )
+
+    def test_batched_writes(self, tmp_path, monkeypatch):
+        cache = self.get_cache(tmp_path, monkeypatch)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert len(self.flushes) == 1
+        assert cache['a'] == 1
+        assert 'a' not in cache.db
+
+        self.flushes.pop()()
+        assert cache.db['a'].value == 1
+        assert cache.db['b'].value == 2
+
+        del cache['a']
+        assert 'a' not in cache
+        assert cache['a'] is None
+        cache.on_quit_application()
+
+        cache = self.get_cache(tmp_path, monkeypatch)
+        assert cache.keys() == ['b']
+        assert cache['b'] == 2
+
+    def test_lru_eviction(self, tmp_path, monkeypatch):
+        cache = self.get_cache(tmp_path, monkeypatch)
+        for key in 'abc':
+            cache[key] = key
+        cache.flush()
+
+        # a was used last, so b is the oldest
+        assert cache['a'] == 'a'
+        cache['d'] = 'd'
+        cache.flush()
+
+        assert sorted(cache.keys()) == ['a', 'c', 'd']
+        assert sorted(cache.db.keys()) == ['a', 'c', 'd']
+        assert cache['b'] is None
+
+    def test_reads_are_bounded(self, tmp_path, monkeypatch):
+        cache = self.get_cache(tmp_path, monkeypatch)
+        cache['a'] = 'a'
+        for _i in range(10):
+            assert cache['a'] == 'a'
+        assert len(cache.used) == 3
+
+    def test_order_is_kept_on_disk(self, tmp_path, monkeypatch):
+        clock = iter(range(100))
+        monkeypatch.setattr(lyrics.time, 'time', lambda: next(clock))
+        cache = self.get_cache(tmp_path, monkeypatch)
+        for key in 'abc':
+            cache[key] = key
+            cache.flush()
+
+        # a was used last, so b is the oldest in the next session
+        assert cache['a'] == 'a'
+        cache.on_quit_application()
+
+        cache = self.get_cache(tmp_path, monkeypatch)
+        cache['d'] = 'd'
+        cache.flush()
+        assert sorted(cache.keys()) == ['a', 'c', 'd']
+        assert cache['b'] is None
+
+    def test_entries_of_older_versions(self, tmp_path, monkeypatch):
+        cache = self.get_cache(tmp_path, monkeypatch)
+        cache.db['a'] = 'a'
+        cache.on_quit_application()
+
+        cache = self.get_cache(tmp_path, monkeypatch)
+        assert cache['a'] == 'a'
+        cache.on_quit_application()
+
+        # entries without a last use time are dropped first
+        cache = self.get_cache(tmp_path, monkeypatch, max_entries=1)
+        cache.db['a'] = 'a'
+        cache['b'] = 'b'
+        cache.flush()
+        assert cache.keys() == ['b']
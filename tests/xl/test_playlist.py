@@ -0,0 +1,137 @@
+import pytest
+
+from xl.playlist import BINARY_PLAYLIST_MAGIC, Playlist
+from xl.trax.track import Track
+
+
+def make_tracks():
+    tracks = []
+    for i in range(3):
+        track = Track('http://example.com/%d.mp3' % i, scan=False)
+        track.set_tags(artist='artist %d' % i, title='title %d' % i)
+        tracks.append(track)
+    return tracks
+
+
+class TestPlaylistSaveLoad:
+    def setup_method(self):
+        self.tracks = make_tracks()
+        self.playlist = Playlist('test', self.tracks + self.tracks[:1])
+        self.playlist.repeat_mode = 'all'
+
+    def test_binary_format(self, tmp_path):
+        location = str(tmp_path / 'playlist')
+        self.playlist.save_to_location(location)
+        with open(location, 'rb') as f:
+            assert f.read(len(BINARY_PLAYLIST_MAGIC)) == BINARY_PLAYLIST_MAGIC
+
+    def test_known_tracks_are_reused(self, tmp_path):
+        location = str(tmp_path / 'playlist')
+        self.playlist.save_to_location(location)
+
+        loaded = Playlist('loaded')
+        loaded.load_from_location(location)
+        assert list(loaded) == list(self.playlist)
+        assert loaded[0] is self.tracks[0]
+        assert loaded[3] is self.tracks[0]
+        assert loaded.repeat_mode == 'all'
+
+    def test_unknown_tracks_keep_tags(self, tmp_path):
+        location = str(tmp_path / 'playlist')
+        self.playlist.save_to_location(location)
+        Track._Track__tracksdict.clear()
+
+        loaded = Playlist('loaded')
+        loaded.load_from_location(location)
+        assert [t.get_loc_for_io() for t in loaded] == [
+            t.get_loc_for_io() for t in self.playlist
+        ]
+        assert loaded[1].get_tag_raw('title') == ['title 1']
+        assert loaded[0] is loaded[3]
+
+    def test_text_format(self, tmp_path):
+        location = str(tmp_path / 'playlist')
+        with open(location, 'w') as f:
+            f.write('http://example.com/a.mp3\tartist=foo&title=bar\n')
+            f.write('http://example.com/b.mp3\ttitle=baz\n')
+            f.write('EOF\n')
+            f.write('repeat_mode=S: playlist\n')
+
+        loaded = Playlist('loaded')
+        loaded.load_from_location(location)
+        assert len(loaded) == 2
+        assert loaded[0].get_tag_raw('artist') == ['foo']
+        assert loaded[1].get_tag_raw('title') == ['baz']
+        assert loaded.repeat_mode == 'all'
+
+
+class TestPlaylistLookups:
+    def setup_method(self):
+        self.tracks = make_tracks()
+        self.playlist = Playlist('test', self.tracks + self.tracks[:1])
+
+    def test_index(self):
+        assert self.playlist.index(self.tracks[0]) == 0
+        assert self.playlist.index(self.tracks[0], 1) == 3
+        assert self.playlist.index(self.tracks[2], 1, 3) == 2
+        with pytest.raises(ValueError):
+            self.playlist.index(self.tracks[2], 0, 2)
+
+    def test_contains_after_changes(self):
+        new = Track('http://example.com/new.mp3', scan=False)
+        assert new not in self.playlist
+        self.playlist.append(new)
+        assert new in self.playlist
+        assert self.playlist.index(new) == 4
+        del self.playlist[0]
+        assert self.playlist.index(new) == 3
+        assert self.playlist.count(self.tracks[0]) == 1
+        assert None not in self.playlist
+
+    def test_lookups_follow_changes(self):
+        new = [Track('http://example.com/new%d.mp3' % i, scan=False) for i in range(3)]
+        for i, track in enumerate(self.tracks + new):
+            track.set_tags(album='album %d' % (i % 2))
+        playlist = self.playlist
+        assert playlist.index(self.tracks[1]) == 1  # builds the tables
+        playlist._Playlist__get_album_positions()
+
+        playlist[1:1] = new[:2]
+        del playlist[::2]
+        playlist[0:1] = [new[2]]
+        playlist[1:3] = [self.tracks[2]]
+        del playlist[len(playlist) - 1]
+        playlist[0:0] = [self.tracks[1]]
+
+        tracks = list(playlist)
+        for i, track in enumerate(tracks):
+            assert playlist.index(track) == tracks.index(track)
+            assert playlist.count(track) == tracks.count(track)
+        albums = {}
+        for i, track in enumerate(tracks):
+            albums.setdefault(tuple(track.get_tag_raw('album')), []).append(i)
+        assert playlist._Playlist__get_album_positions() == albums
+
+    def test_shuffle_plays_every_track_once(self):
+        self.playlist.shuffle_mode = 'track'
+        played = []
+        track = self.playlist.next()
+        while track is not None:
+            played.append(self.playlist.current_position)
+            track = self.playlist.next()
+        assert sorted(played) == [0, 1, 2, 3]
+
+    def test_album_shuffle_plays_album_in_order(self):
+        self.tracks.append(Track('http://example.com/3.mp3', scan=False))
+        for track, (album, number) in zip(
+            self.tracks, [('b', '1'), ('a', '1'), ('b', '2'), ('a', '2')]
+        ):
+            track.set_tags(album=album, tracknumber=number)
+        self.playlist = Playlist('test', self.tracks)
+
+        self.playlist.shuffle_mode = 'album'
+        self.playlist.next()
+        first = self.playlist.current.get_tag_raw('album')
+        second = self.playlist.next()
+        assert second.get_tag_raw('album') == first
+        assert second.get_tag_raw('tracknumber') == ['2']
@@ -0,0 +1,131 @@
+import os
+
+from xl import transcoder
+
+
+class StubTranscoder:
+    """
+    Stands in for Transcoder, finishing only when told to
+    """
+
+    instances = []
+
+    def __init__(self, destformat, quality, error_callback, end_callback):
+        self.error_cb = error_callback
+        self.end_cb = end_callback
+        self.output = None
+        self.running = False
+        self.instances.append(self)
+
+    def set_input(self, uri):
+        pass
+
+    def set_raw_input(self, raw):
+        pass
+
+    def set_output(self, uri):
+        self.output = uri
+
+    def start_transcode(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        self.end_cb()
+
+    def finish(self):
+        with open(self.output, 'w') as f:
+            f.write('transcoded')
+        self.stop()
+
+    def get_time(self):
+        return 0.0
+
+
+class TestTranscodeQueue:
+    def setup_method(self):
+        StubTranscoder.instances = []
+        self.ended = []
+        self.timeouts = []
+
+    def get_queue(self, tmp_path, monkeypatch, **kwargs):
+        monkeypatch.setattr(transcoder, 'Transcoder', StubTranscoder)
+        monkeypatch.setattr(
+            transcoder.GLib,
+            'timeout_add_seconds',
+            lambda delay, fn: self.timeouts.append(fn) or 1,
+        )
+        monkeypatch.setattr(transcoder.GLib, 'source_remove', lambda id: None)
+        return transcoder.TranscodeQueue(
+            'Ogg Vorbis',
+            0.5,
+            end_callback=self.ended.append,
+            manifest=os.path.join(str(tmp_path), 'manifest.json'),
+            **kwargs
+        )
+
+    def add_jobs(self, queue, tmp_path, count):
+        jobs = []
+        for i in range(count):
+            source = os.path.join(str(tmp_path), '%d.flac' % i)
+            if not os.path.exists(source):
+                with open(source, 'w') as f:
+                    f.write('source %d' % i)
+            output = os.path.join(str(tmp_path), 'out', '%d.ogg' % i)
+            jobs.append(queue.add(source, output, length=10))
+        return jobs
+
+    def test_max_jobs(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch, max_jobs=2)
+        jobs = self.add_jobs(queue, tmp_path, 3)
+        queue.start()
+        assert [job.state for job in jobs] == ['running', 'running', 'pending']
+
+        jobs[0].transcoder.finish()
+        assert [job.state for job in jobs] == ['done', 'running', 'running']
+        # the idle transcoder is reused
+        assert len(StubTranscoder.instances) == 2
+
+        jobs[1].transcoder.finish()
+        jobs[2].transcoder.finish()
+        assert self.ended == [queue]
+        assert queue.get_progress() == 1.0
+
+    def test_skip_finished_jobs(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch, max_jobs=2)
+        jobs = self.add_jobs(queue, tmp_path, 2)
+        queue.start()
+        jobs[0].transcoder.finish()
+
+        # the manifest is saved before the queue ends
+        assert len(self.timeouts) == 1
+        self.timeouts.pop()()
+        queue = self.get_queue(tmp_path, monkeypatch)
+        jobs = self.add_jobs(queue, tmp_path, 2)
+        assert [job.state for job in jobs] == ['skipped', 'pending']
+
+    def test_all_jobs_skipped(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch)
+        jobs = self.add_jobs(queue, tmp_path, 2)
+        queue.start()
+        for job in jobs:
+            job.transcoder.finish()
+        assert self.ended == [queue]
+
+        queue = self.get_queue(tmp_path, monkeypatch)
+        jobs = self.add_jobs(queue, tmp_path, 2)
+        assert [job.state for job in jobs] == ['skipped', 'skipped']
+        queue.start()
+        assert not queue.is_running()
+        assert self.ended[1:] == [queue]
+        assert queue.get_progress() == 1.0
+
+    def test_cancel(self, tmp_path, monkeypatch):
+        queue = self.get_queue(tmp_path, monkeypatch, max_jobs=1)
+        jobs = self.add_jobs(queue, tmp_path, 2)
+        queue.start()
+        queue.cancel()
+        assert [job.state for job in jobs] == ['cancelled', 'cancelled']
+        assert not os.path.exists(jobs[0].output)
+        assert not queue.is_running()
+        assert self.ended == [queue]
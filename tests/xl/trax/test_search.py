@@ -4,6 +4,7 @@ from unittest.mock import call, patch
 
 from xl.trax import search
 from xl.trax import track
+from xl.trax import trackdb
 import pytest
 
 
@@ -421,3 +422,98 @@ class TestSearchTracks:
         assert next(gen).track == tracks[2]
         with pytest.raises(StopIteration):
             next(gen)
+
+
+class TestTrackSearchIndex:
+    def setup_method(self):
+        self.db = trackdb.TrackDB()
+        self.tracks = [track.Track(x) for x in ('foo', 'bar', 'baz', 'quux')]
+        for tr, artist in zip(self.tracks, ('Foo', 'Bar', 'foobar', None)):
+            tr.set_tag_raw('artist', artist)
+        for tr, count in zip(self.tracks, (1, 5, 10, 20)):
+            tr.set_tag_raw('__playcount', count)
+        self.db.add_tracks(self.tracks)
+        self.index = search.TrackSearchIndex(self.db)
+
+    def teardown_method(self):
+        self.index.close()
+
+    def search(self, search_string, trackiter=None, **kwargs):
+        if trackiter is None:
+            trackiter = self.tracks
+        return [
+            r.track
+            for r in search.search_tracks_from_string(
+                trackiter, search_string, index=self.index, **kwargs
+            )
+        ]
+
+    @pytest.mark.parametrize(
+        "sstr",
+        [
+            'artist==Foo',
+            'artist==__null__',
+            'artist=foo',
+            '__playcount>4',
+            '__playcount<6',
+            '! artist=oo',
+            'artist==Foo | artist==Bar',
+            'artist~^F',
+            'foo',
+        ],
+    )
+    def test_same_as_scan(self, sstr):
+        kwargs = dict(case_sensitive=False, keyword_tags=['artist'])
+        expected = [
+            r.track
+            for r in search.search_tracks_from_string(self.tracks, sstr, **kwargs)
+        ]
+        assert self.search(sstr, **kwargs) == expected
+
+    def test_candidates(self):
+        matcher = search.TracksMatcher('artist==Foo')
+        assert self.index.get_candidates([matcher]) == {self.tracks[0]}
+
+        # regular expressions are not indexed
+        matcher = search.TracksMatcher('artist~Foo')
+        assert self.index.get_candidates([matcher]) is None
+
+    def test_tags_changed(self):
+        assert self.search('artist==Foo') == [self.tracks[0]]
+        self.tracks[0].set_tag_raw('artist', 'Baz')
+        self.tracks[3].set_tag_raw('artist', 'Foo')
+        assert self.search('artist==Foo') == [self.tracks[3]]
+
+    def test_tracks_added_removed(self):
+        self.db.remove(self.tracks[0])
+        assert self.search('artist=Foo', self.db, case_sensitive=False) == [
+            self.tracks[2]
+        ]
+
+        new = track.Track('new')
+        new.set_tag_raw('artist', 'Foo')
+        self.db.add(new)
+        assert self.search('artist==Foo', self.db) == [new]
+
+    def test_trackdb_order(self):
+        assert self.search('__playcount>1', self.db) == self.tracks[1:]
+        assert self.search('! artist==Foo', self.db) == self.tracks[1:]
+
+    def test_tracks_are_indexed_when_used(self, monkeypatch):
+        self.index.close()
+        monkeypatch.setattr(
+            trackdb.TrackDB, '__iter__', lambda db: pytest.fail("tracks were read")
+        )
+        self.index = search.TrackSearchIndex(self.db)
+        assert self.tracks[0] not in self.index
+        monkeypatch.undo()
+        assert self.search('artist==Foo') == [self.tracks[0]]
+        assert self.tracks[0] in self.index
+
+    def test_unindexed_tracks_are_scanned(self):
+        other = track.Track('other')
+        other.set_tag_raw('artist', 'Foo')
+        assert self.search('artist==Foo', self.tracks + [other]) == [
+            self.tracks[0],
+            other,
+        ]
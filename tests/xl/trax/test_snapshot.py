@@ -0,0 +1,86 @@
+from xl.trax.snapshot import Snapshot, write_snapshot
+from xl.trax.track import Track
+from xl.trax.trackdb import SnapshotTrackHolder, TrackDB
+
+ROWS = [
+    (
+        {
+            '__loc': 'file:///tmp/snapshot/1.mp3',
+            'title': ['one', 'uno'],
+            '__playcount': 3,
+            '__length': 123.5,
+        },
+        0,
+        {},
+    ),
+    (
+        {
+            '__loc': 'file:///tmp/snapshot/2.mp3',
+            'title': ['two'],
+            'artist': None,
+            '__compilation': ('dir', 'album'),
+        },
+        1,
+        {'some': 'attr'},
+    ),
+]
+
+
+def test_roundtrip(tmpdir):
+    location = str(tmpdir.join('test.snapshot'))
+    write_snapshot(location, 42, ROWS)
+
+    snapshot = Snapshot(location)
+    assert snapshot.serial == 42
+    assert len(snapshot) == 2
+    for row, data in enumerate(ROWS):
+        assert snapshot.get_key(row) == data[1]
+        assert snapshot.get_loc(row) == data[0]['__loc']
+        assert snapshot.get_data(row) == data
+    snapshot.close()
+
+
+def test_trackdb_loads_lazily(tmpdir):
+    location = str(tmpdir.join('music.db'))
+    db = TrackDB('test', location, pickle_attrs=[], snapshot=True)
+    tracks = [Track('/tmp/snapshot/%d.mp3' % i, scan=False) for i in range(3)]
+    for tr in tracks:
+        tr.set_tags(notify_changed=False, title='title')
+    db.add_tracks(tracks)
+    db.save_to_location()
+    locs = [tr.get_loc_for_io() for tr in tracks]
+    db.close()
+
+    del db, tracks, tr
+    Track._Track__tracksdict.clear()
+
+    db = TrackDB('test', location, pickle_attrs=[], snapshot=True)
+    assert all(isinstance(h, SnapshotTrackHolder) for h in db.tracks.values())
+    assert Track._get_track_count() == 0
+
+    # creating the track elsewhere must return the one held by the db
+    tr = Track(locs[1])
+    assert tr.get_tag_raw('title') == ['title']
+    assert db.get_track_by_loc(locs[1]) is tr
+    assert Track._get_track_count() == 1
+    db.close()
+
+
+def test_trackdb_answers_for_own_tracks(tmpdir):
+    location = str(tmpdir.join('music.db'))
+    db = TrackDB('test', location, pickle_attrs=[], snapshot=True)
+    tr = Track('/tmp/snapshot/1.mp3', scan=False)
+    tr.set_tags(notify_changed=False, title='title')
+    db.add_tracks([tr])
+    db.save_to_location()
+    loc = tr.get_loc_for_io()
+    del tr
+    Track._Track__tracksdict.clear()
+
+    # the first db is still open, but only holds a Track that was
+    # created before the snapshot was written
+    db2 = TrackDB('test', location, pickle_attrs=[], snapshot=True)
+    tr = Track(loc)
+    assert db2.get_track_by_loc(loc) is tr
+    db.close()
+    db2.close()
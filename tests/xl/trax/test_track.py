@@ -82,7 +82,15 @@ def random_str(l=8):
 
 class TestTrack:
     def verify_tags_exist(self, tr, test_track, deleted=None):
-        internal_tags = {'__length', '__modified', '__basedir', '__basename', '__loc'}
+        internal_tags = {
+            '__length',
+            '__modified',
+            '__basedir',
+            '__basename',
+            '__loc',
+            '__filesize',
+            '__inode',
+        }
         if test_track.ext not in ['aac', 'spx']:
             internal_tags.add('__bitrate')
 
@@ -474,6 +482,21 @@ class TestTrack:
         tr.set_tag_raw('coverart', val)
         assert tr.get_tag_sort('coverart') == ret
 
+    def test_get_sort_tag_cache_invalidated(self):
+        tr = track.Track('/foo')
+        tr.set_tag_raw('artist', 'foo')
+        assert tr.get_tag_sort('albumartist') == 'foo foo foo foo'
+        tr.set_tag_raw('artist', 'bar')
+        assert tr.get_tag_sort('albumartist') == 'bar bar bar bar'
+
+    def test_get_sort_tag_cache_the_cuts(self):
+        tr = track.Track('/foo')
+        tr.set_tag_raw('artist', 'The Foo')
+        assert tr.get_tag_sort('artist') == 'foo the foo The Foo The Foo'
+        with patch.object(settings, 'get_option', return_value=[]):
+            track.Track._the_cuts_cb(None, None, 'collection/strip_list')
+        assert tr.get_tag_sort('artist') == 'the foo the foo The Foo The Foo'
+
     ## Display Tags
     def test_get_display_tag_loc(self):
         import sys
@@ -0,0 +1,85 @@
+import os
+
+from xl.trax.journal import TrackDBJournal
+from xl.trax.track import Track
+from xl.trax.trackdb import TrackDB
+
+
+def _make_tracks(count):
+    tracks = []
+    for i in range(count):
+        tr = Track('/tmp/trackdb/%d.mp3' % i, scan=False)
+        tr.set_tags(notify_changed=False, title='title %d' % i)
+        tracks.append(tr)
+    return tracks
+
+
+def _reload(location):
+    Track._Track__tracksdict.clear()
+    return TrackDB('test', location, pickle_attrs=[], journal=True)
+
+
+class TestJournal:
+    def test_save_appends_to_journal(self, tmpdir):
+        location = str(tmpdir.join('music.db'))
+        db = TrackDB('test', location, pickle_attrs=[], journal=True)
+        tracks = _make_tracks(3)
+        db.add_tracks(tracks)
+        db.save_to_location()
+
+        assert os.path.exists(location + '.journal')
+        size = os.path.getsize(location + '.journal')
+
+        tracks[1].set_tags(artist='artist')
+        db.save_to_location()
+        assert os.path.getsize(location + '.journal') > size
+
+    def test_replay(self, tmpdir):
+        location = str(tmpdir.join('music.db'))
+        db = TrackDB('test', location, pickle_attrs=[], journal=True)
+        tracks = _make_tracks(4)
+        db.add_tracks(tracks)
+        db.save_to_location()
+
+        tracks[0].set_tags(artist='artist')
+        tracks[1].set_tags(title=None)
+        db.remove(tracks[2])
+        db.save_to_location()
+
+        db = _reload(location)
+        by_loc = {tr.get_loc_for_io(): tr for tr in db}
+        assert len(by_loc) == 3
+        assert by_loc[tracks[0].get_loc_for_io()].get_tag_raw('artist') == ['artist']
+        assert by_loc[tracks[1].get_loc_for_io()].get_tag_raw('title') is None
+        assert tracks[2].get_loc_for_io() not in by_loc
+        assert db._key == 4
+
+    def test_merge(self, tmpdir):
+        location = str(tmpdir.join('music.db'))
+        db = TrackDB('test', location, pickle_attrs=[], journal=True)
+        tracks = _make_tracks(2)
+        db.add_tracks(tracks)
+        db.save_to_location()
+        db.remove(tracks[0])
+        db.save_to_location()
+
+        db = _reload(location)
+        db._merge_journal()
+        assert not os.path.exists(location + '.journal')
+
+        db = _reload(location)
+        assert [tr.get_tag_raw('title') for tr in db] == [['title 1']]
+
+    def test_truncated_record(self, tmpdir):
+        location = str(tmpdir.join('test.journal'))
+        journal = TrackDBJournal(location)
+        journal.append([('del', 1)])
+        with open(location, 'ab') as fp:
+            fp.write(b'\x80\x02garbage')
+
+        journal = TrackDBJournal(location)
+        assert journal.replay().deleted == {1}
+
+        # new records must stay readable after the damaged one
+        journal.append([('del', 2)])
+        assert TrackDBJournal(location).replay().deleted == {1, 2}
@@ -55,6 +55,14 @@ class TestSortTracks:
     def test_sorted(self):
         assert xl.trax.util.sort_tracks(self.fields, self.tracks) == self.result
 
+    def test_get_sort_keys(self):
+        keys = xl.trax.util.get_sort_keys(self.fields, self.tracks)
+        assert len(keys) == len(self.tracks)
+        assert keys[0] == (
+            self.tracks[0].get_tag_sort('artist'),
+            self.tracks[0].get_tag_sort('discnumber'),
+        )
+
     def test_reversed(self):
         assert xl.trax.util.sort_tracks(self.fields, self.tracks, reverse=True) == list(
             reversed(self.result)
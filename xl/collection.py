@@ -35,9 +35,21 @@ collection.
 """
 
 from collections import deque
+import concurrent.futures
 import logging
 import threading
-from typing import Deque, Dict, Iterable, List, MutableSequence, Optional, Set, Tuple
+import time
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from gi.repository import (
     GLib,
@@ -130,7 +142,9 @@ class Collection(trax.TrackDB):
     5
     """
 
-    def __init__(self, name, location=None, pickle_attrs=[]):
+    def __init__(
+        self, name, location=None, pickle_attrs=[], journal=False, snapshot=False
+    ):
         global COLLECTIONS
         self.libraries: Dict[str, Library] = {}
         self._scanning = False
@@ -139,10 +153,28 @@ class Collection(trax.TrackDB):
         self._running_total_count = 0
         self._frozen = False
         self._libraries_dirty = False
+        self._search_index: Optional[trax.TrackSearchIndex] = None
         pickle_attrs += ['_serial_libraries']
-        trax.TrackDB.__init__(self, name, location=location, pickle_attrs=pickle_attrs)
+        trax.TrackDB.__init__(
+            self,
+            name,
+            location=location,
+            pickle_attrs=pickle_attrs,
+            journal=journal,
+            snapshot=snapshot,
+        )
         COLLECTIONS.add(self)
 
+    def get_search_index(self) -> trax.TrackSearchIndex:
+        """
+        Gets an index of the tracks in this collection which can be
+        passed to :func:`xl.trax.search_tracks`. It is created the first
+        time this is called and kept up to date afterwards.
+        """
+        if self._search_index is None:
+            self._search_index = trax.TrackSearchIndex(self)
+        return self._search_index
+
     def freeze_libraries(self) -> None:
         """
         Prevents "libraries_modified" events from being sent from individual
@@ -347,8 +379,11 @@ class Collection(trax.TrackDB):
         close the collection. does any work like saving to disk,
         closing network connections, etc.
         """
-        # TODO: make close() part of trackdb
         COLLECTIONS.remove(self)
+        if self._search_index is not None:
+            self._search_index.close()
+            self._search_index = None
+        trax.TrackDB.close(self)
 
     def delete_tracks(self, tracks: Iterable[trax.Track]) -> None:
         for tr in tracks:
@@ -739,6 +774,247 @@ class Library:
                 self.collection.add(tr)
         return tr
 
+    @staticmethod
+    def _is_unchanged(tr: trax.Track, info: Gio.FileInfo) -> bool:
+        """
+        Whether a file is still the same as when the tags of its track
+        were last read, according to its modification time, size and inode
+
+        :param tr: the track of the file
+        :param info: file info queried with
+            :data:`xl.trax.track.FILE_INFO_ATTRIBUTES`
+        """
+        modified = tr.get_tag_raw('__modified')
+        try:
+            current = trax.track.get_file_info_tags(info)
+        except (AttributeError, TypeError, GLib.Error):
+            # e.g. some GVFS backends don't provide the modification time
+            return False
+        if not modified or modified < current['__modified']:
+            return False
+        # tracks read by older versions only have their mtime stored
+        for tag in ('__filesize', '__inode'):
+            value = tr.get_tag_raw(tag)
+            if value is not None and value != current[tag]:
+                return False
+        return True
+
+    def __submit_read(
+        self,
+        executor: concurrent.futures.Executor,
+        gloc: Gio.File,
+        info: Gio.FileInfo,
+        force_update: bool,
+    ) -> Optional[
+        Tuple[str, Optional[trax.Track], Optional[concurrent.futures.Future]]
+    ]:
+        """
+        Starts reading the tags of a file in the background unless it
+        didn't change, see :meth:`update_track`
+        """
+        uri = gloc.get_uri()
+        if not uri:  # we get segfaults if this check is removed
+            return None
+
+        tr = self.collection.get_track_by_loc(uri)
+        if tr is not None and not force_update and self._is_unchanged(tr, info):
+            return uri, tr, None
+        future = executor.submit(trax.Track._read_file_tags, uri)
+        return uri, tr, future
+
+    def __finish_read(
+        self,
+        job: Tuple[str, Optional[trax.Track], Optional[concurrent.futures.Future]],
+    ) -> trax.Track:
+        """
+        Updates the collection with the tags read by :meth:`__submit_read`.
+        Must be called from the thread doing the scan.
+        """
+        uri, tr, future = job
+        if future is None:
+            return tr
+        try:
+            f, ntags = future.result()
+        except Exception:
+            logger.exception("Error reading tags for %s", uri)
+            f = ntags = None
+
+        if tr is not None:
+            tr._set_file_tags(f, ntags)
+            return tr
+
+        tr = trax.Track(uri, scan=False)
+        if tr._init:
+            # notify isn't needed here because this is a new track
+            tr._set_file_tags(f, ntags, notify_changed=False)
+            if tr._scan_valid:
+                self.collection.add(tr)
+        else:
+            # Track already existed, see update_track
+            self.collection.add(tr)
+        return tr
+
+    def _scan_files(
+        self,
+        libloc: Gio.File,
+        force_update: bool = False,
+        errors: Optional[List[Gio.File]] = None,
+        links: Optional[List[Gio.File]] = None,
+    ) -> Iterator[Tuple[Gio.File, Gio.FileType, Optional[trax.Track]]]:
+        """
+        Walks the library and updates the tracks found in it
+
+        The modification time, size and inode of each file come with the
+        directory listing, so files that didn't change since their tags
+        were last read are skipped without being opened. The remaining
+        tags are read by a pool of worker threads while the walk goes on,
+        but the collection is only modified from the calling thread.
+
+        The listings of the walked directories are also handed to the
+        local file cover search, so that it doesn't have to list them again.
+
+        :param libloc: the directory to walk
+        :param force_update: Update files regardless whether they've changed
+        :param errors: if given, directories that could not be listed
+            completely are appended to it
+        :param links: if given, symlinks that were not followed because
+            they point within the library are appended to it
+
+        :returns: an iterator of (file, file type, track) in the order the
+            files were walked. track is None unless the file is a regular
+            file that could be updated.
+        """
+        if errors is None:
+            errors = []
+        if links is None:
+            links = []
+        cover_fetcher = self.__get_cover_fetcher()
+        # (directory, fileinfo, names of its files, number of links before
+        # it) of the directory whose files are being walked
+        listing = None
+        workers = max(1, settings.get_option('collection/scan_workers', 4))
+        # enough to keep the workers busy while a directory full of
+        # unchanged tracks is walked, without holding the whole library
+        max_pending = workers * 16
+        pending = deque()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        def is_ready(item):
+            job = item[2]
+            return job is None or job[2] is None or job[2].done()
+
+        def finish(item):
+            fil, type, job = item
+            if job is None:
+                return fil, type, None
+            return fil, type, self.__finish_read(job)
+
+        try:
+            for fil, info in common.walk_with_info(
+                libloc, trax.track.FILE_INFO_ATTRIBUTES, errors, links
+            ):
+                if info is None:  # the library itself
+                    type = Gio.FileType.DIRECTORY
+                else:
+                    type = info.get_file_type()
+
+                if cover_fetcher is not None:
+                    if type == Gio.FileType.DIRECTORY:
+                        self.__add_cover_listing(cover_fetcher, listing, errors, links)
+                        if info is not None:
+                            listing = (fil, info, [], len(links))
+                        else:
+                            listing = None
+                    elif type == Gio.FileType.REGULAR and listing is not None:
+                        listing[2].append(info.get_name())
+
+                job = None
+                if type == Gio.FileType.REGULAR:
+                    job = self.__submit_read(executor, fil, info, force_update)
+                pending.append((fil, type, job))
+
+                while len(pending) > max_pending or (pending and is_ready(pending[0])):
+                    yield finish(pending.popleft())
+
+            if cover_fetcher is not None:
+                self.__add_cover_listing(cover_fetcher, listing, errors, links)
+
+            while pending:
+                yield finish(pending.popleft())
+        finally:
+            for _fil, _type, job in pending:
+                if job is not None and job[2] is not None:
+                    job[2].cancel()
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def __get_cover_fetcher():
+        """
+        Returns the local file cover search if it should get the listings
+        of the scanned directories, else None
+        """
+        if not settings.get_option('covers/use_localfile', True):
+            return None
+        if not settings.get_option('collection/cache_cover_listings', True):
+            return None
+        from xl import covers
+
+        return covers.MANAGER.localfile_fetcher
+
+    @staticmethod
+    def __add_cover_listing(
+        cover_fetcher, listing, errors: List[Gio.File], links: List[Gio.File]
+    ) -> None:
+        if listing is None:
+            return
+        directory, info, names, link_count = listing
+        # The listing is incomplete if the directory couldn't be listed,
+        # or if the walk left out links to files within the library
+        if directory in errors or len(links) > link_count:
+            return
+        cover_fetcher.add_directory(
+            directory, common.get_modification_time(info), names
+        )
+
+    def _get_removed_tracks(
+        self,
+        libloc: Gio.File,
+        seen: Set[str],
+        errors: Iterable[Gio.File] = (),
+        links: Iterable[Gio.File] = (),
+    ) -> List[trax.Track]:
+        """
+        Finds the tracks of this library that a scan didn't come across
+
+        This only compares locations, so no file is accessed.
+
+        :param libloc: the directory that was scanned
+        :param seen: the uris of all files found by the scan
+        :param errors: directories that could not be listed by the scan.
+            Tracks within them are assumed to still exist.
+        :param links: symlinks the scan didn't follow because they point
+            within the library. Tracks at or below them are assumed to
+            still exist.
+        """
+        links = [gloc.get_uri() for gloc in links]
+        seen = seen.union(links)
+        prefixes = []
+        for uri in [libloc.get_uri()] + [gloc.get_uri() for gloc in errors] + links:
+            if not uri.endswith('/'):
+                uri += '/'
+            prefixes.append(uri)
+        libprefix = prefixes.pop(0)
+        skipped = tuple(prefixes)
+
+        return [
+            holder._track
+            for loc, holder in self.collection.tracks.items()
+            if loc
+            and loc.startswith(libprefix)
+            and loc not in seen
+            and not (skipped and loc.startswith(skipped))
+        ]
+
     def rescan(
         self, notify_interval: Optional[int] = None, force_update: bool = False
     ) -> bool:
@@ -765,11 +1041,12 @@ class Library:
         dirtracks = deque()
         compilations = deque()
         ccheck = {}
-        for fil in common.walk(libloc):
+        seen = set()
+        errors = []
+        links = []
+        scan = self._scan_files(libloc, force_update, errors, links)
+        for fil, type, tr in scan:
             count += 1
-            type = fil.query_info(
-                "standard::type", Gio.FileQueryInfoFlags.NONE, None
-            ).get_file_type()
             if type == Gio.FileType.DIRECTORY:
                 if dirtracks:
                     for tr in dirtracks:
@@ -790,7 +1067,7 @@ class Library:
                 compilations = deque()
                 ccheck = {}
             elif type == Gio.FileType.REGULAR:
-                tr = self.update_track(fil, force_update=force_update)
+                seen.add(fil.get_uri())
                 if not tr:
                     continue
 
@@ -812,6 +1089,7 @@ class Library:
                         dirtracks = None
 
             if self.collection and self.collection._scan_stopped:
+                scan.close()
                 self.scanning = False
                 logger.info("Scan canceled")
                 return False
@@ -824,26 +1102,11 @@ class Library:
         if notify_interval is not None:
             event.log_event('tracks_scanned', self, count)
 
-        removals = deque()
-        for tr in self.collection.tracks.values():
-            tr = tr._track
-            loc = tr.get_loc_for_io()
-            if not loc:
-                continue
-            gloc = Gio.File.new_for_uri(loc)
-            try:
-                if not gloc.has_prefix(libloc):
-                    continue
-            except UnicodeDecodeError:
-                logger.exception("Error decoding file location")
-                continue
-
-            if not gloc.query_exists(None):
-                removals.append(tr)
-
-        for tr in removals:
-            logger.debug("Removing %s", tr)
-            self.collection.remove(tr)
+        removals = self._get_removed_tracks(libloc, seen, errors, links)
+        if removals:
+            for tr in removals:
+                logger.debug("Removing %s", tr)
+            self.collection.remove_tracks(removals)
 
         logger.info("Scan completed: %s", self.location)
         self.scanning = False
@@ -855,16 +1118,27 @@ class Library:
         collection
         """
         oldgloc = Gio.File.new_for_uri(loc)
-
-        newgloc = Gio.File.new_for_uri(self.location).resolve_relative_path(
-            oldgloc.get_basename()
-        )
+        newgloc = self._get_add_target(oldgloc)
 
         if move:
             oldgloc.move(newgloc)
         else:
             oldgloc.copy(newgloc)
-        tr = trax.Track(newgloc.get_uri())
+        self._add_copied(newgloc)
+
+    def _get_add_target(self, gloc: Gio.File) -> Gio.File:
+        """
+        Returns where :meth:`add` puts a file
+        """
+        return Gio.File.new_for_uri(self.location).resolve_relative_path(
+            gloc.get_basename()
+        )
+
+    def _add_copied(self, gloc: Gio.File) -> None:
+        """
+        Adds a file that was put into the library to the collection
+        """
+        tr = trax.Track(gloc.get_uri())
         if tr._scan_valid:
             self.collection.add(tr)
 
@@ -885,12 +1159,35 @@ class Library:
 
 
 class TransferQueue:
+    """
+    Copies tracks into a library, e.g. to send them to a device
+
+    Several files are copied at the same time. Files that are already in
+    the library with the same size and modification time are skipped.
+    Tracks that were not copied when the transfer was cancelled or failed
+    stay queued, so calling :meth:`transfer` again resumes it.
+    """
+
+    #: seconds between two progress events
+    PROGRESS_INTERVAL = 0.5
+
+    #: difference in modification times still considered the same file,
+    #: FAT file systems store them with a 2 second resolution
+    MTIME_TOLERANCE = 2
+
     def __init__(self, library: Library):
         self.library = library
         self.queue: List[trax.Track] = []
-        self.current_pos = -1
         self.transferring = False
+        self.bytes_total = 0
+        self.bytes_copied = 0
+        self.bytes_skipped = 0
+        self.start_time: Optional[float] = None
         self._stop = False
+        self._cancellable: Optional[Gio.Cancellable] = None
+        self._lock = threading.Lock()
+        # bytes done so far for each track being transferred
+        self._progress: Dict[trax.Track, int] = {}
 
     def enqueue(self, tracks: Iterable[trax.Track]) -> None:
         self.queue.extend(tracks)
@@ -912,30 +1209,206 @@ class TransferQueue:
         Tranfer the queued tracks to the library.
 
         This is NOT asynchronous
+
+        Progress is reported in percent of the total size of the tracks
+        with the `track_transfer_progress` event, and is 100 once the
+        transfer is over.
         """
         self.transferring = True
-        self.current_pos += 1
-        try:
-            while self.current_pos < len(self.queue) and not self._stop:
-                track = self.queue[self.current_pos]
-                loc = track.get_loc_for_io()
-                self.library.add(loc)
+        self._stop = False
+        self._cancellable = Gio.Cancellable()
+        self._progress = {}
+        self.bytes_copied = self.bytes_skipped = 0
 
-                # TODO: make this be based on filesize not count
-                progress = self.current_pos * 100 / len(self.queue)
-                event.log_event('track_transfer_progress', self, progress)
+        workers = max(1, settings.get_option('collection/transfer_workers', 4))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        transferred = set()
+        futures = {}
 
-                self.current_pos += 1
+        try:
+            targets = self.__get_targets()
+            sizes = {track: self.__get_size(track) for track in targets}
+            self.bytes_total = sum(sizes.values())
+            self.start_time = time.monotonic()
+
+            for track, newgloc in targets.items():
+                future = executor.submit(self.__copy, track, newgloc, sizes[track])
+                futures[future] = track
+
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=self.PROGRESS_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    track = futures[future]
+                    try:
+                        newgloc = future.result()
+                    except GLib.Error as e:
+                        if not e.matches(
+                            Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED
+                        ):
+                            logger.warning(
+                                "Could not transfer %s: %s", track.get_loc_for_io(), e
+                            )
+                        newgloc = None
+                    if newgloc is None:
+                        with self._lock:
+                            self._progress.pop(track, None)
+                        continue
+
+                    # the collection is only modified from this thread
+                    collection = self.library.collection
+                    if collection.get_track_by_loc(newgloc.get_uri()) is None:
+                        self.library._add_copied(newgloc)
+                    transferred.add(track)
+
+                progress = self.bytes_done * 100 / max(self.bytes_total, 1)
+                event.log_event('track_transfer_progress', self, min(progress, 99.9))
         finally:
-            self.queue = []
+            self._stop = True
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+            self.queue = [t for t in self.queue if t not in transferred]
             self.transferring = False
-            self.current_pos = -1
             self._stop = False
+            self._cancellable = None
             event.log_event('track_transfer_progress', self, 100)
 
     def cancel(self) -> None:
         """
         Cancel the current transfer
+
+        The files being copied are stopped and removed.
         """
-        # TODO: make this stop mid-file as well?
         self._stop = True
+        cancellable = self._cancellable
+        if cancellable is not None:
+            cancellable.cancel()
+
+    @property
+    def bytes_done(self) -> int:
+        """
+        Size of the tracks copied or skipped so far, in bytes
+        """
+        with self._lock:
+            return sum(self._progress.values())
+
+    def get_throughput(self) -> float:
+        """
+        :returns: the bytes copied per second during the current or
+            last transfer, not counting skipped files
+        """
+        if self.start_time is None:
+            return 0.0
+        with self._lock:
+            copied = sum(self._progress.values()) - self.bytes_skipped
+        return copied / max(time.monotonic() - self.start_time, 1e-3)
+
+    def __get_targets(self) -> Dict[trax.Track, Gio.File]:
+        """
+        Returns where each queued track is copied to
+
+        Tracks that would be copied to the same file as an earlier track
+        are left out and stay queued, as copying them at the same time
+        would overwrite each other.
+        """
+        targets = {}
+        target_uris = set()
+        for track in self.queue:
+            if track in targets:
+                continue
+            newgloc = self.library._get_add_target(
+                Gio.File.new_for_uri(track.get_loc_for_io())
+            )
+            uri = newgloc.get_uri()
+            if uri in target_uris:
+                logger.warning(
+                    "Not transferring %s, another track is copied to %s",
+                    track.get_loc_for_io(),
+                    uri,
+                )
+                continue
+            target_uris.add(uri)
+            targets[track] = newgloc
+        return targets
+
+    def __get_size(self, track: trax.Track) -> int:
+        size = track.get_tag_raw('__filesize')
+        if size is None:
+            try:
+                info = Gio.File.new_for_uri(track.get_loc_for_io()).query_info(
+                    'standard::size', Gio.FileQueryInfoFlags.NONE, None
+                )
+                size = info.get_size()
+            except GLib.Error:
+                size = 0
+        return size
+
+    def __is_present(self, oldgloc: Gio.File, newgloc: Gio.File) -> bool:
+        """
+        Whether the target file is a copy of the source file
+        """
+        attributes = 'standard::size,time::modified'
+        try:
+            old = oldgloc.query_info(attributes, Gio.FileQueryInfoFlags.NONE, None)
+            new = newgloc.query_info(attributes, Gio.FileQueryInfoFlags.NONE, None)
+        except GLib.Error:
+            return False
+        old_mtime = old.get_attribute_uint64('time::modified')
+        new_mtime = new.get_attribute_uint64('time::modified')
+        return (
+            old.get_size() == new.get_size()
+            and abs(old_mtime - new_mtime) <= self.MTIME_TOLERANCE
+        )
+
+    def __copy(
+        self, track: trax.Track, newgloc: Gio.File, size: int
+    ) -> Optional[Gio.File]:
+        """
+        Copies a track into the library, runs on the worker threads
+
+        :param newgloc: where to copy the track to
+        :returns: the copy, or None if the transfer was cancelled before
+            the track was started
+        """
+        if self._stop:
+            return None
+
+        oldgloc = Gio.File.new_for_uri(track.get_loc_for_io())
+
+        if self.__is_present(oldgloc, newgloc):
+            with self._lock:
+                self._progress[track] = size
+                self.bytes_skipped += size
+            return newgloc
+
+        def on_progress(current, total, *args):
+            with self._lock:
+                self._progress[track] = current
+
+        try:
+            # the modification time is copied too, see __is_present
+            oldgloc.copy(
+                newgloc,
+                Gio.FileCopyFlags.OVERWRITE,
+                self._cancellable,
+                on_progress,
+                None,
+            )
+        except GLib.Error:
+            # don't leave a partial copy behind
+            try:
+                newgloc.delete(None)
+            except GLib.Error:
+                pass
+            raise
+
+        with self._lock:
+            self._progress[track] = size
+            self.bytes_copied += size
+        return newgloc
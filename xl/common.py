@@ -39,7 +39,7 @@ import shelve
 import subprocess
 import sys
 import threading
-from typing import Deque, Generic, Iterable, List, TypeVar
+from typing import Deque, Generic, Iterable, List, Optional, Tuple, TypeVar
 import urllib.parse
 import urllib.request
 import weakref
@@ -541,17 +541,50 @@ def walk(root: Gio.File) -> Iterable[Gio.File]:
         directory to walk through
     :returns: a generator object
     """
-    queue: Deque[Gio.File] = deque()
-    queue.append(root)
+    for fil, _fileinfo in walk_with_info(root):
+        yield fil
+
+
+def walk_with_info(
+    root: Gio.File,
+    attributes: str = "",
+    errors: Optional[List[Gio.File]] = None,
+    links: Optional[List[Gio.File]] = None,
+) -> Iterable[Tuple[Gio.File, Optional[Gio.FileInfo]]]:
+    """
+    Like :func:`walk`, but also yields the :class:`Gio.FileInfo` that
+    was enumerated along with each file, so that callers don't need to
+    query every file again.
+
+    :param root: a :class:`Gio.File` representing the
+        directory to walk through
+    :param attributes: comma separated list of additional attributes
+        to query, e.g. ``"standard::size"``
+    :param errors: if given, directories that could not be listed
+        completely are appended to it
+    :param links: if given, symlinks that are not followed because they
+        point to a location within root are appended to it, as soon as
+        they are listed
+    :returns: a generator of (file, fileinfo) tuples. The fileinfo of
+        the root directory is None.
+    """
+    query = (
+        "standard::type,"
+        "standard::is-symlink,standard::name,"
+        "standard::symlink-target,time::modified"
+    )
+    if attributes:
+        query += "," + attributes
+
+    queue: Deque[Tuple[Gio.File, Optional[Gio.FileInfo]]] = deque()
+    queue.append((root, None))
 
     while len(queue) > 0:
-        dir = queue.pop()
-        yield dir
+        dir, dirinfo = queue.pop()
+        yield dir, dirinfo
         try:
             for fileinfo in dir.enumerate_children(
-                "standard::type,"
-                "standard::is-symlink,standard::name,"
-                "standard::symlink-target,time::modified",
+                query,
                 Gio.FileQueryInfoFlags.NONE,
                 None,
             ):
@@ -565,14 +598,33 @@ def walk(root: Gio.File) -> Iterable[Gio.File]:
                         fil2 = Gio.File.new_for_uri(target)
                     # already in the collection, we'll get it anyway
                     if fil2.has_prefix(root):
+                        if links is not None:
+                            links.append(fil)
                         continue
                 type = fileinfo.get_file_type()
                 if type == Gio.FileType.DIRECTORY:
-                    queue.append(fil)
+                    queue.append((fil, fileinfo))
                 elif type == Gio.FileType.REGULAR:
-                    yield fil
+                    yield fil, fileinfo
         except GLib.Error:  # why doesnt gio offer more-specific errors?
             logger.exception("Unhandled exception while walking on %s.", dir)
+            if errors is not None:
+                errors.append(dir)
+
+
+def get_modification_time(fileinfo: Gio.FileInfo) -> float:
+    """
+    Gets the modification time of a file
+
+    :param fileinfo: a :class:`Gio.FileInfo` that was queried
+        with the ``time::modified`` attribute
+    :returns: the modification time as a unix timestamp
+    """
+    if hasattr(Gio.FileInfo, 'get_modification_date_time'):  # GLib >=2.62
+        return fileinfo.get_modification_date_time().to_unix()
+    else:  # Deprecated due to the Year 2038 problem
+        mtime = fileinfo.get_modification_time()
+        return mtime.tv_sec + (mtime.tv_usec / 100000.0)
 
 
 def walk_directories(root: Gio.File) -> Iterable[Gio.File]:
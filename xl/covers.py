@@ -32,11 +32,15 @@ as album art.
 
 from gi.repository import GLib
 from gi.repository import Gio
+import collections.abc
+import concurrent.futures
 import logging
 import hashlib
 import os
 import pickle
-from typing import Optional
+import threading
+import time
+from typing import Iterable, Optional
 
 from xl.nls import gettext as _
 from xl import common, event, providers, settings, trax, xdg
@@ -53,35 +57,55 @@ class Cacher:
     Note that as entries are stored as
     individual files, the data being stored should be of significant
     size (several KB) or a lot of disk space will likely be wasted.
+
+    Entries are named after the SHA-256 of their data, so adding the same
+    data twice stores it once. If a maximum size is given, the least
+    recently used entries are removed once the cache grows past it.
     """
 
-    def __init__(self, cache_dir):
+    def __init__(self, cache_dir, max_size=None):
         """
         :param cache_dir: directory to use for the cache. will be
             created if it does not exist.
+        :param max_size: maximum total size of the entries in bytes, or
+            None to never remove entries
         """
         try:
             os.makedirs(cache_dir)
         except OSError:
             pass
         self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        # total size of the entries, only kept if max_size is set
+        self.__size = None
 
-    def add(self, data):
+    def add(self, data, key=None):
         """
         Adds an entry to the cache.  Returns a key that can be used
         to retrieve the data from the cache.
 
         :param data: The data to store, as a bytestring.
+        :param key: The key to store the data under. Defaults to the
+            SHA-256 of the data.
         """
-        # FIXME: this doesnt handle hash collisions at all. with
-        # 2^256 possible keys its unlikely that we'll have a collision,
-        # but we should handle it anyway.
-        h = hashlib.sha256()
-        h.update(data)
-        key = h.hexdigest()
+        if key is None:
+            # FIXME: this doesnt handle hash collisions at all. with
+            # 2^256 possible keys its unlikely that we'll have a collision,
+            # but we should handle it anyway.
+            h = hashlib.sha256()
+            h.update(data)
+            key = h.hexdigest()
         path = os.path.join(self.cache_dir, key)
+        if self.__touch(path):
+            return key
         with open(path, "wb") as fp:
             fp.write(data)
+        if self.max_size is not None:
+            with self.__lock:
+                if self.__size is not None:
+                    self.__size += len(data)
+            self.__shrink()
         return key
 
     def remove(self, key):
@@ -95,6 +119,10 @@ class Cacher:
             os.remove(path)
         except OSError:
             pass
+        else:
+            with self.__lock:
+                # recount on the next add
+                self.__size = None
 
     def get(self, key):
         """
@@ -104,10 +132,283 @@ class Cacher:
         :param key: The key to retrieve data for.
         """
         path = os.path.join(self.cache_dir, key)
-        if os.path.exists(path):
+        try:
             with open(path, "rb") as fp:
-                return fp.read()
-        return None
+                data = fp.read()
+        except OSError:
+            return None
+        if self.max_size is not None:
+            self.__touch(path)
+        return data
+
+    @staticmethod
+    def __touch(path):
+        """
+        Marks an entry as recently used. Returns False if it doesn't exist.
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    def __shrink(self):
+        """
+        Removes the least recently used entries while the cache is
+        larger than its maximum size
+        """
+        with self.__lock:
+            if self.__size is not None and self.__size <= self.max_size:
+                return
+            try:
+                entries = [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in os.scandir(self.cache_dir)
+                    if entry.is_file()
+                ]
+            except OSError:
+                logger.exception("Could not list cache %s", self.cache_dir)
+                return
+            size = sum(entry[1] for entry in entries)
+            if size > self.max_size:
+                # leave some room, so that we don't have to list the
+                # directory again on every add
+                target = self.max_size * 0.9
+                entries.sort()
+                for _mtime, entry_size, path in entries:
+                    if size <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    size -= entry_size
+            self.__size = size
+
+
+class CoverDB(collections.abc.MutableMapping):
+    """
+    Maps album keys to the db strings of their covers, stored in a shelf.
+
+    Entries are read from disk when they are looked up and written when
+    they are set, so neither opening nor saving the db goes through all
+    of it.
+    """
+
+    def __init__(self, location):
+        """
+        :param location: The path of the shelf
+        """
+        self.location = location
+        self.__lock = threading.Lock()
+        self.__shelf = common.open_shelf(location)
+
+    def __getitem__(self, key):
+        with self.__lock:
+            return self.__shelf[key]
+
+    def __setitem__(self, key, value):
+        with self.__lock:
+            self.__shelf[key] = value
+
+    def __delitem__(self, key):
+        with self.__lock:
+            del self.__shelf[key]
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__shelf
+
+    def __iter__(self):
+        with self.__lock:
+            keys = list(self.__shelf.keys())
+        return iter(keys)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__shelf)
+
+    def sync(self):
+        """
+        Writes the changes to disk
+        """
+        with self.__lock:
+            self.__shelf.sync()
+
+    def close(self):
+        with self.__lock:
+            self.__shelf.close()
+
+
+class CoverResolver:
+    """
+    Searches for the covers of many tracks at the same time.
+
+    Lookups run on a bounded pool of worker threads, or in the calling
+    thread with :meth:`lookup`. Lookups for an album that is already being
+    searched for share the running search, and albums for which no cover
+    was found are not searched again until `miss_ttl` seconds have passed.
+    """
+
+    def __init__(self, manager, max_workers=None, miss_ttl=1800):
+        """
+        :param manager: The :class:`CoverManager` to search with
+        :param max_workers: The maximum number of concurrent lookups,
+            defaults to the covers/fetch_workers option
+        :param miss_ttl: Seconds to remember that an album has no cover
+        """
+        if max_workers is None:
+            max_workers = settings.get_option('covers/fetch_workers', 8)
+        self.manager = manager
+        self.max_workers = max_workers
+        self.miss_ttl = miss_ttl
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='CoverResolver'
+        )
+        self.lock = threading.Lock()
+        #: album key -> Future of the queued or running lookup
+        self.pending = {}
+        #: album key -> time after which the album is searched again
+        self.misses = {}
+        self.stopped = False
+
+    def resolve(self, track: trax.Track) -> concurrent.futures.Future:
+        """
+        Searches for a cover for the track and stores the first one found.
+
+        :param track: The track to find a cover for
+        :returns: a Future that resolves to the cover data, or None if
+            no cover was found or the resolver was shut down
+        """
+        key = self.manager._get_track_key(track)
+
+        with self.lock:
+            if self.stopped:
+                return self._get_no_cover()
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            if self._is_miss(key):
+                return self._get_no_cover()
+            future = self._add_pending(key)
+            self.executor.submit(self._run, future, track, key)
+        return future
+
+    def lookup(self, track: trax.Track):
+        """
+        Like :meth:`resolve`, but searches in the calling thread instead of
+        waiting for a worker. Only a running lookup for the same album is
+        waited for; a queued one is taken over.
+
+        :param track: The track to find a cover for
+        :returns: the cover data, or None
+        """
+        key = self.manager._get_track_key(track)
+
+        with self.lock:
+            if self.stopped:
+                return None
+            future = self.pending.get(key)
+            if future is None:
+                if self._is_miss(key):
+                    return None
+                future = self._add_pending(key)
+            # a lookup that is running in another thread is shared
+            shared = future.running() or future.done()
+            if not shared:
+                future.set_running_or_notify_cancel()
+
+        if not shared:
+            self._complete(future, track, key)
+        return future.result()
+
+    def _is_miss(self, key):
+        """
+        Whether the album was recently found to have no cover. Must be
+        called with the lock held.
+        """
+        expires = self.misses.get(key)
+        if expires is None:
+            return False
+        if expires > time.monotonic():
+            return True
+        del self.misses[key]
+        return False
+
+    def _add_pending(self, key):
+        """
+        Must be called with the lock held
+        """
+        future = concurrent.futures.Future()
+        if key is not None:
+            self.pending[key] = future
+            future.add_done_callback(lambda f: self._on_lookup_done(key))
+        return future
+
+    @staticmethod
+    def _get_no_cover():
+        future = concurrent.futures.Future()
+        future.set_result(None)
+        return future
+
+    def _run(self, future, track, key):
+        """
+        Runs a lookup on a worker, unless it was taken over by
+        :meth:`lookup` in the meantime
+        """
+        with self.lock:
+            if future.running() or future.done():
+                return
+            future.set_running_or_notify_cancel()
+        self._complete(future, track, key)
+
+    def _complete(self, future, track, key):
+        try:
+            data = self._lookup(track, key)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(data)
+
+    def _lookup(self, track, key=None):
+        if self.stopped:
+            return None
+
+        data = None
+        covers = self.manager.find_covers(track, limit=1)
+        if covers:
+            data = self.manager.get_cover_data(covers[0])
+            if data:
+                self.manager.set_cover(track, covers[0], data)
+
+        if not data and key is not None:
+            with self.lock:
+                self.misses[key] = time.monotonic() + self.miss_ttl
+        return data
+
+    def _on_lookup_done(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def forget_misses(self):
+        """
+        Searches again for albums that were recently found to have no cover
+        """
+        with self.lock:
+            self.misses.clear()
+
+    def shutdown(self):
+        """
+        Drops the lookups that have not started yet, and waits for the
+        running ones to store their covers. Later lookups find no cover.
+        """
+        with self.lock:
+            self.stopped = True
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            running = list(self.pending.values())
+        # lookups running in other threads, see lookup()
+        concurrent.futures.wait(running)
 
 
 class CoverManager(providers.ProviderHandler):
@@ -125,8 +426,13 @@ class CoverManager(providers.ProviderHandler):
         self.__cache = Cacher(os.path.join(location, 'cache'))
         self.location = location
         self.methods = {}
+        #: method name -> semaphore limiting concurrent calls into it
+        self.method_slots = {}
+        self.resolver = CoverResolver(self)
         self.order = settings.get_option('covers/preferred_order', [])
-        self.db = {'version': self.DB_VERSION}
+        self.db = None
+        #: The version 1 db waiting to be migrated
+        self.old_db = None
         self.load()
         for method in self.get_providers():
             self.on_provider_added(method)
@@ -184,6 +490,17 @@ class CoverManager(providers.ProviderHandler):
             methods = nonfixed
         return methods
 
+    def _call_method(self, method, func, *args, **kwargs):
+        """
+        Calls into a search method, waiting while it already handles
+        as many calls as it allows
+        """
+        slots = self.method_slots.get(method.name)
+        if slots is None:
+            return func(*args, **kwargs)
+        with slots:
+            return func(*args, **kwargs)
+
     @staticmethod
     def _get_track_key(track: trax.Track) -> Optional[str]:
         """Get a unique, hashable identifier for the track's album.
@@ -253,8 +570,6 @@ class CoverManager(providers.ProviderHandler):
 
         return self.db.get(key)
 
-    @common.synchronized
-    @common.cached(5)
     def find_covers(self, track, limit=-1, local_only=False):
         """
         Find all covers for a track
@@ -270,7 +585,7 @@ class CoverManager(providers.ProviderHandler):
         for method in self._get_methods(fixed=True):
             if local_only and method.use_cache:
                 continue
-            new = method.find_covers(track, limit=limit)
+            new = self._call_method(method, method.find_covers, track, limit=limit)
             new = ["%s:%s" % (method.name, x) for x in new]
             covers.extend(new)
             if limit != -1 and len(covers) >= limit:
@@ -341,13 +656,16 @@ class CoverManager(providers.ProviderHandler):
         if set_only:
             return self.get_default_cover() if use_default else None
 
-        covers = self.find_covers(track, limit=1)
-        if covers:
-            cover = covers[0]
-            data = self.get_cover_data(cover, use_default=use_default)
-            if save_cover and data != self.get_default_cover():
-                self.set_cover(track, cover, data)
-            return data
+        if save_cover:
+            data = self.resolver.lookup(track)
+            if data:
+                return data
+        else:
+            covers = self.find_covers(track, limit=1)
+            if covers:
+                data = self.get_cover_data(covers[0])
+                if data:
+                    return data
 
         return self.get_default_cover() if use_default else None
 
@@ -366,7 +684,7 @@ class CoverManager(providers.ProviderHandler):
         else:
             method = self.methods.get(source)
             if method:
-                ret = method.get_cover_data(data)
+                ret = self._call_method(method, method.get_cover_data, data)
         if ret is None and use_default is True:
             ret = self.get_default_cover()
         return ret
@@ -381,7 +699,23 @@ class CoverManager(providers.ProviderHandler):
 
     def load(self):
         """
-        Load the saved db
+        Opens the saved db, importing the db of older versions once
+        """
+        self.db = CoverDB(os.path.join(self.location, 'covers.shelf'))
+        if 'version' not in self.db:
+            self.__import_pickled_db()
+        version = self.db.get('version', 1)
+        if version > self.DB_VERSION:
+            logger.error(
+                "covers.db version (%s) higher than supported (%s); using anyway",
+                version,
+                self.DB_VERSION,
+            )
+
+    def __import_pickled_db(self):
+        """
+        Moves the entries of the pickled covers.db of older versions
+        into the shelf
         """
         path = os.path.join(self.location, 'covers.db')
         data = None
@@ -398,15 +732,32 @@ class CoverManager(providers.ProviderHandler):
                     pass
             if data:
                 break
+
+        if data and data.get('version', 1) == 1:
+            # The keys can only be converted once the collection is
+            # loaded, see xl.migrations.database.covers_1to2
+            self.old_db = data
+            return
+
         if data:
-            self.db = data
-        version = self.db.get('version', 1)
-        if version > self.DB_VERSION:
-            logger.error(
-                "covers.db version (%s) higher than supported (%s); using anyway",
-                version,
-                self.DB_VERSION,
-            )
+            logger.info("Moving %s into the cover shelf", path)
+            del data['version']
+            self.db.update(data)
+        # Written last, so that an interrupted import is done again
+        self.db['version'] = self.DB_VERSION
+        self.db.sync()
+        self.remove_pickled_db()
+
+    def remove_pickled_db(self):
+        """
+        Removes the pickled covers.db of older versions
+        """
+        path = os.path.join(self.location, 'covers.db')
+        for loc in [path, path + ".old", path + ".new"]:
+            try:
+                os.remove(loc)
+            except OSError:
+                pass
 
     @common.glib_wait_seconds(60)
     def timeout_save(self):
@@ -415,33 +766,32 @@ class CoverManager(providers.ProviderHandler):
     def save(self):
         """
         Save the db
+
+        Changes are written to the shelf as they are made, so this only
+        makes sure they reached the disk.
         """
-        path = os.path.join(self.location, 'covers.db')
-        try:
-            with open(path + ".new", 'wb') as f:
-                pickle.dump(self.db, f, common.PICKLE_PROTOCOL)
-        except IOError:
-            return
-        try:
-            os.rename(path, path + ".old")
-        except OSError:
-            pass  # if it doesn'texist we don't care
-        os.rename(path + ".new", path)
-        try:
-            os.remove(path + ".old")
-        except OSError:
-            pass
+        self.db.sync()
 
     def on_provider_added(self, provider):
         self.methods[provider.name] = provider
+        max_concurrent = getattr(provider, 'max_concurrent', 1)
+        if max_concurrent is None:
+            self.method_slots.pop(provider.name, None)
+        else:
+            self.method_slots[provider.name] = threading.BoundedSemaphore(
+                max_concurrent
+            )
         if provider.name not in self.order:
             self.order.append(provider.name)
+        # The new method may know covers for albums that had none
+        self.resolver.forget_misses()
 
     def on_provider_removed(self, provider):
         try:
             del self.methods[provider.name]
         except KeyError:
             pass
+        self.method_slots.pop(provider.name, None)
         if provider.name in self.order:
             self.order.remove(provider.name)
 
@@ -492,6 +842,9 @@ class CoverSearchMethod:
     #: Priority for fixed-position backends. Lower is earlier, non-fixed
     #  backends will always be 50.
     fixed_priority = 50
+    #: How many lookups may use the method at the same time, None for
+    #  no limit.
+    max_concurrent = 1
 
     def find_covers(self, track, limit=-1):
         """
@@ -524,6 +877,9 @@ class TagCoverFetcher(CoverSearchMethod):
     cover_tags = ["cover", "coverart"]
     fixed = True
     fixed_priority = 30
+    # Reading tags goes through the format cache of xl.trax.track, which
+    # is not thread-safe
+    max_concurrent = 1
 
     def find_covers(self, track, limit=-1):
         covers = []
@@ -569,9 +925,12 @@ class LocalFileCoverFetcher(CoverSearchMethod):
     preferred_names = []
     fixed = True
     fixed_priority = 31
+    max_concurrent = None
 
     def __init__(self):
         CoverSearchMethod.__init__(self)
+        #: directory uri -> (modification time, names of the images in it)
+        self.directories = {}
 
         event.add_callback(self.on_option_set, 'covers_localfile_option_set')
         self.on_option_set(
@@ -586,35 +945,72 @@ class LocalFileCoverFetcher(CoverSearchMethod):
             return []
         basedir = Gio.File.new_for_uri(track.get_loc_for_io()).get_parent()
         try:
-            if (
-                not basedir.query_info(
-                    "standard::type", Gio.FileQueryInfoFlags.NONE, None
-                ).get_file_type()
-                == Gio.FileType.DIRECTORY
-            ):
-                return []
+            info = basedir.query_info(
+                "standard::type,time::modified", Gio.FileQueryInfoFlags.NONE, None
+            )
         except GLib.Error:
             return []
+        if not info.get_file_type() == Gio.FileType.DIRECTORY:
+            return []
         covers = []
-        for fileinfo in basedir.enumerate_children(
-            "standard::type" ",standard::name", Gio.FileQueryInfoFlags.NONE, None
-        ):
-            gloc = basedir.get_child(fileinfo.get_name())
-            if not fileinfo.get_file_type() == Gio.FileType.REGULAR:
-                continue
-            filename = gloc.get_basename()
-            base, ext = os.path.splitext(filename)
-            if ext.lower() not in self.extensions:
-                continue
+        for name in self._get_images(basedir, common.get_modification_time(info)):
+            base, ext = os.path.splitext(name)
             if base in self.preferred_names:
-                covers.insert(0, gloc.get_uri())
+                covers.insert(0, basedir.get_child(name).get_uri())
             else:
-                covers.append(gloc.get_uri())
+                covers.append(basedir.get_child(name).get_uri())
         if limit == -1:
             return covers
         else:
             return covers[:limit]
 
+    def _get_images(self, directory, mtime):
+        """
+        Returns the names of the images in a directory, only listing the
+        directory if it changed since it was last listed
+        """
+        uri = directory.get_uri()
+        cached = self.directories.get(uri)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            names = [
+                fileinfo.get_name()
+                for fileinfo in directory.enumerate_children(
+                    "standard::type,standard::name", Gio.FileQueryInfoFlags.NONE, None
+                )
+                if fileinfo.get_file_type() == Gio.FileType.REGULAR
+            ]
+        except GLib.Error:
+            return []
+        return self._add_directory(uri, mtime, names)
+
+    def _add_directory(self, uri, mtime, names):
+        images = [
+            name
+            for name in names
+            if os.path.splitext(name)[1].lower() in self.extensions
+        ]
+        # A directory changed again within the same second would keep its
+        # modification time, so recent listings are not trusted
+        if time.time() - mtime > 2:
+            self.directories[uri] = (mtime, images)
+        return images
+
+    def add_directory(
+        self, directory: Gio.File, mtime: float, names: Iterable[str]
+    ) -> None:
+        """
+        Stores the listing of a directory that was made elsewhere, so that
+        the directory is not listed again until it changes
+
+        :param directory: the directory that was listed
+        :param mtime: the modification time of the directory when it was
+            listed, see :func:`xl.common.get_modification_time`
+        :param names: the names of all regular files in the directory
+        """
+        self._add_directory(directory.get_uri(), mtime, names)
+
     def get_cover_data(self, db_string):
         try:
             data = Gio.File.new_for_uri(db_string).load_contents(None)[1]
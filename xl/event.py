@@ -139,9 +139,40 @@ def add_ui_callback(function, evty=None, obj=None, *args, **kwargs):
     return EVENT_MANAGER.add_callback(function, evty, obj, args, kwargs, ui=True)
 
 
+def add_batch_callback(function, evty, obj=None, *args, **kwargs):
+    """
+    Adds a callback that receives the events of a type in batches. The
+    events are collected and delivered on the UI thread once per main
+    loop iteration, so a burst of events, such as `track_tags_changed`
+    during a scan, can be handled in one pass.
+
+    The callback is called as ``function(evty, events, *args, **kwargs)``,
+    where *events* is the list of (object, data) of the events in the
+    order they were sent.
+
+    :param function: the function to call with the events
+    :type function: callable
+    :param evty: the *type* or *name* of the event to listen for, eg
+            `track_tags_changed`. Unlike with other callbacks, this is
+            required.
+    :type evty: string
+    :param obj: the object to listen to events from. Defaults to any
+            object if not specified.
+    :type obj: object
+    :param destroy_with: (keyword arg only) If specified, this event will be
+                         detached when the specified Gtk widget is destroyed
+
+    Any additional parameters will be passed to the callback.
+
+    :returns: a convenience function that you can call to remove the callback.
+    """
+    global EVENT_MANAGER
+    return EVENT_MANAGER.add_callback(function, evty, obj, args, kwargs, batch=True)
+
+
 def remove_callback(function, evty=None, obj=None):
     """
-    Removes a callback. Can remove both ui and non-ui callbacks.
+    Removes a callback. Can remove ui, non-ui and batch callbacks.
 
     The parameters passed should match those that were passed when adding
     the callback
@@ -257,6 +288,81 @@ def _getWeakRef(obj, notifyDead=None):
         return createRef(obj, notifyDead)
 
 
+class EventProfile:
+    """
+    Records how often event callbacks are called and how long they take,
+    to find the ones that block the UI. Set an instance as the `profile`
+    of an EventManager to enable it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {(event type, callback name, on ui thread): [calls, total, max]}
+        self.stats = {}
+
+    def call(self, evty, function, *args, **kwargs):
+        """
+        Calls a callback of an event and records the time it took
+        """
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            name = getattr(function, '__qualname__', None) or repr(function)
+            module = getattr(function, '__module__', None)
+            if module:
+                name = '%s.%s' % (module, name)
+            key = (evty, name, threading.current_thread() is _UiThread)
+            with self.lock:
+                stats = self.stats.get(key)
+                if stats is None:
+                    self.stats[key] = [1, elapsed, elapsed]
+                else:
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    if elapsed > stats[2]:
+                        stats[2] = elapsed
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    def get_report(self):
+        """
+        :returns: a text table of the time spent per event type, and then
+            per callback, the most expensive first
+        """
+        with self.lock:
+            stats = [(key, list(value)) for key, value in self.stats.items()]
+
+        per_type = {}
+        for (evty, _name, _ui), (calls, total, longest) in stats:
+            type_stats = per_type.setdefault(evty, [0, 0.0, 0.0])
+            type_stats[0] += calls
+            type_stats[1] += total
+            type_stats[2] = max(type_stats[2], longest)
+
+        header = '%9s %11s %9s  %s' % ('calls', 'total ms', 'max ms', '%s')
+        row = '%9d %11.1f %9.1f  %s'
+
+        lines = [header % 'event']
+        for evty, (calls, total, longest) in sorted(
+            per_type.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(row % (calls, total * 1000, longest * 1000, evty))
+
+        lines.append('')
+        lines.append(header % 'event: callback (thread)')
+        for (evty, name, ui), (calls, total, longest) in sorted(
+            stats, key=lambda item: item[1][1], reverse=True
+        ):
+            desc = '%s: %s (%s)' % (evty, name, 'ui' if ui else 'other')
+            lines.append(row % (calls, total * 1000, longest * 1000, desc))
+
+        return '\n'.join(lines)
+
+
 class EventManager:
     """
     Manages all Events
@@ -267,10 +373,14 @@ class EventManager:
         self.all_callbacks = {}
         self.callbacks = {}
         self.ui_callbacks = {}
+        self.batch_callbacks = {}
         self.use_logger = use_logger
         self.use_verbose_logger = verbose
         self.logger_filter = logger_filter
 
+        #: Set to an EventProfile to record how long callbacks take
+        self.profile = None
+
         # RLock is needed so that event callbacks can themselves send
         # synchronous events and add or remove callbacks
         self.lock = threading.RLock()
@@ -278,6 +388,10 @@ class EventManager:
         self.pending_ui = []
         self.pending_ui_lock = threading.Lock()
 
+        # {event type: [Event, ...]} waiting for delivery to batch callbacks
+        self.pending_batches = {}
+        self.pending_batches_lock = threading.Lock()
+
     def emit(self, event):
         """
         Emits an Event, calling any registered callbacks.
@@ -293,6 +407,14 @@ class EventManager:
         global _UiThread
         is_ui_thread = threading.current_thread() == _UiThread
 
+        if event.type in self.batch_callbacks:
+            with self.pending_batches_lock:
+                do_emit = not self.pending_batches
+                self.pending_batches.setdefault(event.type, []).append(event)
+
+            if do_emit:
+                GLib.idle_add(self._emit_batches)
+
         # note: a majority of the calls to emit are made on the
         #       UI thread
 
@@ -337,6 +459,7 @@ class EventManager:
         # -> Otherwise non-ui threads could accidentally block the UI if
         #    they decide to run for too long
 
+        profile = self.profile
         for cb in callbacks:
             try:
                 fn = cb.wfunction()
@@ -356,9 +479,20 @@ class EventManager:
                             "%(function)s in response "
                             "to %(event)s." % {'function': fn, 'event': event.type}
                         )
-                    fn.__call__(
-                        event.type, event.object, event.data, *cb.args, **cb.kwargs
-                    )
+                    if profile is None:
+                        fn.__call__(
+                            event.type, event.object, event.data, *cb.args, **cb.kwargs
+                        )
+                    else:
+                        profile.call(
+                            event.type,
+                            fn,
+                            event.type,
+                            event.object,
+                            event.data,
+                            *cb.args,
+                            **cb.kwargs
+                        )
                 fn = None
             except Exception:
                 # something went wrong inside the function we're calling
@@ -372,28 +506,74 @@ class EventManager:
                 event.data,
             )
 
+    def _emit_batches(self):
+
+        with self.pending_batches_lock:
+            batches = self.pending_batches
+            self.pending_batches = {}
+
+        profile = self.profile
+        for evty, events in batches.items():
+            with self.lock:
+                ocbs = self.batch_callbacks.get(evty)
+                if ocbs is None:
+                    continue
+                callbacks = [(obj, list(cbs)) for obj, cbs in ocbs.items()]
+
+            for obj, cbs in callbacks:
+                if obj is _NONE:
+                    items = [(e.object, e.data) for e in events]
+                else:
+                    items = [(e.object, e.data) for e in events if e.object == obj]
+                if not items:
+                    continue
+
+                for cb in cbs:
+                    try:
+                        fn = cb.wfunction()
+                        if fn is None:
+                            # see _emit
+                            with self.lock:
+                                try:
+                                    self.batch_callbacks[evty][obj].remove(cb)
+                                except (KeyError, ValueError):
+                                    pass
+                        elif profile is None:
+                            fn(evty, items, *cb.args, **cb.kwargs)
+                        else:
+                            profile.call(evty, fn, evty, items, *cb.args, **cb.kwargs)
+                        fn = None
+                    except Exception:
+                        logger.exception("Event callback exception caught!")
+
     def emit_async(self, event):
         """
         Same as emit(), but does not block.
         """
         GLib.idle_add(self.emit, event)
 
-    def add_callback(self, function, evty, obj, args, kwargs, ui=False):
+    def add_callback(self, function, evty, obj, args, kwargs, ui=False, batch=False):
         """
         Registers a callback.
         You should always specify at least one of event type or object.
 
         @param function: The function to call [function]
         @param evty: The 'type' or 'name' of event to listen for. Defaults
-            to any. [string]
+            to any, except for batch callbacks. [string]
         @param obj: The object to listen to events from. Defaults
             to any. [string]
+        @param batch: Whether to deliver the events in batches, see
+            add_batch_callback [bool]
 
         Returns a convenience function that you can call to
         remove the callback.
         """
 
-        if ui:
+        if batch:
+            if evty is None:
+                raise ValueError("Batch callbacks need an event type")
+            all_cbs = [self.batch_callbacks]
+        elif ui:
             all_cbs = [self.ui_callbacks, self.all_callbacks]
         else:
             all_cbs = [self.callbacks, self.all_callbacks]
@@ -448,7 +628,12 @@ class EventManager:
             obj = _NONE
 
         with self.lock:
-            for cbs in [self.callbacks, self.all_callbacks, self.ui_callbacks]:
+            for cbs in [
+                self.callbacks,
+                self.all_callbacks,
+                self.ui_callbacks,
+                self.batch_callbacks,
+            ]:
                 remove = []
                 try:
                     callbacks = cbs[evty][obj]
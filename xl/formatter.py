@@ -158,6 +158,95 @@ class ParameterTemplate(metaclass=_ParameterTemplateMetaclass):
         return self.pattern.sub(convert, self.template)
 
 
+def _parse_parameters(parameters):
+    """
+    Turns the parameters of an identifier into a dictionary,
+    see :meth:`Formatter.extract`
+    """
+    # Split parameters on unescaped comma
+    parameters = [p.lstrip() for p in re.split(r'(?<!\\),', parameters)]
+    # Split arguments on unescaped equals sign
+    parameters = [(re.split(r'(?<!\\)=', p, 1) + [True])[:2] for p in parameters]
+    # Turn list of lists into a proper dictionary
+    parameters = dict(parameters)
+
+    # Remove now obsolete escapes
+    for p in parameters:
+        argument = parameters[p]
+
+        if not isinstance(argument, bool):
+            argument = argument.replace(r'\,', ',')
+            argument = argument.replace(r'\}', '}')
+            argument = argument.replace(r'\=', '=')
+            parameters[p] = argument
+
+    return parameters
+
+
+class _Field:
+    """
+    An identifier of a compiled format string
+    """
+
+    __slots__ = [
+        'needle',
+        'identifier',
+        'parameters',
+        'options',
+        'prefix',
+        'suffix',
+        'pad',
+        'padstring',
+        'placeholder',
+        'provider',
+    ]
+
+    def __init__(self, needle, identifier, parameters, placeholder):
+        """
+        :param needle: the identifier and its parameters as written
+        :param identifier: the identifier
+        :param parameters: the parsed parameters
+        :param placeholder: the text to keep if there is no value
+        """
+        self.needle = needle
+        self.identifier = identifier
+        self.parameters = parameters
+        self.placeholder = placeholder
+        self.provider = None
+
+        # The parameters common to all identifiers are applied by the
+        # formatter, the others are passed on to the substitute
+        options = dict(parameters)
+        self.prefix = options.pop('prefix', '')
+        self.suffix = options.pop('suffix', '')
+        self.pad = int(options.pop('pad', 0))
+        self.padstring = options.pop('padstring', '')
+        self.options = options
+
+    def decorate(self, substitute):
+        """
+        Applies padding, prefix and suffix to a value
+        """
+        pad = self.pad
+        padstring = self.padstring
+
+        if pad > 0 and padstring:
+            # Decrease pad length by value length
+            pad = max(0, pad - len(substitute))
+            # Retrieve the maximum multiplier for the pad string
+            padcount = pad // len(padstring) + 1
+            # Generate pad string
+            padstring = padcount * padstring
+            # Clamp pad string
+            padstring = padstring[0:pad]
+            substitute = '%s%s' % (padstring, substitute)
+
+        if substitute:
+            substitute = '%s%s%s' % (self.prefix, substitute, self.suffix)
+
+        return '%s' % (substitute,)
+
+
 class Formatter(GObject.GObject):
     """
     A generic text formatter based on a format string
@@ -193,6 +282,8 @@ class Formatter(GObject.GObject):
 
         self._template = ParameterTemplate(format)
         self._substitutions = {}
+        self._compiled = None
+        self._compiled_generation = None
 
     def do_get_property(self, property):
         """
@@ -210,6 +301,7 @@ class Formatter(GObject.GObject):
         if property.name == 'format':
             if value != self._template.template:
                 self._template.template = value
+                self._compiled = None
         else:
             raise AttributeError('unknown property %s' % property.name)
 
@@ -232,97 +324,111 @@ class Formatter(GObject.GObject):
 
         :returns: the extractions
         """
-        matches = self._template.pattern.finditer(self._template.template)
-        extractions: Formatter.Extractions = {}
-
-        # Extract list of identifiers and parameters from the format string
-        for match in matches:
-            groups = match.groupdict()
+        return {
+            field.needle: (field.identifier, dict(field.parameters))
+            for field in self._get_compiled()
+            if field.__class__ is _Field
+        }
 
-            # We only care about braced and named, not escaped and invalid
-            identifier = groups['braced'] or groups['named']
+    def _compile(self):
+        """
+        Parses the format string
 
-            if identifier is None:
-                continue
+        :returns: a list of literal strings and :class:`_Field`
+        """
+        template = self._template.template
+        delimiter = self._template.delimiter
+        compiled = []
+        position = 0
 
-            identifier_parts = [identifier]
-            parameters = {}
+        for match in self._template.pattern.finditer(template):
+            if match.start() > position:
+                compiled.append(template[position : match.start()])
+            position = match.end()
 
-            if groups['parameters'] is not None:
-                # Split parameters on unescaped comma
-                parameters = [
-                    p.lstrip() for p in re.split(r'(?<!\\),', groups['parameters'])
-                ]
-                # Split arguments on unescaped equals sign
-                parameters = [
-                    (re.split(r'(?<!\\)=', p, 1) + [True])[:2] for p in parameters
-                ]
-                # Turn list of lists into a proper dictionary
-                parameters = dict(parameters)
+            groups = match.groupdict()
+            named = groups['named']
+            braced = groups['braced']
 
-                # Remove now obsolete escapes
-                for p in parameters:
-                    argument = parameters[p]
+            if named is not None:
+                compiled.append(_Field(named, named, {}, delimiter + named))
+            elif braced is not None:
+                needle = braced
+                parameters = {}
 
-                    if not isinstance(argument, bool):
-                        argument = argument.replace(r'\,', ',')
-                        argument = argument.replace(r'\}', '}')
-                        argument = argument.replace(r'\=', '=')
-                        parameters[p] = argument
+                if groups['parameters'] is not None:
+                    # Required to make multiple occurences of the same
+                    # identifier with different parameters work
+                    needle = ':'.join([braced, groups['parameters']])
+                    parameters = _parse_parameters(groups['parameters'])
 
-                identifier_parts += [groups['parameters']]
+                compiled.append(
+                    _Field(needle, braced, parameters, delimiter + '{' + needle + '}')
+                )
+            else:  # escaped or invalid
+                compiled.append(delimiter)
 
-            # Required to make multiple occurences of the same
-            # identifier with different parameters work
-            extractions[':'.join(identifier_parts)] = (identifier, parameters)
+        if position < len(template):
+            compiled.append(template[position:])
 
-        return extractions
+        return compiled
 
-    def format(self, *args):
+    def _get_compiled(self):
         """
-        Returns a string by formatting the passed data
+        Returns the compiled format string, compiling it if the format
+        or the tag formatters changed
+        """
+        generation = providers.get_generation('tag-formatting')
+        if self._compiled is None or self._compiled_generation != generation:
+            self._compiled_generation = generation
+            self._compiled = self._compile()
+        return self._compiled
 
-        :param args: data to base the formatting on
-        :returns: the formatted text
-        :rtype: string
+    def _get_substitute(self, field, args):
+        """
+        Returns the value of a field, or None to keep the placeholder
         """
-        extractions = self.extract()
-        substitutions = {}
+        if field.needle in self._substitutions:
+            substitute = self._substitutions[field.needle]
+        elif field.identifier in self._substitutions:
+            substitute = self._substitutions[field.identifier]
+        else:
+            return None
 
-        for needle, (identifier, parameters) in extractions.items():
-            substitute = None
+        if callable(substitute):
+            substitute = substitute(*args, **field.options)
 
-            if needle in self._substitutions:
-                substitute = self._substitutions[needle]
-            elif identifier in self._substitutions:
-                substitute = self._substitutions[identifier]
+        return substitute
 
-            if substitute is not None:
-                prefix = parameters.pop('prefix', '')
-                suffix = parameters.pop('suffix', '')
-                pad = int(parameters.pop('pad', 0))
-                padstring = parameters.pop('padstring', '')
+    def _render(self, compiled, args):
+        """
+        Formats the passed data with a compiled format string
+        """
+        result = []
 
-                if callable(substitute):
-                    substitute = substitute(*args, **parameters)
+        for part in compiled:
+            if part.__class__ is not _Field:
+                result.append(part)
+                continue
 
-                if pad > 0 and padstring:
-                    # Decrease pad length by value length
-                    pad = max(0, pad - len(substitute))
-                    # Retrieve the maximum multiplier for the pad string
-                    padcount = pad // len(padstring) + 1
-                    # Generate pad string
-                    padstring = padcount * padstring
-                    # Clamp pad string
-                    padstring = padstring[0:pad]
-                    substitute = '%s%s' % (padstring, substitute)
+            substitute = self._get_substitute(part, args)
 
-                if substitute:
-                    substitute = '%s%s%s' % (prefix, substitute, suffix)
+            if substitute is None:
+                result.append(part.placeholder)
+            else:
+                result.append(part.decorate(substitute))
 
-                substitutions[needle] = substitute
+        return ''.join(result)
 
-        return self._template.safe_substitute(substitutions)
+    def format(self, *args):
+        """
+        Returns a string by formatting the passed data
+
+        :param args: data to base the formatting on
+        :returns: the formatted text
+        :rtype: string
+        """
+        return self._render(self._get_compiled(), args)
 
 
 class ProgressTextFormatter(Formatter):
@@ -405,23 +511,55 @@ class TrackFormatter(Formatter):
                 'First argument to format() needs ' 'to be of type xl.trax.Track'
             )
 
-        extractions = self.extract()
-        self._substitutions = {}
+        return self._render(self._get_compiled(), (track, markup_escape))
 
-        for identifier, (tag, parameters) in extractions.items():
-            provider = providers.get_provider('tag-formatting', tag)
+    def format_many(self, tracks, markup_escape=False):
+        """
+        Formats many tracks at once, see :meth:`format`
 
-            if provider is None:
-                substitute = track.get_tag_display(tag)
-            else:
-                substitute = provider.format(track, parameters)
+        :param tracks: the tracks to take data from
+        :type tracks: iterable of :class:`xl.trax.Track`
+        :param markup_escape: whether to escape markup-like
+            characters in tag values
+        :type markup_escape: bool
+        :returns: the formatted texts, in the order of the tracks
+        :rtype: list of string
+        """
+        compiled = self._get_compiled()
+        result = []
 
-            if markup_escape:
-                substitute = GLib.markup_escape_text(substitute)
+        for track in tracks:
+            if not isinstance(track, trax.Track):
+                raise TypeError('format_many() needs tracks of type xl.trax.Track')
+            result.append(self._render(compiled, (track, markup_escape)))
 
-            self._substitutions[identifier] = substitute
+        return result
 
-        return Formatter.format(self)
+    def _compile(self):
+        compiled = Formatter._compile(self)
+
+        # Bind the tag formatters once instead of looking them up for
+        # every track
+        for part in compiled:
+            if part.__class__ is _Field:
+                part.provider = providers.get_provider(
+                    'tag-formatting', part.identifier
+                )
+
+        return compiled
+
+    def _get_substitute(self, field, args):
+        track, markup_escape = args
+
+        if field.provider is None:
+            substitute = track.get_tag_display(field.identifier)
+        else:
+            substitute = field.provider.format(track, field.parameters)
+
+        if markup_escape:
+            substitute = GLib.markup_escape_text(substitute)
+
+        return substitute
 
 
 class TagFormatter:
@@ -25,11 +25,15 @@
 # from your version.
 
 from datetime import datetime, timedelta
+import collections
 import os
 import re
+import time
 import zlib
 import threading
 
+from gi.repository import GLib
+
 from xl.nls import gettext as _
 from xl.trax import Track
 from xl import common, event, providers, settings, xdg
@@ -39,53 +43,201 @@ class LyricsNotFoundException(Exception):
     pass
 
 
+#: How LyricsCache stores its entries, along with the time they were last
+#: used. Older versions stored the values only.
+_CacheEntry = collections.namedtuple('_CacheEntry', ['last_used', 'value'])
+
+
 class LyricsCache:
     """
-    Basically just a thread-safe shelf for convinience.
-    Supports container syntax.
+    Thread-safe, persistent cache for lyrics. Supports container syntax.
+
+    Entries that were used recently are kept in memory, and are read
+    without taking the lock. Changes are written to the shelf in batches,
+    at most FLUSH_DELAY seconds after they were made, and when Exaile
+    quits. When the cache grows past max_entries, the least recently used
+    entries are dropped. The time each entry was last used is stored
+    with it, so that entries which weren't used since the cache was
+    opened can be ordered the same way.
     """
 
-    def __init__(self, location, default=None):
+    #: seconds to wait before writing changes to disk
+    FLUSH_DELAY = 30
+
+    #: number of entries kept in memory
+    MEMORY_ENTRIES = 200
+
+    def __init__(self, location, default=None, max_entries=5000):
         """
         @param location: specify the shelve file location
 
         @param default: can specify a default to return from getter when
             there is nothing in the shelve
+
+        @param max_entries: the maximum number of entries to keep
         """
         self.location = location
         self.db = common.open_shelf(location)
         self.lock = threading.Lock()
         self.default = default
+        self.max_entries = max_entries
+
+        # Every key on disk or pending, least recently used first
+        self.order = collections.OrderedDict.fromkeys(self.db.keys())
+        # Keys at the start of order that weren't used since the cache was
+        # opened. Their order is only looked up in the shelf when entries
+        # have to be dropped.
+        self.unordered = set(self.order)
+        # Recently used entries
+        self.memory = {}
+        # Keys read since the last flush; appending to a deque is
+        # thread-safe, so readers don't need the lock. Only writes schedule
+        # a flush, so the deque is capped for sessions that only read; the
+        # last max_entries reads are enough to order the entries that
+        # are kept.
+        self.used = collections.deque(maxlen=max_entries)
+        # Changes not written yet; None means the entry was deleted
+        self.pending = {}
+        self.flush_id = None
 
         # Callback to close db
         event.add_callback(self.on_quit_application, 'quit_application')
 
     def on_quit_application(self, *args):
         """
-        Closes db on quit application
+        Writes pending changes and closes db on quit application
         Gets the lock/wait operations
         """
+        self.flush()
         with self.lock:
             self.db.close()
 
+    def flush(self):
+        """
+        Writes pending changes to disk and drops the least recently used
+        entries if there are too many
+        """
+        with self.lock:
+            if self.flush_id is not None:
+                GLib.source_remove(self.flush_id)
+                self.flush_id = None
+
+            # entries that were only read get their new last use time
+            touched = set()
+            while self.used:
+                key = self.used.popleft()
+                if key in self.order:
+                    self.order.move_to_end(key)
+                    self.unordered.discard(key)
+                    touched.add(key)
+
+            if len(self.order) > self.max_entries:
+                self.__sort_unordered()
+            while len(self.order) > self.max_entries:
+                key, _unused = self.order.popitem(last=False)
+                self.memory.pop(key, None)
+                self.pending[key] = None
+                touched.discard(key)
+
+            for key in touched:
+                if key not in self.pending:
+                    value = self.memory.get(key)
+                    if value is None:
+                        try:
+                            value = self.db[key].value
+                        except Exception:
+                            continue
+                    self.pending[key] = value
+
+            if not self.pending:
+                return
+
+            now = time.time()
+            for key, value in self.pending.items():
+                if value is not None:
+                    self.db[key] = _CacheEntry(now, value)
+                elif key in self.db:
+                    del self.db[key]
+            self.pending.clear()
+            self.db.sync()
+
+    def __sort_unordered(self):
+        """
+        Moves the entries that weren't used since the cache was opened
+        into the order of their last use
+        """
+        # lock must be held
+        last_used = {}
+        for key in self.unordered:
+            try:
+                entry = self.db[key]
+            except Exception:
+                entry = None
+            # entries of older versions are older than any other
+            last_used[key] = entry.last_used if isinstance(entry, _CacheEntry) else 0
+        for key in sorted(last_used, key=last_used.get, reverse=True):
+            self.order.move_to_end(key, last=False)
+        self.unordered.clear()
+
+    def _on_flush_timeout(self):
+        with self.lock:
+            self.flush_id = None
+        self.flush()
+        return False
+
     def keys(self):
         """
-        Return the shelve keys
+        Return the cache keys
         """
-        return self.db.keys()
+        with self.lock:
+            return list(self.order)
 
     def _get(self, key, default=None):
+        if default is None:
+            default = self.default
+
+        value = self.memory.get(key)
+        if value is not None:
+            self.used.append(key)
+            return value
+
         with self.lock:
-            try:
-                return self.db[key]
-            except Exception:
-                return default if default is not None else self.default
+            if key not in self.order:
+                return default
+            value = self.pending.get(key)
+            if value is None:
+                try:
+                    value = self.db[key]
+                except Exception:
+                    return default
+                if isinstance(value, _CacheEntry):
+                    value = value.value
+            self.__remember(key, value)
+
+        self.used.append(key)
+        return value
 
     def _set(self, key, value):
         with self.lock:
-            self.db[key] = value
-            # force save, wasn't auto-saving...
-            self.db.sync()
+            self.order[key] = None
+            self.order.move_to_end(key)
+            self.unordered.discard(key)
+            self.pending[key] = value
+            self.__remember(key, value)
+            self.__schedule_flush()
+
+    def __remember(self, key, value):
+        # lock must be held
+        self.memory[key] = value
+        if len(self.memory) > self.MEMORY_ENTRIES:
+            del self.memory[next(iter(self.memory))]
+
+    def __schedule_flush(self):
+        # lock must be held
+        if self.flush_id is None:
+            self.flush_id = GLib.timeout_add_seconds(
+                self.FLUSH_DELAY, self._on_flush_timeout
+            )
 
     def __getitem__(self, key):
         return self._get(key)
@@ -94,17 +246,21 @@ class LyricsCache:
         self._set(key, value)
 
     def __contains__(self, key):
-        return key in self.db
+        return key in self.order
 
     def __delitem__(self, key):
         with self.lock:
-            del self.db[key]
+            del self.order[key]
+            self.unordered.discard(key)
+            self.memory.pop(key, None)
+            self.pending[key] = None
+            self.__schedule_flush()
 
     def __iter__(self):
-        return self.db.__iter__()
+        return iter(self.keys())
 
     def __len__(self):
-        return len(self.db)
+        return len(self.order)
 
 
 class LyricsManager(providers.ProviderHandler):
@@ -129,11 +285,13 @@ class LyricsManager(providers.ProviderHandler):
         :param provider: a lyrics provider
         :return: the appropriate cache key
         """
-        return (
-            track.get_loc_for_io()
-            + provider.display_name
-            + track.get_tag_display('artist')
-            + track.get_tag_display('title')
+        return '\0'.join(
+            (
+                track.get_loc_for_io(),
+                provider.display_name,
+                track.get_tag_display('artist'),
+                track.get_tag_display('title'),
+            )
         )
 
     def set_preferred_order(self, order):
@@ -245,12 +403,15 @@ class LyricsManager(providers.ProviderHandler):
         lyrics = None
         source = None
         url = None
-        cache_time = settings.get_option('lyrics/cache_time', 720)  # in hours
+        cache_time = getattr(method, 'cache_time', None)
+        if cache_time is None:
+            cache_time = settings.get_option('lyrics/cache_time', 720)  # in hours
         key = self.__get_cache_key(track, method)
 
         # check cache for lyrics
-        if key in self.cache:
-            (lyrics, source, url, time) = self.cache[key]
+        cached = self.cache[key]
+        if cached is not None:
+            (lyrics, source, url, time) = cached
             # return if they are not expired
             now = datetime.now()
             if now - time < timedelta(hours=cache_time) and not refresh:
@@ -260,7 +421,16 @@ class LyricsManager(providers.ProviderHandler):
                     raise LyricsNotFoundException(e)
                 return (lyrics.decode('utf-8', errors='replace'), source, url)
 
-        (lyrics, source, url) = method.find_lyrics(track)
+        try:
+            (lyrics, source, url) = method.find_lyrics(track)
+        except LyricsNotFoundException:
+            # don't keep expired lyrics that are gone from the source
+            if cached is not None:
+                try:
+                    del self.cache[key]
+                except KeyError:
+                    pass
+            raise
         assert isinstance(lyrics, str), (method, track)
 
         # update cache
@@ -309,6 +479,10 @@ class LyricSearchMethod:
     Lyrics plugins will subclass this
     """
 
+    #: hours to cache the lyrics found by this method for, or None to
+    #: use the lyrics/cache_time setting
+    cache_time = None
+
     def find_lyrics(self, track):
         """
         Called by LyricsManager when lyrics are requested
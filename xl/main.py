@@ -417,6 +417,20 @@ def create_argument_parser():
         metavar=_('TYPE'),
         help=_("Limit xl.event debug to output of TYPE"),
     )
+    group.add_argument(
+        "--eventprofile",
+        dest="ProfileEvents",
+        action="store_true",
+        default=False,
+        help=_("Record how long xl.event callbacks take, and log it on quit"),
+    )
+    group.add_argument(
+        "--get-eventprofile",
+        dest="GetEventProfile",
+        action="store_true",
+        default=False,
+        help=_("Print the xl.event callback times of the running instance"),
+    )
     group.add_argument(
         "--quiet",
         dest="Quiet",
@@ -546,6 +560,9 @@ class Exaile:
             if self.options.DebugEventFull:
                 event.EVENT_MANAGER.use_verbose_logger = True
 
+            if self.options.ProfileEvents:
+                event.EVENT_MANAGER.profile = event.EventProfile()
+
             # initial mainloop setup. The actual loop is started later,
             # if necessary
             self.mainloop_init()
@@ -671,7 +688,10 @@ class Exaile:
 
         try:
             self.collection = collection.Collection(
-                "Collection", location=os.path.join(xdg.get_data_dir(), 'music.db')
+                "Collection",
+                location=os.path.join(xdg.get_data_dir(), 'music.db'),
+                journal=settings.get_option('collection/use_journal', True),
+                snapshot=settings.get_option('collection/use_snapshot', True),
             )
         except common.VersionError:
             logger.exception("VersionError loading collection")
@@ -955,7 +975,9 @@ class Exaile:
 
         from xl import covers
 
+        covers.MANAGER.resolver.shutdown()
         covers.MANAGER.save()
+        covers.MANAGER.db.close()
 
         self.collection.save_to_location()
 
@@ -972,10 +994,17 @@ class Exaile:
         player.QUEUE.save_to_location(os.path.join(xdg.get_data_dir(), 'queue.state'))
         player.PLAYER.stop()
 
+        self.collection.close()
+
         from xl import settings
 
         settings.MANAGER.save()
 
+        if event.EVENT_MANAGER.profile is not None:
+            logger.info(
+                "Event callback times:\n%s", event.EVENT_MANAGER.profile.get_report()
+            )
+
         if restart:
             logger.info("Restarting...")
             logger_setup.stop_logging()
@@ -26,7 +26,7 @@
 
 
 import os
-from typing import Optional
+from typing import Optional, Type
 import urllib.parse
 
 from gi.repository import Gio
@@ -110,19 +110,19 @@ class DummyFormat(BaseFormat):
     pass
 
 
-def get_format(loc: str) -> Optional[BaseFormat]:
+def get_format_class(loc: str) -> Optional[Type[BaseFormat]]:
     """
-    get a Format object appropriate for the file at loc.
-    if no suitable object can be found, None is returned.
+    get the Format class appropriate for the file at loc, without
+    opening the file. if the file type is not supported, None is returned.
 
     :param loc: The location to read from as a Gio URI
         (from Track.get_loc_for_io())
     """
-    loc = Gio.File.new_for_uri(loc).get_path()
-    if not loc:
+    path = Gio.File.new_for_uri(loc).get_path()
+    if not path:
         return None
 
-    ext = os.path.splitext(loc)[1]
+    ext = os.path.splitext(path)[1]
     ext = ext[1:]  # remove the pesky .
     ext = ext.lower()
 
@@ -134,8 +134,23 @@ def get_format(loc: str) -> Optional[BaseFormat]:
     if formatclass is None:
         formatclass = DummyFormat
 
+    return formatclass
+
+
+def get_format(loc: str) -> Optional[BaseFormat]:
+    """
+    get a Format object appropriate for the file at loc.
+    if no suitable object can be found, None is returned.
+
+    :param loc: The location to read from as a Gio URI
+        (from Track.get_loc_for_io())
+    """
+    formatclass = get_format_class(loc)
+    if formatclass is None:
+        return None
+
     try:
-        return formatclass(loc)
+        return formatclass(Gio.File.new_for_uri(loc).get_path())
     except NotReadable:
         return None
 
@@ -78,6 +78,8 @@ tag_data = {
 
     '__bitrate':        _TD(N_('Bitrate'),      'bitrate', editable=False),
     '__basedir':        None,
+    '__filesize':       None,
+    '__inode':          None,
     '__date_added':     _TD(N_('Date added'),   'timestamp', editable=False),
     '__last_played':    _TD(N_('Last played'),  'timestamp', editable=False),
     '__length':         _TD(N_('Length'),       'time', editable=False),
@@ -63,14 +63,14 @@ def migrate():
     """Migrate covers.db version 1 to 2 (Exaile 4.0)."""
 
     man = xl.covers.MANAGER
-    if man.db.get('version', 1) != 1:
+    if man.old_db is None:
         return
     logger.info("Upgrading covers.db to version 2")
 
     valid_cachefiles = set()
 
-    old_db = man.db
-    new_db = {'version': 2}
+    old_db = man.old_db
+    new_db = {}
     for coll in xl.collection.COLLECTIONS:
         for tr in coll.tracks.values():
             key = old_get_track_key(tr._track)
@@ -80,8 +80,11 @@ def migrate():
                 new_db[new_key] = value
                 if value.startswith('cache:'):
                     valid_cachefiles.add(value[6:])
-    man.db = new_db
+    man.db.update(new_db)
+    man.db['version'] = 2
     man.save()
+    man.old_db = None
+    man.remove_pickled_db()
 
     cachedir = os.path.join(man.location, 'cache')
     for cachefile in frozenset(os.listdir(cachedir)) - valid_cachefiles:
@@ -48,6 +48,20 @@ from xl.player.gst import missing_plugin
 
 logger = logging.getLogger(__name__)
 
+#: milliseconds to wait after a track started before prerolling the next one
+PREROLL_DELAY = 2000
+
+
+def _can_preroll(track):
+    """
+    Prerolling a live stream would start consuming it, and audio CDs
+    need the device set up when the track is played
+    """
+    uri = track.get_loc_for_io()
+    if urllib.parse.urlsplit(uri)[0] == "cdda":
+        return False
+    return track.is_local() or bool(track.get_tag_raw('__length'))
+
 
 class ExaileGstEngine(ExaileEngine):
     """
@@ -55,6 +69,7 @@ class ExaileGstEngine(ExaileEngine):
 
     * Audio plugins to modify the output stream
     * gapless playback
+    * next track prerolled in the background, for instant skips
     * crossfading (requires gst-plugins-bad)
     * Dynamic audio device switching at runtime
 
@@ -82,6 +97,17 @@ class ExaileGstEngine(ExaileEngine):
       installed). Create multiple AudioStream objects, and they have a
       DynamicAudioSink object hooked up to an interaudiosink.
 
+    Notes about prerolling:
+
+    Starting a playbin from scratch means opening the file, typefinding,
+    setting up the decoder and opening the audio device, which can take a
+    noticeable time (especially on network shares). When not crossfading,
+    the engine keeps a third AudioStream on standby, which holds the next
+    track of the queue decoded up to the first buffer (PAUSED). When that
+    track is played next, either by the user or by an automatic advance
+    that couldn't be done gapless, the streams are swapped and the standby
+    one only needs to be set to PLAYING.
+
     You can register plugins to modify the output audio via the following
     providers:
 
@@ -111,6 +137,9 @@ class ExaileGstEngine(ExaileEngine):
         self.user_fade_enabled = False
         self.user_fade_duration = 1000
 
+        # Preroll the next track in a standby stream
+        self.preroll_enabled = True
+
         # Key: option name; value: attribute on self
         options = {
             '%s/crossfading' % self.name: 'crossfade_enabled',
@@ -120,6 +149,7 @@ class ExaileGstEngine(ExaileEngine):
             '%s/custom_sink_pipe' % self.name: 'custom_sink_pipe',
             '%s/user_fade_enabled' % self.name: 'user_fade_enabled',
             '%s/user_fade' % self.name: 'user_fade_duration',
+            '%s/preroll_next' % self.name: 'preroll_enabled',
         }
 
         self.settings_unsubscribe = common.subscribe_for_settings(
@@ -142,6 +172,9 @@ class ExaileGstEngine(ExaileEngine):
         if name in ['audiosink_device', 'audiosink', 'custom_sink_pipe']:
             self._reconfigure_sink()
 
+        if name == 'preroll_enabled' and not value:
+            self._cancel_preroll()
+
     #
     # API
     #
@@ -150,6 +183,9 @@ class ExaileGstEngine(ExaileEngine):
 
         object.__setattr__(self, 'initialized', True)
 
+        self.standby_stream = None
+        self.preroll_id = None
+
         self.main_stream = AudioStream(self)
         self.other_stream = None
         self.crossfade_out = None
@@ -172,6 +208,9 @@ class ExaileGstEngine(ExaileEngine):
 
             self.other_stream.reconfigure_fader(cf_duration, cf_duration)
             self.logger.info("Crossfade: enabled (%sms)", self.crossfade_duration)
+
+            # the crossfade streams are never prerolled
+            self._cancel_preroll()
         else:
             self.logger.info("Crossfade: disabled")
             if self.other_stream is not None:
@@ -187,12 +226,20 @@ class ExaileGstEngine(ExaileEngine):
         if self.other_stream is not None:
             self.other_stream.reconfigure_sink()
 
+        # the prerolled track would be played on the old sink
+        self._cancel_preroll()
+
     def destroy(self, permanent=True):
+        self._cancel_preroll()
         self.main_stream.destroy()
 
         if self.other_stream is not None:
             self.other_stream.destroy()
 
+        if self.standby_stream is not None:
+            self.standby_stream.destroy()
+            self.standby_stream = None
+
         if permanent:
             self.settings_unsubscribe()
 
@@ -256,8 +303,12 @@ class ExaileGstEngine(ExaileEngine):
         self.main_stream.set_user_volume(volume)
         if self.other_stream is not None:
             self.other_stream.set_user_volume(volume)
+        if self.standby_stream is not None:
+            self.standby_stream.set_user_volume(volume)
 
     def stop(self):
+        self._cancel_preroll()
+
         if self.other_stream is not None:
             self.other_stream.stop()
 
@@ -293,6 +344,13 @@ class ExaileGstEngine(ExaileEngine):
             self._autoadvance_track()
 
     def _error_func(self, stream, msg):
+        if stream is self.standby_stream:
+            # Nothing is playing on it; the track will fail again when
+            # it is actually played, which reports the error
+            self.logger.debug("Prerolling failed: %s", msg)
+            stream.stop(emit_eos=False)
+            return
+
         # Destroy the streams, and create a new one, just in case
 
         self.player.engine_notify_error(msg)
@@ -308,6 +366,17 @@ class ExaileGstEngine(ExaileEngine):
         if prior_track is not None:
             self.player.engine_notify_track_end(prior_track, False)
 
+        standby = self.standby_stream
+        if (
+            not self.crossfade_enabled
+            and not already_queued
+            and standby is not None
+            and standby.prerolled_track is track
+        ):
+            self.logger.debug("Playing prerolled track")
+            self.main_stream, self.standby_stream = standby, self.main_stream
+            self.standby_stream.stop(emit_eos=False)
+
         if self.crossfade_enabled:
             self.main_stream, self.other_stream = self.other_stream, self.main_stream
             self.main_stream.play(
@@ -333,9 +402,56 @@ class ExaileGstEngine(ExaileEngine):
             self.main_stream.play(track, start_at, paused, stopped, already_queued)
 
         if stopped:
+            self._cancel_preroll()
             event.log_event('playlist_track_next', self.player, track)
         else:
             self.player.engine_notify_track_start(track)
+            self._schedule_preroll()
+
+    def _schedule_preroll(self):
+        if self.preroll_id is not None:
+            GLib.source_remove(self.preroll_id)
+
+        # Wait a bit, so the preroll doesn't compete for IO with the
+        # track that just started
+        self.preroll_id = GLib.timeout_add(PREROLL_DELAY, self._preroll_next)
+
+    def _cancel_preroll(self):
+        if self.preroll_id is not None:
+            GLib.source_remove(self.preroll_id)
+            self.preroll_id = None
+
+        standby = self.standby_stream
+        if standby is not None and standby.prerolled_track is not None:
+            standby.stop(emit_eos=False)
+
+    def _preroll_next(self):
+        """
+        Prerolls the next track of the queue in the standby stream
+        """
+        self.preroll_id = None
+
+        if self.crossfade_enabled or not self.preroll_enabled:
+            return False
+
+        if self.main_stream.current_track is None:
+            return False
+
+        track = self.player.queue.get_next()
+
+        if track is None or not _can_preroll(track):
+            if self.standby_stream is not None:
+                self.standby_stream.stop(emit_eos=False)
+            return False
+
+        if self.standby_stream is None:
+            self.standby_stream = AudioStream(self)
+            self.standby_stream.set_user_volume(self.main_stream.get_user_volume())
+
+        if self.standby_stream.prerolled_track is not track:
+            self.standby_stream.preroll(track)
+
+        return False
 
 
 class AudioStream:
@@ -359,6 +475,9 @@ class AudioStream:
         self.current_track = None
         self.buffered_track = None
 
+        # track that preroll() left ready to be played
+        self.prerolled_track = None
+
         # This exists because if there is a sink error, it doesn't
         # really make sense to recreate the sink -- it'll just fail
         # again. Instead, wait for the user to try to play a track,
@@ -471,17 +590,12 @@ class AudioStream:
     ):
         '''fade duration is in seconds'''
 
-        if not already_queued:
-            self.stop(emit_eos=False)
+        prerolled = self.prerolled_track is track
+        self.prerolled_track = None
 
-            # For the moment, the only safe time to add/remove elements
-            # is when the playbin is NULL, so do that here..
-            if self.audio_filters.setup_elements():
-                self.logger.debug("Applying audio filters")
-                self.playbin.props.audio_filter = self.audio_filters
-            else:
-                self.logger.debug("Not applying audio filters")
-                self.playbin.props.audio_filter = None
+        if not already_queued and not prerolled:
+            self.stop(emit_eos=False)
+            self._setup_audio_filters()
 
         if self.needs_sink:
             self.reconfigure_sink()
@@ -494,7 +608,7 @@ class AudioStream:
         self.logger.info("Playing %s", common.sanitize_url(uri))
 
         # This is only set for gapless playback
-        if not already_queued:
+        if not already_queued and not prerolled:
             self.playbin.set_property("uri", uri)
             if urllib.parse.urlsplit(uri)[0] == "cdda":
                 self.notify_id = self.playbin.connect(
@@ -520,6 +634,34 @@ class AudioStream:
         if paused:
             self.fader.pause()
 
+    def preroll(self, track):
+        """
+        Opens the track and decodes it up to the first buffer, so that
+        a later play() of the same track only has to start the pipeline
+        """
+        self.stop(emit_eos=False)
+        self._setup_audio_filters()
+
+        if self.needs_sink:
+            self.reconfigure_sink()
+
+        uri = track.get_loc_for_io()
+        self.logger.debug("Prerolling %s", common.sanitize_url(uri))
+
+        self.prerolled_track = track
+        self.playbin.set_property("uri", uri)
+        self.playbin.set_state(Gst.State.PAUSED)
+
+    def _setup_audio_filters(self):
+        # For the moment, the only safe time to add/remove elements
+        # is when the playbin is NULL, so do that here..
+        if self.audio_filters.setup_elements():
+            self.logger.debug("Applying audio filters")
+            self.playbin.props.audio_filter = self.audio_filters
+        else:
+            self.logger.debug("Not applying audio filters")
+            self.playbin.props.audio_filter = None
+
     def seek(self, value):
         '''value is in seconds'''
 
@@ -565,6 +707,7 @@ class AudioStream:
     def stop(self, emit_eos=True):
         prior_track = self.current_track
         self.current_track = None
+        self.prerolled_track = None
         self.playbin.set_state(Gst.State.NULL)
         self.fader.stop()
 
@@ -625,16 +768,17 @@ class AudioStream:
             percent = message.parse_buffering()
             if not percent < 100:
                 self.logger.info('Buffering complete')
-            if percent % 5 == 0:
+            if percent % 5 == 0 and self.current_track is not None:
                 event.log_event('playback_buffering', self.engine.player, percent)
 
         elif message.type == Gst.MessageType.TAG:
             """Update track length and optionally metadata from gstreamer's parser.
             Useful for streams and files mutagen doesn't understand."""
 
-            current = self.current_track
+            # a prerolled track gets its tags parsed ahead of time too
+            current = self.current_track or self.prerolled_track
 
-            if not current.is_local():
+            if current and not current.is_local():
                 gst_utils.parse_stream_tags(current, message.parse_tag())
 
             if current and not current.get_tag_raw('__length'):
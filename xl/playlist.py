@@ -31,8 +31,12 @@ in playlists as well as methods to import and export from various file formats.
 
 from gi.repository import Gio
 
+from array import array
+import bisect
 from collections import deque
 from datetime import datetime, timedelta
+import io
+import itertools
 import logging
 import operator
 import os
@@ -51,6 +55,10 @@ from xl.metadata.tags import tag_data
 
 logger = logging.getLogger(__name__)
 
+#: Start of playlists saved by :meth:`Playlist.save_to_location`. Older
+#: versions saved a text format, which can still be loaded.
+BINARY_PLAYLIST_MAGIC = b'\x00EXAILE-PLAYLIST\n'
+
 
 class InvalidPlaylistTypeError(Exception):
     pass
@@ -886,6 +894,16 @@ class XSPFConverter(FormatConverter):
 providers.register('playlist-format-converter', XSPFConverter())
 
 
+@common.threaded
+def _read_tags_in_background(tracks):
+    """
+    Reads the tags of tracks that were restored without reading their
+    files, see :meth:`Playlist.load_from_location`
+    """
+    for track in tracks:
+        track.read_tags()
+
+
 class Playlist:
     # TODO: how do we document events in sphinx?
     """
@@ -927,7 +945,10 @@ class Playlist:
         'current_position',
         'name',
     ]
-    __playlist_format_version = [2, 0]
+    __playlist_format_version = [3, 0]
+    #: Tags that are saved along with tracks that may not be in the
+    #: collection, so they can be shown before the tracks are read
+    save_tags = ('artist', 'album', 'tracknumber', 'title', 'genre', 'date')
 
     def __init__(self, name, initial_tracks=[]):
         """
@@ -967,7 +988,17 @@ class Playlist:
         self.__spat_position = -1
         self.__shuffle_history_counter = 1
 
+        # Lookup tables, built when first needed (see __get_positions)
+        #   positions: {track: [position, ...]}
+        #   album_positions: {album key: [position, ...]}
+        #   history_positions: {position, ...} of the shuffle history
+        # Changes to the tracks update them (see __update_lookup_tables).
+        self.__positions = None
+        self.__album_positions = None
+        self.__history_positions = None
+
         event.add_callback(self.on_playback_track_start, "playback_track_start")
+        event.add_callback(self.on_track_tags_changed, "track_tags_changed")
 
     ### playlist-specific API ###
 
@@ -1079,22 +1110,152 @@ class Playlist:
         :returns: the tracks
         :rtype: list
         """
-        return [
-            (i, self.__tracks[i])
-            for i in range(len(self))
-            if self.__tracks.get_meta_key(i, 'playlist_shuffle_history')
-        ]
+        return [(i, self.__tracks[i]) for i in sorted(self.__get_history_positions())]
 
     def clear_shuffle_history(self):
         """
         Clear the history of played
         tracks from a shuffle run
         """
-        for i in range(len(self)):
+        for i in self.__get_history_positions():
             try:
                 self.__tracks.del_meta_key(i, "playlist_shuffle_history")
-            except Exception:
+            except KeyError:
                 pass
+        self.__history_positions = set()
+
+    def __get_positions(self):
+        """
+        :returns: the positions of each track, as {track: [position, ...]}
+        """
+        if self.__positions is None:
+            positions = {}
+            for i, track in enumerate(self.__tracks):
+                positions.setdefault(track, []).append(i)
+            self.__positions = positions
+        return self.__positions
+
+    @staticmethod
+    def __get_album_key(track):
+        album = track.get_tag_raw('album')
+        return tuple(album) if album else None
+
+    def __get_album_positions(self):
+        """
+        :returns: the positions of the tracks of each album, as
+            {album key: [position, ...]}; tracks without album are under
+            the key None
+        """
+        if self.__album_positions is None:
+            album_positions = {}
+            get_album_key = self.__get_album_key
+            for i, track in enumerate(self.__tracks):
+                album_positions.setdefault(get_album_key(track), []).append(i)
+            self.__album_positions = album_positions
+        return self.__album_positions
+
+    def __get_history_positions(self):
+        """
+        :returns: the set of positions in the shuffle history
+        """
+        if self.__history_positions is None:
+            get_meta_key = self.__tracks.get_meta_key
+            self.__history_positions = {
+                i
+                for i in range(len(self.__tracks))
+                if get_meta_key(i, 'playlist_shuffle_history')
+            }
+        return self.__history_positions
+
+    def __update_lookup_tables(self, oldlen=None, removed=(), added=()):
+        """
+        Updates the lookup tables after the tracks changed
+
+        :param oldlen: the number of tracks before the change, or None to
+            drop the tables
+        :param removed: the removed (old position, track) pairs
+        :param added: the added (new position, track) pairs
+        """
+        if oldlen is None:
+            self.__positions = None
+            self.__album_positions = None
+            self.__history_positions = None
+            return
+
+        newlen = len(self.__tracks)
+        removed_tracks = {track for _i, track in removed}
+        removed = sorted(i % oldlen for i, _track in removed)
+        added = sorted((i % newlen, track) for i, track in added)
+        inserted = [i for i, _track in added]
+        changed = removed + inserted
+        if not changed:
+            return
+        first = min(changed)
+
+        # A track that was at index s after the removal ends up after
+        # every inserted track with at most s tracks before it
+        survivors_before = [i - n for n, i in enumerate(inserted)]
+
+        def move(i):
+            r = bisect.bisect_left(removed, i)
+            if r < len(removed) and removed[r] == i:
+                return None
+            i -= r
+            return i + bisect.bisect_right(survivors_before, i)
+
+        # Only the tracks that were at first or after it have positions
+        # to move: the removed ones, and those now after first
+        moved_tracks = removed_tracks.union(
+            itertools.islice(self.__tracks, first, None)
+        )
+
+        positions = self.__positions
+        if positions is not None:
+            self.__move_positions(positions, moved_tracks, first, move)
+            for i, track in added:
+                bisect.insort(positions.setdefault(track, []), i)
+
+        album_positions = self.__album_positions
+        if album_positions is not None:
+            get_album_key = self.__get_album_key
+            self.__move_positions(
+                album_positions, set(map(get_album_key, moved_tracks)), first, move
+            )
+            for i, track in added:
+                bisect.insort(album_positions.setdefault(get_album_key(track), []), i)
+
+        # added tracks may bring shuffle history along in their metadata
+        history = self.__history_positions
+        if history is not None:
+            history = {i if i < first else move(i) for i in history}
+            history.discard(None)
+            get_meta_key = self.__tracks.get_meta_key
+            history.update(
+                i for i in inserted if get_meta_key(i, 'playlist_shuffle_history')
+            )
+            self.__history_positions = history
+
+    @staticmethod
+    def __move_positions(table, keys, first, move):
+        """
+        Moves the positions from first onwards in a lookup table
+
+        :param keys: the keys that may have positions from first onwards
+        :param move: returns the new position of an old one, or None if
+            its track was removed
+        """
+        for key in keys:
+            positions = table.get(key)
+            if positions is None:
+                continue
+            start = bisect.bisect_left(positions, first)
+            if start == len(positions):
+                continue
+            moved = [i for i in map(move, positions[start:]) if i is not None]
+            if start or moved:
+                positions[start:] = moved
+            else:
+                del table[key]
 
     @common.threaded
     def __fetch_dynamic_tracks(self):
@@ -1117,49 +1278,53 @@ class Playlist:
                 if current_position == -1:
                     raise IndexError
                 curr = self[current_position]
+                album_positions = self.__get_album_positions()
                 t = [
-                    x
-                    for i, x in enumerate(self)
-                    if x.get_tag_raw('album') == curr.get_tag_raw('album')
-                    and i > current_position
+                    (i, self.__tracks[i])
+                    for i in album_positions.get(self.__get_album_key(curr), ())
+                    if i > current_position
                 ]
-                t = trax.sort_tracks(['discnumber', 'tracknumber'], t)
-                return self.__tracks.index(t[0]), t[0]
+                t = trax.sort_tracks(
+                    ['discnumber', 'tracknumber'], t, trackfunc=operator.itemgetter(1)
+                )
+                return t[0]
 
             except IndexError:  # Pick a new album
-                hist = set(self.get_shuffle_history())
-                albums = set()
-                for i, x in enumerate(self):
-                    if (i, x) in hist:
-                        continue
-                    alb = x.get_tag_raw('album')
-                    if alb:
-                        albums.add(tuple(alb))
+                hist = self.__get_history_positions()
+                # the table may be dropped by another thread meanwhile
+                album_positions = self.__get_album_positions()
+                albums = [
+                    album
+                    for album, positions in album_positions.items()
+                    if album is not None and not hist.issuperset(positions)
+                ]
                 if not albums:
                     return -1, None
-                album = list(random.choice(list(albums)))
-                t = [x for x in self if x.get_tag_raw('album') == album]
-                t = trax.sort_tracks(['tracknumber'], t)
-                return self.__tracks.index(t[0]), t[0]
-        elif mode == 'random':
-            try:
-                return random.choice(
-                    [(i, self.__tracks[i]) for i, tr in enumerate(self.__tracks)]
+                album = random.choice(albums)
+                t = [(i, self.__tracks[i]) for i in album_positions[album]]
+                t = trax.sort_tracks(
+                    ['tracknumber'], t, trackfunc=operator.itemgetter(1)
                 )
-            except IndexError:
+                return t[0]
+        elif mode == 'random':
+            if not self.__tracks:
                 return -1, None
+            i = random.randrange(len(self.__tracks))
+            return i, self.__tracks[i]
         else:
-            hist = {i for i, tr in self.get_shuffle_history()}
-            try:
-                return random.choice(
-                    [
-                        (i, self.__tracks[i])
-                        for i, tr in enumerate(self.__tracks)
-                        if i not in hist
-                    ]
-                )
-            except IndexError:  # no more tracks
+            hist = self.__get_history_positions()
+            count = len(self.__tracks)
+            if len(hist) >= count:  # no more tracks
                 return -1, None
+            if len(hist) <= count // 2:
+                # Most tracks are candidates, so guessing takes less than
+                # two tries on average, instead of listing all candidates
+                while True:
+                    i = random.randrange(count)
+                    if i not in hist:
+                        return i, self.__tracks[i]
+            i = random.choice([i for i in range(count) if i not in hist])
+            return i, self.__tracks[i]
 
     def __get_next(self, current_position):
 
@@ -1187,6 +1352,7 @@ class Playlist:
                     self.__shuffle_history_counter,
                 )
                 self.__shuffle_history_counter += 1
+                self.__get_history_positions().add(current_position)
             next_index, next = self.__next_random_track(current_position, shuffle_mode)
             if next is None:
                 self.clear_shuffle_history()
@@ -1264,13 +1430,17 @@ class Playlist:
 
         if shuffle_mode != 'disabled':
             shuffle_hist, prev_index = max(
-                (self.__tracks.get_meta_key(i, 'playlist_shuffle_history', 0), i)
-                for i in range(len(self))
+                (
+                    (self.__tracks.get_meta_key(i, 'playlist_shuffle_history', 0), i)
+                    for i in self.__get_history_positions()
+                ),
+                default=(0, -1),
             )
 
             if shuffle_hist:
                 self.current_position = prev_index
                 self.__tracks.del_meta_key(prev_index, 'playlist_shuffle_history')
+                self.__history_positions.discard(prev_index)
         else:
             position = self.current_position - 1
             if position < 0:
@@ -1437,31 +1607,44 @@ class Playlist:
         """
         Writes the content of the playlist to a given location
 
+        The playlist is saved in a binary format: a table of the distinct
+        uris, the tracks as indices into that table, and the saved tags
+        and attributes, pickled after :data:`BINARY_PLAYLIST_MAGIC`.
+
         :param location: the location to save to
         :type location: string
         """
         new_location = location + ".new"
 
-        with open(new_location, 'w') as f:
-            for track in self.__tracks:
-                loc = track.get_loc_for_io()
-                meta = {}
-                for tag in ('artist', 'album', 'tracknumber', 'title', 'genre', 'date'):
+        uris = []
+        indices = {}
+        meta = []
+        positions = array('L')
+        for track in self.__tracks:
+            loc = track.get_loc_for_io()
+            index = indices.get(loc)
+            if index is None:
+                index = indices[loc] = len(uris)
+                uris.append(loc)
+                tags = {}
+                for tag in self.save_tags:
                     value = track.get_tag_raw(tag, join=True)
                     if value is not None:
-                        meta[tag] = value
-                meta = urllib.parse.urlencode(meta)
-                print(loc, meta, sep='\t', file=f)
-
-            print('EOF', file=f)
+                        tags[tag] = value
+                meta.append(tags)
+            positions.append(index)
+
+        pdata = {
+            'version': self.__playlist_format_version,
+            'uris': uris,
+            'tracks': positions,
+            'meta': meta,
+            'attrs': {attr: getattr(self, attr) for attr in self.save_attrs},
+        }
 
-            for attr in self.save_attrs:
-                val = getattr(self, attr)
-                try:
-                    configstr = settings.MANAGER._val_to_str(val)
-                except ValueError:
-                    configstr = ''
-                print('%s=%s' % (attr, configstr), file=f)
+        with open(new_location, 'wb') as f:
+            f.write(BINARY_PLAYLIST_MAGIC)
+            pickle.dump(pdata, f, common.PICKLE_PROTOCOL)
 
         os.replace(new_location, location)
 
@@ -1471,6 +1654,9 @@ class Playlist:
         """
         Loads the content of the playlist from a given location
 
+        Both the binary format written by :meth:`save_to_location` and
+        the text format of older versions are supported.
+
         :param location: the location to load from
         :type location: string
         """
@@ -1480,12 +1666,75 @@ class Playlist:
         f = None
         for loc in [location, location + ".new"]:
             try:
-                f = open(loc, 'r')
+                f = open(loc, 'rb')
                 break
             except Exception:
                 pass
         if not f:
             return
+
+        with f:
+            if f.read(len(BINARY_PLAYLIST_MAGIC)) == BINARY_PLAYLIST_MAGIC:
+                trs, items = self.__load_binary(f)
+            else:
+                f.seek(0)
+                trs, items = self.__load_text(io.TextIOWrapper(f))
+
+        self.__tracks[:] = trs
+        self.__update_lookup_tables()
+
+        for item, val in items.items():
+            if item in self.save_attrs:
+                try:
+                    setattr(self, item, val)
+                except TypeError:  # don't bail if we try to set an invalid mode
+                    logger.debug(
+                        "Got a TypeError when trying to set attribute %s to %s during playlist restore.",
+                        item,
+                        val,
+                    )
+
+    def __load_binary(self, f):
+        """
+        Reads the tracks and attributes saved by :meth:`save_to_location`
+
+        Tracks that are already known, usually because they are in the
+        collection, are looked up by their uri as saved. The others are
+        created with the saved tags, and their files are read in the
+        background.
+        """
+        pdata = pickle.load(f)
+
+        ver = pdata['version']
+        if ver[0] > self.__playlist_format_version[0]:
+            raise IOError("Cannot load playlist, unknown format")
+        elif ver > self.__playlist_format_version:
+            logger.warning(
+                "Playlist created on a newer Exaile version, some attributes may not be handled."
+            )
+
+        known = []
+        unknown = []
+        for uri, tags in zip(pdata['uris'], pdata['meta']):
+            track = trax.Track._get_known_track(uri)
+            if track is None:
+                track = trax.Track(uri=uri, scan=False)
+                for tag, value in tags.items():
+                    track.set_tag_raw(tag, value, notify_changed=False)
+                if track.is_local():
+                    unknown.append(track)
+            known.append(track)
+
+        if unknown:
+            _read_tags_in_background(unknown)
+
+        return [known[index] for index in pdata['tracks']], pdata['attrs']
+
+    def __load_text(self, f):
+        """
+        Reads the tracks and attributes of a playlist saved in the text
+        format of older versions
+        """
         locs = []
         while True:
             line = f.readline()
@@ -1516,7 +1765,6 @@ class Playlist:
             logger.warning(
                 "Playlist created on a newer Exaile version, some attributes may not be handled."
             )
-        f.close()
 
         trs = []
 
@@ -1540,18 +1788,7 @@ class Playlist:
 
             trs.append(track)
 
-        self.__tracks[:] = trs
-
-        for item, val in items.items():
-            if item in self.save_attrs:
-                try:
-                    setattr(self, item, val)
-                except TypeError:  # don't bail if we try to set an invalid mode
-                    logger.debug(
-                        "Got a TypeError when trying to set attribute %s to %s during playlist restore.",
-                        item,
-                        val,
-                    )
+        return trs, items
 
     def reverse(self):
         # reverses current view
@@ -1565,7 +1802,10 @@ class Playlist:
         return len(self.__tracks)
 
     def __contains__(self, track):
-        return track in self.__tracks
+        try:
+            return track in self.__get_positions()
+        except TypeError:  # unhashable, so can't be a track
+            return False
 
     def __tuple_from_slice(self, i):
         """
@@ -1594,6 +1834,7 @@ class Playlist:
         removed = MetadataList()
         added = MetadataList()
         oldpos = self.current_position
+        oldlen = len(self.__tracks)
 
         if isinstance(i, slice):
             for x in value:
@@ -1625,6 +1866,8 @@ class Playlist:
             removed = [(i, oldtracks)]
             added = [(i, value)]
 
+        self.__update_lookup_tables(oldlen, removed, added)
+
         self.on_tracks_changed()
 
         if removed:
@@ -1640,6 +1883,7 @@ class Playlist:
             (start, end, step) = self.__tuple_from_slice(i)
         oldtracks = self.__getitem__(i)
         oldpos = self.current_position
+        oldlen = len(self.__tracks)
         self.__tracks.__delitem__(i)
         removed = MetadataList()
 
@@ -1650,6 +1894,7 @@ class Playlist:
         else:
             removed = [(i, oldtracks)]
 
+        self.__update_lookup_tables(oldlen, removed)
         self.on_tracks_changed()
         event.log_event('playlist_tracks_removed', self, removed)
         self.__adjust_current_pos(oldpos, removed, [])
@@ -1681,7 +1926,10 @@ class Playlist:
         :returns: the count
         :rtype: int
         """
-        return self.__tracks.count(other)
+        try:
+            return len(self.__get_positions().get(other, ()))
+        except TypeError:  # unhashable, so can't be a track
+            return 0
 
     def index(self, item, start=0, end=None):
         """
@@ -1690,10 +1938,15 @@ class Playlist:
         :returns: the index
         :rtype: int
         """
-        if end is None:
-            return self.__tracks.index(item, start)
-        else:
-            return self.__tracks.index(item, start, end)
+        start, end, _step = slice(start, end).indices(len(self.__tracks))
+        try:
+            positions = self.__get_positions().get(item, ())
+        except TypeError:  # unhashable, so can't be a track
+            positions = ()
+        i = bisect.bisect_left(positions, start)
+        if i < len(positions) and positions[i] < end:
+            return positions[i]
+        raise ValueError("%r is not in playlist" % (item,))
 
     def pop(self, i=-1):
         """
@@ -1714,6 +1967,10 @@ class Playlist:
             if self.dynamic_mode != 'disabled':
                 self.__fetch_dynamic_tracks()
 
+    def on_track_tags_changed(self, event_type, track, tags):
+        if 'album' in tags:
+            self.__album_positions = None
+
     def on_tracks_changed(self, *args):
         for idx in range(len(self.__tracks)):
             if self.__tracks.get_meta_key(idx, "playlist_current_position"):
@@ -43,6 +43,7 @@ class ProviderManager:
 
     def __init__(self):
         self.services = {}
+        self.generations = {}
 
     def register_provider(self, servicename, provider, target=None):
         """
@@ -71,6 +72,7 @@ class ProviderManager:
         providers = service.setdefault(target, [])
         if provider not in providers:
             providers.append(provider)
+            self.generations[servicename] = self.get_generation(servicename) + 1
             logger.debug(
                 "Provider %(provider)s registered for service %(service)s "
                 "with target %(target)s"
@@ -95,6 +97,7 @@ class ProviderManager:
             service = self.services[servicename]
             if provider in service[target]:
                 service[target].remove(provider)
+                self.generations[servicename] = self.get_generation(servicename) + 1
                 logger.debug(
                     "Provider %(provider)s unregistered from "
                     "service %(service)s with target %(target)s"
@@ -146,6 +149,18 @@ class ProviderManager:
 
         return specific + generic
 
+    def get_generation(self, servicename):
+        """
+        Returns a number that changes whenever a provider is registered
+        for or unregistered from a service, so that consumers can cache
+        what they looked up
+
+        :param servicename: the service name
+        :type servicename: string
+        :rtype: int
+        """
+        return self.generations.get(servicename, 0)
+
     def get_provider(self, servicename, providername, target=None):
         """
         Returns a single identified provider
@@ -174,6 +189,7 @@ register = MANAGER.register_provider
 unregister = MANAGER.unregister_provider
 get = MANAGER.get_providers
 get_provider = MANAGER.get_provider
+get_generation = MANAGER.get_generation
 
 
 class ProviderHandler:
@@ -24,10 +24,15 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+from gi.repository import GLib
 from gi.repository import Gst
 
 from xl.nls import gettext as _
+import collections
+import hashlib
+import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -208,12 +213,18 @@ class Transcoder:
 
     def stop(self):
         self.pipe.set_state(Gst.State.NULL)
+        if self.bus is not None:
+            self.bus.remove_signal_watch()
+            self.bus = None
         self.running = False
         self.__last_time = 0.0
         self.end_cb()
 
     def on_error(self, bus, message):
         self.pipe.set_state(Gst.State.NULL)
+        if self.bus is not None:
+            self.bus.remove_signal_watch()
+            self.bus = None
         self.running = False
         gerror, message_string = message.parse_error()
         self.error_cb(gerror, message_string)
@@ -236,3 +247,318 @@ class Transcoder:
 
     def is_running(self):
         return self.running
+
+
+class TranscodeJob:
+    """
+    A single file to be transcoded by a :class:`TranscodeQueue`
+
+    :ivar state: one of 'pending', 'skipped', 'running', 'done',
+                 'cancelled' or 'error'
+    :ivar error: the error message if the state is 'error'
+    """
+
+    def __init__(self, queue, input, output, length, raw, callback):
+        self.queue = queue
+        self.input = input
+        self.output = output
+        self.length = length
+        self.raw = raw
+        self.callback = callback
+        self.state = 'pending'
+        self.error = None
+        self.fingerprint = None
+        self.transcoder = None
+
+    def cancel(self):
+        """
+        Cancels the job; a partially written output file is removed
+        """
+        self.queue._cancel_job(self)
+
+    def get_progress(self):
+        """
+        :returns: how much of the job is done, between 0.0 and 1.0
+        """
+        if self.state in ('pending', 'cancelled'):
+            return 0.0
+        if self.state != 'running':
+            return 1.0
+        if not self.length:
+            return 0.0
+        return min(self.transcoder.get_time() / self.length, 1.0)
+
+    def is_finished(self):
+        return self.state not in ('pending', 'running')
+
+
+class TranscodeQueue:
+    """
+    Transcodes many files to the same format, running several pipelines
+    at the same time
+
+    Jobs whose output file exists and was created from the same source
+    file with the same settings (according to the manifest file) are
+    skipped, so converting a whole library can be interrupted and run
+    again.
+
+    GStreamer reports pipeline messages on the main loop, so the queue
+    must be used from the main thread.
+    """
+
+    #: seconds between finishing a job and saving the manifest
+    MANIFEST_SAVE_DELAY = 5
+
+    def __init__(
+        self, destformat, quality, end_callback=None, max_jobs=None, manifest=None
+    ):
+        """
+        :param destformat: name of the output format, see :data:`FORMATS`
+        :param quality: encoder quality, one of the format's raw_steps
+        :param end_callback: called with the queue when all jobs are
+                             finished
+        :param max_jobs: number of files to transcode at the same time,
+                         defaults to the number of processors
+        :param manifest: path of a file remembering which source each
+                         output file was created from, or None to never
+                         skip a job
+        """
+        self.dest_format = destformat
+        self.quality = quality
+        self.end_cb = end_callback
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.manifest_path = manifest
+        self.manifest = self.__load_manifest()
+        self.__save_id = None
+        self.jobs = []
+        self.__pending = collections.deque()
+        self.__running = []
+        self.__idle_transcoders = []
+        self.__cancelling = False
+        self.started = False
+
+    def add(self, input, output, length=None, raw=False, callback=None):
+        """
+        Adds a file to transcode
+
+        :param input: path of the source file, or a raw GStreamer
+                      source description if raw is True
+        :param output: path of the file to write
+        :param length: length of the source in seconds, used to weight
+                       the progress of the queue
+        :param callback: called with the job when it is finished
+        :returns: the :class:`TranscodeJob`
+        """
+        job = TranscodeJob(self, input, output, length, raw, callback)
+        self.jobs.append(job)
+
+        if not raw and self.manifest is not None:
+            job.fingerprint = self.__get_fingerprint(input)
+            if (
+                job.fingerprint is not None
+                and self.manifest.get(output) == job.fingerprint
+                and os.path.exists(output)
+            ):
+                logger.debug("Skipping up to date %s", output)
+                job.state = 'skipped'
+                return job
+
+        self.__pending.append(job)
+        if self.started:
+            self.__start_jobs()
+        return job
+
+    def start(self):
+        """
+        Starts transcoding the queued files
+        """
+        self.started = True
+        self.__start_jobs()
+        if not self.__running:
+            # every job was skipped
+            self.__check_end()
+
+    def cancel(self):
+        """
+        Cancels all the jobs that are not finished yet
+        """
+        self.started = False
+        self.__cancelling = True
+        try:
+            for job in list(self.__pending) + self.__running:
+                self._cancel_job(job)
+        finally:
+            self.__cancelling = False
+        self.__check_end()
+
+    def get_progress(self):
+        """
+        :returns: how much of all the jobs is done, between 0.0 and 1.0,
+                  jobs are weighted by their length
+        """
+        total = done = 0.0
+        for job in self.jobs:
+            if job.state == 'cancelled':
+                continue
+            weight = job.length or 1.0
+            total += weight
+            done += job.get_progress() * weight
+        if not total:
+            return 1.0
+        return done / total
+
+    def is_running(self):
+        return bool(self.__running or (self.started and self.__pending))
+
+    def __start_jobs(self):
+        while self.__pending and len(self.__running) < self.max_jobs:
+            job = self.__pending.popleft()
+
+            directory = os.path.dirname(job.output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            # Pipelines are rebuilt for every file: the delayed links that
+            # Gst.parse_launch sets up for decodebin only work once. The
+            # Transcoder objects are reused though.
+            if self.__idle_transcoders:
+                tr = self.__idle_transcoders.pop()
+                tr.error_cb = lambda gerror, msg, job=job: self.__on_error(job, msg)
+                tr.end_cb = lambda job=job: self.__on_end(job)
+            else:
+                tr = Transcoder(
+                    self.dest_format,
+                    self.quality,
+                    lambda gerror, msg, job=job: self.__on_error(job, msg),
+                    lambda job=job: self.__on_end(job),
+                )
+
+            if job.raw:
+                tr.set_raw_input(job.input)
+            else:
+                tr.set_input(job.input)
+            tr.set_output(job.output)
+
+            job.transcoder = tr
+            job.state = 'running'
+            self.__running.append(job)
+            try:
+                tr.start_transcode()
+            except GLib.Error as e:
+                self.__on_error(job, str(e))
+
+    def _cancel_job(self, job):
+        if job.state == 'pending':
+            self.__pending.remove(job)
+        elif job.state == 'running':
+            # stop() calls __on_end, which needs to know about this
+            job.state = 'cancelled'
+            job.transcoder.stop()
+        else:
+            return
+
+        job.state = 'cancelled'
+        self.__remove_output(job)
+        self.__job_finished(job)
+
+    def __on_end(self, job):
+        if job.state != 'running':
+            return
+
+        job.state = 'done'
+        if job.fingerprint is not None:
+            self.manifest[job.output] = job.fingerprint
+            # so that little is lost if Exaile quits before the end
+            if self.__save_id is None:
+                self.__save_id = GLib.timeout_add_seconds(
+                    self.MANIFEST_SAVE_DELAY, self.__on_save_timeout
+                )
+        self.__job_finished(job)
+
+    def __on_error(self, job, message):
+        if job.state != 'running':
+            return
+
+        logger.error("Error transcoding %s: %s", job.input, message)
+        job.state = 'error'
+        job.error = message
+        self.__remove_output(job)
+        self.__job_finished(job)
+
+    def __job_finished(self, job):
+        if job in self.__running:
+            self.__running.remove(job)
+            self.__idle_transcoders.append(job.transcoder)
+        job.transcoder = None
+
+        if job.callback is not None:
+            job.callback(job)
+
+        if self.started:
+            self.__start_jobs()
+
+        if not self.__cancelling:
+            self.__check_end()
+
+    def __check_end(self):
+        if not self.is_running():
+            self.__save_manifest()
+            if self.end_cb is not None:
+                self.end_cb(self)
+
+    def __remove_output(self, job):
+        try:
+            os.remove(job.output)
+        except OSError:
+            pass
+        if self.manifest is not None:
+            self.manifest.pop(job.output, None)
+
+    def __get_fingerprint(self, path):
+        """
+        Identifies the source file and the encoder settings, so that
+        an output can be reused if neither has changed
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        data = '%s\0%d\0%d\0%s\0%s' % (
+            os.path.abspath(path),
+            st.st_size,
+            st.st_mtime_ns,
+            self.dest_format,
+            self.quality,
+        )
+        return hashlib.sha1(data.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def __load_manifest(self):
+        if self.manifest_path is None:
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Could not read %s", self.manifest_path, exc_info=True)
+            return {}
+
+    def __on_save_timeout(self):
+        self.__save_id = None
+        self.__save_manifest()
+        return False
+
+    def __save_manifest(self):
+        if self.__save_id is not None:
+            GLib.source_remove(self.__save_id)
+            self.__save_id = None
+        if self.manifest_path is None:
+            return
+        tmp = self.manifest_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.manifest, f)
+            os.replace(tmp, self.manifest_path)
+        except OSError:
+            logger.warning("Could not write %s", self.manifest_path, exc_info=True)
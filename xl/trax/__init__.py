@@ -40,6 +40,7 @@ from xl.trax.search import (
     TracksMatcher,
     TracksInList,
     TracksNotInList,
+    TrackSearchIndex,
     match_track_from_string,
 )
 from xl.trax.util import (
@@ -47,6 +48,7 @@ from xl.trax.util import (
     get_album_tracks,
     get_uris_from_tracks,
     get_tracks_from_uri,
+    get_sort_keys,
     sort_tracks,
     sort_result_tracks,
     get_rating_from_tracks,
@@ -0,0 +1,241 @@
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+"""
+Append-only journal used by :class:`xl.trax.TrackDB` to persist changes
+without rewriting its shelf.
+
+The journal is a sequence of pickled records. Each record describes one
+change made to the database since its shelf was last written in full:
+
+* ``('add', key, (tags, key, attrs))`` -- a new track, stored in the
+  same form as the ``tracks-<key>`` shelf entries
+* ``('tags', key, values, removed)`` -- tags set or removed on a track
+* ``('del', key)`` -- a track was removed
+* ``('attrs', values)`` -- new values for non-track pickle attributes
+
+Records are only ever appended, so a save costs as much as the changes
+it records. The journal is replayed on load and emptied once its
+contents have been merged back into the shelf.
+"""
+
+import logging
+import os
+import pickle
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+from xl import common
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = 'exaile-trackdb-journal'
+_VERSION = 1
+
+
+class JournalReplay:
+    """
+    The merged result of replaying a journal.
+
+    Only the final state of each track is kept, so applying the replay
+    to the shelf contents costs one operation per changed track.
+    """
+
+    def __init__(self):
+        #: track key -> (tags, key, attrs) for tracks not yet in the shelf
+        self.added: Dict[int, Tuple[dict, int, dict]] = {}
+        #: track key -> (values, removed) to apply on top of the shelf data
+        self.updated: Dict[int, Tuple[dict, Set[str]]] = {}
+        #: track keys removed since the last full save
+        self.deleted: Set[int] = set()
+        #: latest values of the non-track pickle attributes
+        self.attrs: Dict[str, Any] = {}
+        #: number of records that were replayed
+        self.count = 0
+
+    def __bool__(self):
+        return self.count > 0
+
+    def _add(self, key: int, data: Tuple[dict, int, dict]) -> None:
+        self.deleted.discard(key)
+        self.updated.pop(key, None)
+        self.added[key] = data
+
+    def _set_tags(self, key: int, values: dict, removed: Iterable[str]) -> None:
+        if key in self.deleted:
+            return
+        try:
+            tags = self.added[key][0]
+        except KeyError:
+            prev_values, prev_removed = self.updated.setdefault(key, ({}, set()))
+            prev_values.update(values)
+            prev_removed.difference_update(values)
+            prev_removed.update(removed)
+            for tag in removed:
+                prev_values.pop(tag, None)
+        else:
+            tags.update(values)
+            for tag in removed:
+                tags.pop(tag, None)
+
+    def _delete(self, key: int) -> None:
+        self.added.pop(key, None)
+        self.updated.pop(key, None)
+        self.deleted.add(key)
+
+    def apply(self, data: Tuple[dict, int, dict]) -> Tuple[dict, int, dict]:
+        """
+        Applies journaled tag changes to a track entry read from the shelf
+
+        :param data: the (tags, key, attrs) tuple stored in the shelf
+        :returns: the updated tuple
+        """
+        try:
+            values, removed = self.updated[data[1]]
+        except KeyError:
+            return data
+        tags = data[0]
+        tags.update(values)
+        for tag in removed:
+            tags.pop(tag, None)
+        return data
+
+    def add_record(self, record: tuple) -> None:
+        op = record[0]
+        if op == 'tags':
+            self._set_tags(record[1], record[2], record[3])
+        elif op == 'add':
+            self._add(record[1], record[2])
+        elif op == 'del':
+            self._delete(record[1])
+        elif op == 'attrs':
+            self.attrs.update(record[1])
+        else:
+            raise ValueError("Unknown journal record %r" % (op,))
+        self.count += 1
+
+
+class TrackDBJournal:
+    """
+    Reads and writes the journal file of a :class:`xl.trax.TrackDB`
+
+    :param location: path of the journal file
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+        # end of the last intact record found by replay(), if any
+        self._valid_size = None
+
+    def __iter_records(self) -> Iterator[tuple]:
+        try:
+            fp = open(self.location, 'rb')
+        except FileNotFoundError:
+            return
+
+        with fp:
+            try:
+                header = pickle.load(fp)
+            except EOFError:
+                return
+            except Exception:
+                logger.warning("Unreadable journal header in %s", self.location)
+                self._valid_size = 0
+                return
+            self._valid_size = fp.tell()
+            if header[0] != _MAGIC:
+                raise ValueError("%s is not a TrackDB journal" % self.location)
+            if header[1] > _VERSION:
+                raise common.VersionError(
+                    "Journal was created on a newer Exaile version."
+                )
+
+            while True:
+                try:
+                    record = pickle.load(fp)
+                except EOFError:
+                    return
+                except Exception:
+                    # Most likely a record that was only partially written
+                    # because we crashed or ran out of disk space. Anything
+                    # following it cannot be trusted.
+                    logger.warning(
+                        "Truncated record in %s, ignoring the rest of the journal",
+                        self.location,
+                        exc_info=True,
+                    )
+                    return
+                self._valid_size = fp.tell()
+                yield record
+
+    def replay(self) -> JournalReplay:
+        """
+        Reads all records in the journal
+
+        :returns: the merged changes recorded in the journal
+        """
+        replay = JournalReplay()
+        for record in self.__iter_records():
+            replay.add_record(record)
+        return replay
+
+    def append(self, records: Iterable[tuple]) -> None:
+        """
+        Appends records to the journal and flushes them to disk
+        """
+        if self._valid_size is not None:
+            # drop a partially written record so that new records stay
+            # readable
+            if self.get_size() > self._valid_size:
+                os.truncate(self.location, self._valid_size)
+            self._valid_size = None
+
+        with open(self.location, 'ab') as fp:
+            if fp.tell() == 0:
+                pickle.dump((_MAGIC, _VERSION), fp, common.PICKLE_PROTOCOL)
+            for record in records:
+                pickle.dump(record, fp, common.PICKLE_PROTOCOL)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def clear(self) -> None:
+        """
+        Empties the journal. Only call this after its contents have been
+        written to the shelf.
+        """
+        self._valid_size = None
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def get_size(self) -> int:
+        """
+        :returns: the size of the journal file in bytes
+        """
+        try:
+            return os.path.getsize(self.location)
+        except OSError:
+            return 0
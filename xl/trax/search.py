@@ -24,13 +24,23 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+import threading
 import time
 import re
-from typing import Collection
+from typing import Collection, Dict, Iterable, Iterator, Optional, Set, Tuple
 
+from xl import event
 from xl.unicode import shave_marks
 
-__all__ = ['TracksMatcher', 'search_tracks']
+__all__ = ['TracksMatcher', 'TrackSearchIndex', 'search_tracks']
+
+
+def _lower(value):
+    return value.lower()
+
+
+def _identity(value):
+    return value
 
 
 class SearchResultTrack:
@@ -79,12 +89,37 @@ class _Matcher:
     def _matches(self, value):
         raise NotImplementedError
 
+    def _matches_item(self, item):
+        if item is not None:
+            item = self.lower(item)
+        return self._matches(item)
+
+    def _candidates(self, index):
+        """
+        Finds the tracks that match this condition using an index
+
+        :returns: a (tracks, exact) tuple, where exact is False if the
+            tracks may include some that don't match; or None if the
+            index cannot be used for this condition.
+        """
+        tracks = index.find(self.tag, self._matches_item)
+        if tracks is None:
+            return None
+        return tracks, True
+
 
 class _ExactMatcher(_Matcher):
     """
     Condition for exact matches
     """
 
+    def _candidates(self, index):
+        if self.lower is _identity and not self.tag.startswith("__"):
+            tracks = index.lookup(self.tag, self.content)
+            if tracks is not None:
+                return tracks, True
+        return _Matcher._candidates(self, index)
+
     def _matches(self, value):
         if self.tag.startswith("__"):
             try:
@@ -131,6 +166,11 @@ class _RegexMatcher(_Matcher):
         except TypeError:
             return False
 
+    def _candidates(self, index):
+        # not worth it, regular expressions are usually used to narrow
+        # down a search rather than as its only condition
+        return None
+
 
 class _GtMatcher(_Matcher):
     """
@@ -177,6 +217,12 @@ class _NotMetaMatcher:
     def match(self, srtrack):
         return not self.matcher.match(srtrack)
 
+    def _candidates(self, index):
+        result = _get_candidates(self.matcher, index)
+        if result is None or not result[1]:
+            return None
+        return index.get_all() - result[0], True
+
 
 class _OrMetaMatcher:
     """
@@ -192,6 +238,9 @@ class _OrMetaMatcher:
     def match(self, srtrack):
         return self.left.match(srtrack) or self.right.match(srtrack)
 
+    def _candidates(self, index):
+        return _union_candidates((self.left, self.right), index)
+
 
 class _MultiMetaMatcher:
     """
@@ -210,6 +259,9 @@ class _MultiMetaMatcher:
                 return False
         return True
 
+    def _candidates(self, index):
+        return _intersect_candidates(self.matchers, index)
+
 
 class _ManyMultiMetaMatcher:
     """
@@ -240,6 +292,46 @@ class _ManyMultiMetaMatcher:
                     self.tags.update(ma.tags)
         return matched
 
+    def _candidates(self, index):
+        return _union_candidates(self.matchers, index)
+
+
+def _get_candidates(matcher, index):
+    try:
+        candidates = matcher._candidates
+    except AttributeError:  # e.g. a matcher defined by a plugin
+        return None
+    return candidates(index)
+
+
+def _union_candidates(matchers, index):
+    tracks = set()
+    exact = True
+    for ma in matchers:
+        result = _get_candidates(ma, index)
+        if result is None:
+            return None
+        tracks |= result[0]
+        exact = exact and result[1]
+    return tracks, exact
+
+
+def _intersect_candidates(matchers, index):
+    tracks = None
+    exact = True
+    for ma in matchers:
+        result = _get_candidates(ma, index)
+        if result is None:
+            exact = False
+            continue
+        tracks = result[0] if tracks is None else tracks & result[0]
+        exact = exact and result[1]
+        if not tracks:
+            break
+    if tracks is None:
+        return None
+    return tracks, exact
+
 
 class TracksMatcher:
     """
@@ -298,6 +390,9 @@ class TracksMatcher:
             return True
         return False
 
+    def _candidates(self, index):
+        return _intersect_candidates(self.matchers, index)
+
     def __tokens_to_matchers(self, tokens, matchers=None):
         """
         Converts a token hierarchy to a list of matchers
@@ -340,9 +435,9 @@ class TracksMatcher:
         # normal token
         else:
             if not self.case_sensitive:
-                lower = lambda x: x.lower()
+                lower = _lower
             else:
-                lower = lambda x: x
+                lower = _identity
 
             # TODO: this stuff is kinda repetitive, can we consolidate
             # it? Maybe move some of this into the matcher classes?
@@ -514,6 +609,9 @@ class TracksInList:
     def match(self, track):
         return track.track in self._tracks
 
+    def _candidates(self, index):
+        return set(self._tracks), True
+
 
 class TracksNotInList(TracksInList):
     """
@@ -523,15 +621,244 @@ class TracksNotInList(TracksInList):
     def match(self, track):
         return track.track not in self._tracks
 
+    def _candidates(self, index):
+        return index.get_all() - self._tracks, True
+
+
+class TrackSearchIndex:
+    """
+    Inverted index of the tracks in a :class:`xl.trax.TrackDB`, used
+    by :func:`search_tracks` to only look at tracks that can match.
+
+    For each tag that is searched for, maps every value of the tag to
+    the tracks that have it. Tags are indexed the first time they are
+    searched for, and kept up to date through the ``tracks_added``,
+    ``tracks_removed`` and ``track_tags_changed`` events.
 
-def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher]):
+    The tracks of the TrackDB are only looked at when the index is first
+    used, so that creating it doesn't load the tracks of a TrackDB that
+    were not needed yet.
+
+    :param trackdb: the TrackDB to index
+    """
+
+    def __init__(self, trackdb):
+        self.trackdb = trackdb
+        self._lock = threading.RLock()
+        # track -> loc, or None until the index is first used
+        self._tracks: Optional[Dict[object, str]] = None
+        self._by_loc: Dict[str, object] = {}
+        # tag -> value -> tracks, or None if the tag can't be indexed
+        self._values: Dict[str, Optional[Dict[object, Set[object]]]] = {}
+        # tag -> track -> values
+        self._track_values: Dict[str, Dict[object, Tuple]] = {}
+
+        event.add_callback(self.on_tracks_added, 'tracks_added', trackdb)
+        event.add_callback(self.on_tracks_removed, 'tracks_removed', trackdb)
+        event.add_callback(self.on_track_tags_changed, 'track_tags_changed')
+
+    def __contains__(self, track):
+        tracks = self._tracks
+        return tracks is not None and track in tracks
+
+    def __len__(self):
+        with self._lock:
+            return len(self.__get_tracks())
+
+    def close(self) -> None:
+        """
+        Stops updating the index
+        """
+        event.remove_callback(self.on_tracks_added, 'tracks_added', self.trackdb)
+        event.remove_callback(self.on_tracks_removed, 'tracks_removed', self.trackdb)
+        event.remove_callback(self.on_track_tags_changed, 'track_tags_changed')
+
+    @staticmethod
+    def __get_search_values(track, tag):
+        # same conversion as _Matcher.match
+        vals = track.get_tag_search(tag, format=False)
+        if vals == '__null__':
+            vals = None
+        if not isinstance(vals, list):
+            vals = [vals]
+        return tuple(vals)
+
+    def __index_track(self, tag, track):
+        values = self._values[tag]
+        vals = self.__get_search_values(track, tag)
+        for val in vals:
+            try:
+                values.setdefault(val, set()).add(track)
+            except TypeError:  # unhashable
+                return False
+        self._track_values[tag][track] = vals
+        return True
+
+    def __unindex_track(self, tag, track):
+        values = self._values[tag]
+        for val in self._track_values[tag].pop(track, ()):
+            tracks = values.get(val)
+            if tracks is not None:
+                tracks.discard(track)
+                if not tracks:
+                    del values[val]
+
+    def __add_track(self, track):
+        loc = track.get_loc_for_io()
+        self._tracks[track] = loc
+        self._by_loc[loc] = track
+        for tag, values in self._values.items():
+            if values is not None and not self.__index_track(tag, track):
+                self.__drop_tag(tag)
+
+    def __remove_track(self, track):
+        loc = self._tracks.pop(track)
+        self._by_loc.pop(loc, None)
+        for tag, values in self._values.items():
+            if values is not None:
+                self.__unindex_track(tag, track)
+
+    def __get_tracks(self):
+        if self._tracks is None:
+            self._tracks = {}
+            for track in self.trackdb:
+                self.__add_track(track)
+        return self._tracks
+
+    def __drop_tag(self, tag):
+        self._values[tag] = None
+        self._track_values.pop(tag, None)
+
+    def __get_tag_values(self, tag):
+        try:
+            return self._values[tag]
+        except KeyError:
+            pass
+
+        tracks = self.__get_tracks()
+        self._values[tag] = {}
+        self._track_values[tag] = {}
+        for track in tracks:
+            if not self.__index_track(tag, track):
+                self.__drop_tag(tag)
+                break
+        return self._values[tag]
+
+    def get_all(self) -> Set[object]:
+        """
+        :returns: all indexed tracks
+        """
+        with self._lock:
+            return set(self.__get_tracks())
+
+    def get_ordered(self, tracks: Iterable[object]) -> Iterator[object]:
+        """
+        :param tracks: indexed tracks
+        :returns: the tracks, in the order in which the TrackDB holds them
+        """
+        with self._lock:
+            indexed = self.__get_tracks()
+            locs = {indexed.get(track) for track in tracks}
+        # only the holders of the wanted tracks are asked for their track,
+        # so tracks that were not loaded yet stay that way
+        for loc, holder in list(self.trackdb.tracks.items()):
+            if loc in locs:
+                yield holder._track
+
+    def lookup(self, tag: str, value) -> Optional[Set[object]]:
+        """
+        :returns: the tracks that have a value for a tag, or None if the
+            tag cannot be indexed
+        """
+        with self._lock:
+            values = self.__get_tag_values(tag)
+            if values is None:
+                return None
+            try:
+                return set(values.get(value, ()))
+            except TypeError:
+                return None
+
+    def find(self, tag: str, predicate) -> Optional[Set[object]]:
+        """
+        :param predicate: called with each distinct value of the tag
+        :returns: the tracks that have a value for which predicate returns
+            True, or None if the tag cannot be indexed
+        """
+        result = set()
+        with self._lock:
+            values = self.__get_tag_values(tag)
+            if values is None:
+                return None
+            for value, tracks in values.items():
+                if predicate(value):
+                    result |= tracks
+        return result
+
+    def get_candidates(
+        self, trackmatchers: Iterable[TracksMatcher]
+    ) -> Optional[Set[object]]:
+        """
+        :returns: the indexed tracks that may match all matchers, or None
+            if the index can't narrow down the search
+        """
+        result = _intersect_candidates(trackmatchers, self)
+        if result is None:
+            return None
+        return result[0]
+
+    def on_tracks_added(self, type, trackdb, locations):
+        with self._lock:
+            if self._tracks is None:
+                return
+            for loc in locations:
+                track = trackdb.get_track_by_loc(loc)
+                if track is not None and track not in self._tracks:
+                    self.__add_track(track)
+
+    def on_tracks_removed(self, type, trackdb, locations):
+        with self._lock:
+            if self._tracks is None:
+                return
+            for loc in locations:
+                track = self._by_loc.get(loc)
+                if track is not None:
+                    self.__remove_track(track)
+
+    def on_track_tags_changed(self, type, track, tags):
+        with self._lock:
+            if track not in self:
+                return
+            # derived values like albumartist can depend on other tags,
+            # so just reindex the track completely
+            self.__remove_track(track)
+            self.__add_track(track)
+
+
+def search_tracks(
+    trackiter,
+    trackmatchers: Collection[TracksMatcher],
+    index: Optional[TrackSearchIndex] = None,
+):
     """
     Search a set of tracks for those that match specified conditions.
 
     :param trackiter: An iterable object returning Track objects
     :param trackmatchers: A list of TrackMatcher objects
-    """
-    for srtr in trackiter:
+    :param index: An optional index of the tracks. Tracks that are
+        indexed but cannot match are skipped without being looked at.
+    """
+    candidates = None
+    if index is not None:
+        candidates = index.get_candidates(trackmatchers)
+        if candidates is not None and trackiter is index.trackdb:
+            trackiter = index.get_ordered(candidates)
+
+    for count, srtr in enumerate(trackiter):
+        if candidates is not None:
+            track = srtr.track if isinstance(srtr, SearchResultTrack) else srtr
+            if track not in candidates and track in index:
+                continue
         if not isinstance(srtr, SearchResultTrack):
             srtr = SearchResultTrack(srtr)
         if all(tma.match(srtr) for tma in trackmatchers):
@@ -543,11 +870,12 @@ def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher]):
         # Calling out to time.sleep forces a release of the GIL and
         # allows other threads to run. Benchmarks show this has no
         # noticable effect on search speed.
-        time.sleep(0)
+        if count % 64 == 0:
+            time.sleep(0)
 
 
 def search_tracks_from_string(
-    trackiter, search_string, case_sensitive=True, keyword_tags=None
+    trackiter, search_string, case_sensitive=True, keyword_tags=None, index=None
 ):
     """
     Convenience wrapper around search_tracks that builds matchers
@@ -561,7 +889,7 @@ def search_tracks_from_string(
             search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
         )
     ]
-    return search_tracks(trackiter, matchers)
+    return search_tracks(trackiter, matchers, index=index)
 
 
 def match_track_from_string(
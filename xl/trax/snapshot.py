@@ -0,0 +1,356 @@
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+"""
+Columnar, memory-mapped snapshot of the tracks stored in a
+:class:`xl.trax.TrackDB`.
+
+Loading a TrackDB from its shelf unpickles every track, which dominates
+startup time on large collections. A snapshot stores the same data with
+one column per tag and all strings interned in a single pool, so that it
+can be mapped into memory and opened without decoding anything. Rows are
+only decoded when the corresponding track is needed.
+
+The shelf remains the source of truth: a snapshot carries the serial
+number of the shelf it was written from and is ignored when the serial
+does not match.
+"""
+
+import array
+import itertools
+import logging
+import math
+import mmap
+import os
+import pickle
+import struct
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from xl import common
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'EXLSNAP\0'
+_VERSION = 1
+_PREAMBLE = struct.Struct('=8sII')
+
+#: Sentinel for missing values in string and integer columns
+_NO_STR = 0xFFFFFFFF
+_NO_INT = -(2**63)
+
+# column kinds
+_STR = 's'  # single string
+_STRLIST = 'l'  # list of strings
+_INT = 'i'
+_FLOAT = 'f'
+
+TrackData = Tuple[dict, int, dict]
+
+
+def _value_kind(value: Any) -> Optional[str]:
+    """
+    Determines which column kind can store a value, if any
+    """
+    vtype = type(value)
+    if vtype is str:
+        return _STR
+    if vtype is list and all(type(v) is str for v in value):
+        return _STRLIST
+    if vtype is int and value != _NO_INT and -(2**63) < value < 2**63:
+        return _INT
+    if vtype is float and not math.isnan(value):
+        return _FLOAT
+    return None
+
+
+class _Writer:
+    def __init__(self, rows: Sequence[TrackData]):
+        self.rows = rows
+        self.strings: Dict[str, int] = {}
+        self.sections: List[Tuple[str, bytes, str]] = []
+
+    def intern(self, value: str) -> int:
+        try:
+            return self.strings[value]
+        except KeyError:
+            idx = self.strings[value] = len(self.strings)
+            return idx
+
+    def add_section(self, name: str, data: array.array) -> None:
+        self.sections.append((name, data.tobytes(), data.typecode))
+
+    def build_column(
+        self, idx: int, tag: str, entries: List[Tuple[int, Any]]
+    ) -> Tuple[str, dict]:
+        """
+        :param entries: (row, value) of the rows that have the tag, in
+            row order
+        """
+        kinds: Dict[str, int] = {}
+        for _row, value in entries:
+            kind = _value_kind(value)
+            if kind is not None:
+                kinds[kind] = kinds.get(kind, 0) + 1
+        kind = max(kinds, key=kinds.get) if kinds else _STR
+
+        # values that don't fit the column are pickled separately
+        others = {}
+        if kind == _STRLIST:
+            starts = array.array('I', [0])
+            values = array.array('I')
+            for row, value in entries:
+                # rows without the tag have an empty list
+                starts.extend(itertools.repeat(len(values), row + 1 - len(starts)))
+                if _value_kind(value) == _STRLIST and value:
+                    values.extend(self.intern(v) for v in value)
+                else:
+                    others[row] = value
+                starts.append(len(values))
+            starts.extend(
+                itertools.repeat(len(values), len(self.rows) + 1 - len(starts))
+            )
+            self.add_section('%d.starts' % idx, starts)
+            self.add_section('%d.values' % idx, values)
+        else:
+            if kind == _STR:
+                column = array.array('I', [_NO_STR])
+                convert = self.intern
+            elif kind == _INT:
+                column = array.array('q', [_NO_INT])
+                convert = int
+            else:
+                column = array.array('d', [math.nan])
+                convert = float
+            column *= len(self.rows)
+            for row, value in entries:
+                if _value_kind(value) == kind:
+                    column[row] = convert(value)
+                else:
+                    others[row] = value
+            self.add_section('%d.values' % idx, column)
+
+        return kind, others
+
+    def write(self, path: str, serial: int) -> None:
+        # one pass over the rows; each column is then built from the rows
+        # which actually have its tag
+        entries: Dict[str, List[Tuple[int, Any]]] = {}
+        for row, (tags, _key, _attrs) in enumerate(self.rows):
+            for tag, value in tags.items():
+                try:
+                    entries[tag].append((row, value))
+                except KeyError:
+                    entries[tag] = [(row, value)]
+        # __loc first, so the reader can find it without a lookup
+        tagnames = ['__loc'] + sorted(tag for tag in entries if tag != '__loc')
+
+        columns = []
+        for idx, tag in enumerate(tagnames):
+            kind, others = self.build_column(idx, tag, entries.get(tag, []))
+            columns.append((tag, kind, others))
+
+        self.add_section('keys', array.array('q', (r[1] for r in self.rows)))
+
+        offsets = array.array('Q', [0])
+        pool = bytearray()
+        for value in self.strings:  # dicts keep insertion order
+            pool += value.encode('utf-8', 'surrogatepass')
+            offsets.append(len(pool))
+        self.add_section('strings.offsets', offsets)
+        self.sections.append(('strings.data', bytes(pool), 'B'))
+
+        layout = {}
+        pos = 0
+        for name, data, typecode in self.sections:
+            pos = (pos + 7) & ~7
+            layout[name] = (pos, len(data), typecode)
+            pos += len(data)
+
+        header = pickle.dumps(
+            {
+                'serial': serial,
+                'byteorder': sys.byteorder,
+                'rows': len(self.rows),
+                'columns': columns,
+                'attrs': {
+                    row: data[2] for row, data in enumerate(self.rows) if data[2]
+                },
+                'sections': layout,
+            },
+            common.PICKLE_PROTOCOL,
+        )
+        base = (_PREAMBLE.size + len(header) + 7) & ~7
+
+        tmp = path + '.new'
+        with open(tmp, 'wb') as fp:
+            fp.write(_PREAMBLE.pack(_MAGIC, _VERSION, len(header)))
+            fp.write(header)
+            for name, data, _typecode in self.sections:
+                fp.seek(base + layout[name][0])
+                fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+
+
+def write_snapshot(path: str, serial: int, rows: Iterable[TrackData]) -> None:
+    """
+    Writes a snapshot of tracks
+
+    :param path: the file to write
+    :param serial: serial number of the shelf the rows were saved to
+    :param rows: (tags, key, attrs) tuples, as stored in the shelf
+    """
+    _Writer(list(rows)).write(path, serial)
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped snapshot written by :func:`write_snapshot`
+
+    :param path: the snapshot file to open
+    :raises ValueError: if the file is not a usable snapshot
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, header_len = _PREAMBLE.unpack_from(self._mmap)
+            if magic != _MAGIC:
+                raise ValueError("%s is not a snapshot" % path)
+            if version != _VERSION:
+                raise ValueError("Unsupported snapshot version %d" % version)
+            header = pickle.loads(
+                self._mmap[_PREAMBLE.size : _PREAMBLE.size + header_len]
+            )
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError("Snapshot was written on another architecture")
+        except Exception:
+            self._mmap.close()
+            raise
+
+        base = (_PREAMBLE.size + header_len + 7) & ~7
+        view = memoryview(self._mmap)
+        self._sections = {}
+        for name, (offset, length, typecode) in header['sections'].items():
+            section = view[base + offset : base + offset + length]
+            self._sections[name] = section.cast(typecode)
+
+        self.serial: int = header['serial']
+        self._rows: int = header['rows']
+        self._attrs: Dict[int, dict] = header['attrs']
+        self._columns = [
+            (idx, tag, kind, others)
+            for idx, (tag, kind, others) in enumerate(header['columns'])
+        ]
+        self._keys = self._sections['keys']
+        self._str_offsets = self._sections['strings.offsets']
+        self._str_data = self._sections['strings.data']
+        # decoded strings, so that equal values share one object
+        self._str_cache: List[Optional[str]] = [None] * (len(self._str_offsets) - 1)
+
+    def __len__(self):
+        return self._rows
+
+    def close(self) -> None:
+        """
+        Releases the mapping. Rows can no longer be read afterwards.
+        """
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self._mmap.close()
+
+    def _get_string(self, idx: int) -> str:
+        value = self._str_cache[idx]
+        if value is None:
+            start = self._str_offsets[idx]
+            end = self._str_offsets[idx + 1]
+            value = str(self._str_data[start:end], 'utf-8', 'surrogatepass')
+            self._str_cache[idx] = value
+        return value
+
+    def get_key(self, row: int) -> int:
+        """
+        :returns: the TrackDB key of a row
+        """
+        return self._keys[row]
+
+    def get_attrs(self, row: int) -> dict:
+        """
+        :returns: the TrackHolder attributes of a row
+        """
+        return dict(self._attrs.get(row, ()))
+
+    def get_loc(self, row: int) -> str:
+        """
+        :returns: the location of the track stored in a row
+        """
+        idx, _tag, kind, others = self._columns[0]
+        if kind == _STR:
+            value = self._sections['0.values'][row]
+            if value != _NO_STR:
+                return self._get_string(value)
+        return others[row]
+
+    def get_data(self, row: int) -> TrackData:
+        """
+        Decodes a row
+
+        :returns: a (tags, key, attrs) tuple, as stored in the shelf
+        """
+        sections = self._sections
+        tags = {}
+        for idx, tag, kind, others in self._columns:
+            if kind == _STRLIST:
+                starts = sections['%d.starts' % idx]
+                start = starts[row]
+                end = starts[row + 1]
+                if start != end:
+                    values = sections['%d.values' % idx]
+                    tags[tag] = [self._get_string(i) for i in values[start:end]]
+                    continue
+            else:
+                value = sections['%d.values' % idx][row]
+                if kind == _STR:
+                    if value != _NO_STR:
+                        tags[tag] = self._get_string(value)
+                        continue
+                elif kind == _INT:
+                    if value != _NO_INT:
+                        tags[tag] = value
+                        continue
+                elif value == value:  # not NaN
+                    tags[tag] = value
+                    continue
+            try:
+                tags[tag] = others[row]
+            except KeyError:
+                pass
+        return tags, self._keys[row], self.get_attrs(row)
@@ -39,7 +39,7 @@ from gi.repository import GLib
 
 from xl.metadata._base import BaseFormat
 import xl.unicode
-from xl import event, metadata, settings
+from xl import common, event, metadata, settings
 from xl.metadata.tags import disk_tags
 from xl.nls import gettext as _
 from xl.unicode import shave_marks
@@ -77,6 +77,28 @@ _no_set_raw = {'__basename', '__loc'} | disk_tags
 
 _unset = object()
 
+#: attributes of :class:`Gio.FileInfo` used by :func:`get_file_info_tags`
+FILE_INFO_ATTRIBUTES = "time::modified,standard::size,unix::inode"
+
+
+def get_file_info_tags(info: Gio.FileInfo) -> Dict[str, object]:
+    """
+    Gets the internal tags which record the state of a file when its
+    tags were last read. Comparing them with a fresh
+    :class:`Gio.FileInfo` tells whether the file needs to be read again.
+
+    :param info: file info queried with :data:`FILE_INFO_ATTRIBUTES`
+    :returns: a dict with the '__modified', '__filesize' and '__inode' tags
+    """
+    inode = None
+    if info.has_attribute('unix::inode'):
+        inode = info.get_attribute_uint64('unix::inode')
+    return {
+        '__modified': common.get_modification_time(info),
+        '__filesize': info.get_size(),
+        '__inode': inode,
+    }
+
 
 class _MetadataCacher(Generic[_K, _V]):
     """Time- and size-limited LRU cache"""
@@ -155,12 +177,25 @@ class Track:
     """
 
     # save a little memory this way
-    __slots__ = ["__tags", "_scan_valid", "_dirty", "__weakref__", "_init"]
+    __slots__ = [
+        "__tags",
+        "_scan_valid",
+        "_dirty",
+        "__weakref__",
+        "_init",
+        "_sort_cache",
+    ]
     # this is used to enforce the one-track-per-uri rule
     __tracksdict = weakref.WeakValueDictionary()
     # store a copy of the settings values here - much faster (0.25 cpu
     # seconds) (see _the_cuts_cb)
     __the_cuts = settings.get_option('collection/strip_list', [])
+    # functions that can create Tracks which haven't been loaded yet, see
+    # _add_lazy_source
+    __lazy_sources: List[weakref.WeakMethod] = []
+    # bumped whenever a setting that affects get_tag_sort changes, which
+    # invalidates the sort keys cached by all tracks
+    __sort_generation = 0
 
     def __new__(cls, *args, **kwargs):
         """
@@ -222,6 +257,11 @@ class Track:
                         tr.set_tags(**to_set)
 
             except KeyError:
+                if unpickles is None:
+                    tr = cls.__get_lazy_track(uri)
+                    if tr is not None:
+                        tr._init = False
+                        return tr
                 tr = object.__new__(cls)
                 cls.__tracksdict[uri] = tr
                 tr._init = True
@@ -233,6 +273,16 @@ class Track:
             tr._init = True
             return tr
 
+    @classmethod
+    def __get_lazy_track(cls, uri):
+        for source in cls.__lazy_sources:
+            func = source()
+            if func is not None:
+                tr = func(uri)
+                if tr is not None:
+                    return tr
+        return None
+
     def __init__(self, uri: Optional[str] = None, scan: bool = True, _unpickles=None):
         """
         :param uri: the location, as either a uri or a file path.
@@ -249,6 +299,9 @@ class Track:
 
         self.__tags = {}
         self._scan_valid = None  # whether our last tag read attempt worked
+        # (generation, {(tag, join, artist_compilations): value}), see
+        # get_tag_sort
+        self._sort_cache = None
 
         # This is not used by write_tags, this is used by the collection to
         # indicate that the tags haven't been written to the collection
@@ -291,6 +344,7 @@ class Track:
         self.__unregister()
         gloc = Gio.File.new_for_commandline_arg(loc)
         self.__tags['__loc'] = gloc.get_uri()
+        self._sort_cache = None
         self.__register()
         if notify_changed:
             event.log_event('track_tags_changed', self, {'__loc'})
@@ -385,40 +439,72 @@ class Track:
         :param force: If not True, then only read the tags if the file has
                       be modified.
 
-        Returns False if unsuccessful, and a Format object from
-        `xl.metadata` otherwise.
+        Returns False if unsuccessful, True if the file wasn't modified,
+        and a Format object from `xl.metadata` otherwise.
         """
         loc = self.get_loc_for_io()
         try:
-            f = metadata.get_format(loc)
-            if f is None:
-                self._scan_valid = False
-                return False  # not a supported type
+            modified = None if force else self.__tags.get('__modified', 0)
+            f, ntags = self._read_file_tags(loc, modified)
+        except Exception:
+            self._scan_valid = False
+            logger.exception("Error reading tags for %s", loc)
+            return False
+        return self._set_file_tags(f, ntags, notify_changed=notify_changed)
+
+    @staticmethod
+    def _read_file_tags(loc, modified=None):
+        """
+        Reads the tags of a file without modifying any Track. This only
+        does I/O, so it is safe to call from worker threads; apply the
+        result with :meth:`_set_file_tags`.
+
+        :param loc: the location of the file, as a uri
+        :param modified: if not None, don't read the tags unless the
+            file was modified after this time
+
+        :returns: (format, tags). format is None if the file type is not
+            supported or the file can't be read. If the file wasn't
+            modified, format is True and tags is None.
+        """
+        if metadata.get_format_class(loc) is None:
+            return None, None  # not a supported type
+
+        # Retrieve file specific metadata; the file is only parsed if
+        # the tags are actually needed
+        gloc = Gio.File.new_for_uri(loc)
+        info = gloc.query_info(FILE_INFO_ATTRIBUTES, Gio.FileQueryInfoFlags.NONE, None)
+        mtime = common.get_modification_time(info)
 
-            # Retrieve file specific metadata
-            gloc = Gio.File.new_for_uri(loc)
-            if hasattr(Gio.FileInfo, 'get_modification_date_time'):  # GLib >=2.62
-                mtime = (
-                    gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None)
-                    .get_modification_date_time()
-                    .to_unix()
-                )
-            else:  # Deprecated due to the Year 2038 problem
-                mtime = gloc.query_info(
-                    "time::modified", Gio.FileQueryInfoFlags.NONE, None
-                ).get_modification_time()
-                mtime = mtime.tv_sec + (mtime.tv_usec / 100000.0)
-
-            if not force and self.__tags.get('__modified', 0) >= mtime:
-                return f
-
-            # Read the tags
-            ntags = f.read_all()
-            ntags['__modified'] = mtime
-
-            # TODO: this probably breaks on non-local files
-            ntags['__basedir'] = gloc.get_parent().get_path()
+        if modified is not None and modified >= mtime:
+            return True, None
 
+        f = metadata.get_format(loc)
+        if f is None:
+            return None, None  # not readable
+
+        # Read the tags
+        ntags = f.read_all()
+        ntags.update(get_file_info_tags(info))
+
+        # TODO: this probably breaks on non-local files
+        ntags['__basedir'] = gloc.get_parent().get_path()
+        return f, ntags
+
+    def _set_file_tags(self, f, ntags, notify_changed=True):
+        """
+        Updates this Track with the result of :meth:`_read_file_tags`
+
+        Returns False if unsuccessful, True if the file wasn't modified,
+        and a Format object from `xl.metadata` otherwise.
+        """
+        if f is None:
+            self._scan_valid = False
+            return False
+        if ntags is None:
+            return f
+
+        try:
             # remove tags that could be in the file, but are in fact not
             # in the file. Retain tags in the DB that aren't supported by
             # the file format.
@@ -442,7 +528,7 @@ class Track:
             return f
         except Exception:
             self._scan_valid = False
-            logger.exception("Error reading tags for %s", loc)
+            logger.exception("Error reading tags for %s", self.get_loc_for_io())
             return False
 
     def is_local(self):
@@ -474,13 +560,34 @@ class Track:
         vals = map(self.get_tag_display, ('title', 'artist', 'album'))
         return "<Track %r by %r from %r>" % tuple(vals)
 
-    def _pickles(self):
+    def _pickles(self, deep=True):
         """
         returns a data repr of the track suitable for pickling
 
+        :param deep: if False, the tag values are not copied. Only use
+            this if the result is not kept around.
+
+        internal use only please
+        """
+        if deep:
+            return deepcopy(self.__tags)
+        return dict(self.__tags)
+
+    def _pickles_tags(self, tags):
+        """
+        returns a data repr of some of the track's tags suitable for
+        pickling, along with the set of those tags that are not present
+
         internal use only please
         """
-        return deepcopy(self.__tags)
+        values = {}
+        removed = set()
+        for tag in tags:
+            try:
+                values[tag] = deepcopy(self.__tags[tag])
+            except KeyError:
+                removed.add(tag)
+        return values, removed
 
     def _unpickles(self, pickle_obj):
         """
@@ -489,6 +596,7 @@ class Track:
         internal use only please
         """
         self.__tags = deepcopy(pickle_obj)
+        self._sort_cache = None
 
     def list_tags(self):
         """
@@ -576,6 +684,7 @@ class Track:
 
         if changed:
             self._dirty = True
+            self._sort_cache = None
             if notify_changed:
                 event.log_event("track_tags_changed", self, changed)
 
@@ -620,7 +729,30 @@ class Track:
             tag=="albumartist".
         :param extend_title: If the title tag is unknown, try to
             add some identifying information to it.
+
+        Results are cached until the track's tags change.
         """
+        if tag == '__rating':
+            # depends on the rating/maximum setting, and is cheap anyway
+            return self.get_rating()
+
+        key = (tag, join, artist_compilations)
+        cache = self._sort_cache
+        if cache is not None and cache[0] == Track.__sort_generation:
+            try:
+                return cache[1][key]
+            except KeyError:
+                pass
+        else:
+            cache = self._sort_cache = (Track.__sort_generation, {})
+
+        value = self.__get_tag_sort(tag, join, artist_compilations)
+        # lists are mutable, so only cache joined values
+        if not isinstance(value, list):
+            cache[1][key] = value
+        return value
+
+    def __get_tag_sort(self, tag, join, artist_compilations):
         # The two magic values here are to ensure that compilations
         # and unknown values are always sorted below all normal
         # values.
@@ -1069,6 +1201,7 @@ class Track:
         """
         if data == "collection/strip_list":
             cls._Track__the_cuts = settings.get_option('collection/strip_list', [])
+            cls._Track__sort_generation += 1
 
     ### Utility method intended for TrackDB ###
 
@@ -1077,5 +1210,42 @@ class Track:
         '''Internal API, returns number of track objects we have'''
         return len(cls._Track__tracksdict)
 
+    @classmethod
+    def _get_known_track(cls, uri: str) -> Optional['Track']:
+        """
+        Internal API. Returns the Track of a uri, if one already exists or
+        a lazy source can provide it. Unlike the constructor, this doesn't
+        normalize the uri, so it must be exactly as returned by
+        :meth:`get_loc_for_io`.
+
+        :returns: the Track, or None
+        """
+        tr = cls.__tracksdict.get(uri)
+        if tr is None:
+            tr = cls.__get_lazy_track(uri)
+        return tr
+
+    @classmethod
+    def _add_lazy_source(cls, func):
+        """
+        Internal API. Registers a bound method that is asked for the Track
+        of a uri before a new Track is created for it. This allows a
+        TrackDB to create its Tracks only when they are first needed,
+        while keeping one Track per uri.
+
+        :param func: bound method taking a uri and returning a Track or
+            None. Only a weak reference is kept.
+        """
+        cls._Track__lazy_sources.append(weakref.WeakMethod(func))
+
+    @classmethod
+    def _remove_lazy_source(cls, func):
+        '''Internal API, see _add_lazy_source'''
+        cls._Track__lazy_sources = [
+            source
+            for source in cls._Track__lazy_sources
+            if source() is not None and source() != func
+        ]
+
 
 event.add_callback(Track._the_cuts_cb, 'collection_option_set')
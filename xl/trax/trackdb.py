@@ -28,10 +28,14 @@
 from copy import deepcopy
 import logging
 from time import time
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from gi.repository import GLib
 
 from xl import common, event
 from xl.nls import gettext as _
+from xl.trax.journal import JournalReplay, TrackDBJournal
+from xl.trax.snapshot import Snapshot, write_snapshot
 from xl.trax.track import Track
 
 logger = logging.getLogger(__name__)
@@ -46,6 +50,49 @@ class TrackHolder:
     def __getattr__(self, attr):
         return getattr(self._track, attr)
 
+    def _is_dirty(self) -> bool:
+        return self._track._dirty
+
+    def _get_data(self, deep: bool = True) -> Tuple[dict, int, dict]:
+        """
+        :returns: the (tags, key, attrs) tuple that is stored in the shelf
+        """
+        return (self._track._pickles(deep), self._key, deepcopy(self._attrs))
+
+
+class SnapshotTrackHolder(TrackHolder):
+    """
+    Holds a track stored in a :class:`xl.trax.snapshot.Snapshot`. The
+    Track object is only created when it is first accessed.
+    """
+
+    def __init__(self, snapshot: Snapshot, row: int):
+        self._snapshot = snapshot
+        self._row = row
+        self._key = snapshot.get_key(row)
+        self._attrs = snapshot.get_attrs(row)
+        self._loaded_track: Optional[Track] = None
+
+    @property
+    def _track(self) -> Track:
+        track = self._loaded_track
+        if track is None:
+            track = Track(_unpickles=self._snapshot.get_data(self._row)[0])
+            self._loaded_track = track
+        return track
+
+    def _is_loaded(self) -> bool:
+        return self._loaded_track is not None
+
+    def _is_dirty(self) -> bool:
+        # tracks that were never created cannot have been changed
+        return self._loaded_track is not None and self._loaded_track._dirty
+
+    def _get_data(self, deep: bool = True) -> Tuple[dict, int, dict]:
+        if self._loaded_track is not None:
+            return TrackHolder._get_data(self, deep)
+        return self._snapshot.get_data(self._row)
+
 
 class TrackDBIterator:
     def __init__(self, track_iterator: Iterator[Tuple[str, TrackHolder]]):
@@ -76,14 +123,27 @@ class TrackDB:
             of :class:`Track` objects.
     :param load_first: Set to True if this collection should be
             loaded before any tracks are created.
+    :param journal: Set to True to save changes by appending them to a
+            journal next to `location` instead of writing them into
+            the shelf. The journal is merged into the shelf when it
+            grows large, and replayed when loading.
+    :param snapshot: Set to True to keep a columnar snapshot of the
+            shelf next to `location`. When it is up to date, loading
+            maps the snapshot into memory and only creates
+            :class:`Track` objects when they are first accessed.
     """
 
+    #: Size in bytes above which the journal is merged into the shelf
+    journal_merge_size = 4 * 1024 * 1024
+
     def __init__(
         self,
         name: str = "",
         location: str = "",
         pickle_attrs: List[str] = [],
         loadfirst: bool = False,
+        journal: bool = False,
+        snapshot: bool = False,
     ):
         """
         Sets up the trackDB.
@@ -111,6 +171,22 @@ class TrackDB:
         self._dbversion = 2.0
         self._dbminorversion = 0
         self._deleted_keys = []
+
+        self._journal: Optional[TrackDBJournal] = None
+        # track key -> (track, changed tags or None if the whole track
+        # needs to be written) for changes not yet in the journal
+        self._journal_changes: Dict[int, Tuple[Track, Optional[Set[str]]]] = {}
+        self._journal_removed: List[int] = []
+        self._journal_merge_id = None
+        if journal and location:
+            self._journal = TrackDBJournal(location + '.journal')
+            event.add_callback(self._on_track_tags_changed, 'track_tags_changed')
+
+        self._snapshot_location: Optional[str] = None
+        if snapshot and location:
+            self._snapshot_location = location + '.snapshot'
+            Track._add_lazy_source(self._get_lazy_track)
+
         if location:
             self.load_from_location()
             self._timeout_save()
@@ -184,6 +260,17 @@ class TrackDB:
         logger.debug("Loading %s DB from %s.", self.name, location)
 
         pdata = common.open_shelf(location)
+        write_new_snapshot = False
+
+        replay = JournalReplay()
+        if self._journal is not None and location == self.location:
+            try:
+                replay = self._journal.replay()
+            except common.VersionError:
+                pdata.close()
+                raise
+            except Exception:
+                logger.exception("Could not replay journal of %s", location)
 
         if "_dbversion" in pdata:
             if int(pdata['_dbversion']) > int(self._dbversion):
@@ -198,45 +285,178 @@ class TrackDB:
                 dbmig.handle_migration(
                     self, pdata, pdata['_dbversion'], self._dbversion
                 )
+                # the snapshot was written from the old format
+                pdata['_serial'] = pdata.get('_serial', 0) + 1
 
         for attr in self.pickle_attrs:
             try:
                 if 'tracks' == attr:
-                    data = {}
-                    for k in (x for x in pdata.keys() if x.startswith("tracks-")):
-                        p = pdata[k]
+                    data = None
+                    if self._snapshot_location and location == self.location:
+                        data = self._load_snapshot(pdata, replay)
+                    if data is None:
+                        data = self._load_shelf_tracks(pdata, replay)
+                        write_new_snapshot = not replay
+
+                    for p in replay.added.values():
                         tr = Track(_unpickles=p[0])
                         loc = tr.get_loc_for_io()
                         if loc not in data:
                             data[loc] = TrackHolder(tr, p[1], **p[2])
-                        else:
-                            logger.warning("Duplicate track found: %s", loc)
-                            # presumably the second track was written because of an error,
-                            # so use the first track found.
-                            del pdata[k]
 
                     setattr(self, attr, data)
+                elif attr in replay.attrs:
+                    setattr(self, attr, replay.attrs[attr])
                 else:
                     setattr(self, attr, pdata.get(attr, getattr(self, attr)))
             except Exception:
                 # FIXME: Do something about this
                 logger.exception("Exception occurred while loading %s", location)
 
+        serial = pdata.get('_serial', 0)
         pdata.close()
 
+        if write_new_snapshot and self._snapshot_location:
+            # the snapshot was missing or out of date; the shelf was just
+            # read in full, so this is the cheapest time to replace it
+            self._write_snapshot(serial)
+
         self._dirty = False
 
+        if replay:
+            # The shelf is behind the journal; make sure the replayed
+            # changes are written into it when the journal is merged.
+            logger.debug("Replayed %d journal records", replay.count)
+            for holder in self.tracks.values():
+                if holder._key in replay.added or holder._key in replay.updated:
+                    holder._track._dirty = True
+            self._deleted_keys.extend(replay.deleted)
+            self._dirty = True
+
+    def _load_shelf_tracks(
+        self, pdata, replay: JournalReplay
+    ) -> Dict[str, TrackHolder]:
+        """
+        Creates all tracks stored in the shelf
+        """
+        data = {}
+        for k in (x for x in pdata.keys() if x.startswith("tracks-")):
+            p = pdata[k]
+            if p[1] in replay.deleted or p[1] in replay.added:
+                continue
+            tr = Track(_unpickles=replay.apply(p)[0])
+            loc = tr.get_loc_for_io()
+            if loc not in data:
+                data[loc] = TrackHolder(tr, p[1], **p[2])
+            else:
+                logger.warning("Duplicate track found: %s", loc)
+                # presumably the second track was written because of an error,
+                # so use the first track found.
+                del pdata[k]
+        return data
+
+    def _load_snapshot(
+        self, pdata, replay: JournalReplay
+    ) -> Optional[Dict[str, TrackHolder]]:
+        """
+        Opens the snapshot of the shelf, if it is up to date
+
+        :returns: the track holders, or None if the snapshot can't be used
+        """
+        try:
+            snapshot = Snapshot(self._snapshot_location)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning(
+                "Could not open %s, loading the full DB instead",
+                self._snapshot_location,
+                exc_info=True,
+            )
+            return None
+
+        if snapshot.serial != pdata.get('_serial', 0):
+            logger.info("%s is out of date, ignoring it", self._snapshot_location)
+            snapshot.close()
+            return None
+
+        data = {}
+        for row in range(len(snapshot)):
+            key = snapshot.get_key(row)
+            if key in replay.deleted or key in replay.added:
+                continue
+            if key in replay.updated:
+                p = replay.apply(snapshot.get_data(row))
+                tr = Track(_unpickles=p[0])
+                holder = TrackHolder(tr, p[1], **p[2])
+            else:
+                holder = SnapshotTrackHolder(snapshot, row)
+            loc = snapshot.get_loc(row)
+            if loc not in data:
+                data[loc] = holder
+            else:
+                logger.warning("Duplicate track found: %s", loc)
+        logger.debug("Opened %s with %d tracks", self._snapshot_location, len(data))
+        return data
+
+    def _write_snapshot(self, serial: int) -> None:
+        try:
+            write_snapshot(
+                self._snapshot_location,
+                serial,
+                (holder._get_data(deep=False) for holder in self.tracks.values()),
+            )
+        except Exception:
+            logger.exception("Failed to write %s", self._snapshot_location)
+
+    def _get_lazy_track(self, uri: str) -> Optional[Track]:
+        """
+        Creates the Track for a uri if it is in the snapshot but has not
+        been accessed yet
+        """
+        holder = self.tracks.get(uri)
+        # Tracks which were already created are known to Track itself;
+        # answering for them could hand out a Track another TrackDB
+        # holds for the same uri
+        if not isinstance(holder, SnapshotTrackHolder) or holder._is_loaded():
+            return None
+        return holder._track
+
+    def close(self) -> None:
+        """
+        Stops this :class:`TrackDB` from providing tracks that have not
+        been loaded yet. Call this when the TrackDB is no longer used;
+        it does not save anything.
+        """
+        if self._snapshot_location:
+            Track._remove_lazy_source(self._get_lazy_track)
+
     @common.synchronized
     def save_to_location(self, location: Optional[str] = None):
         """
         Saves a pickled representation of this :class:`TrackDB` to the
         specified location.
 
+        If the journal is enabled and no other location is given, only
+        the changes made since the last save are appended to the journal.
+
         :param location: the location to save the data to
         """
+        if self._journal is not None and location in (None, self.location):
+            self._write_journal()
+            if self._journal.get_size() > self.journal_merge_size:
+                self._schedule_journal_merge()
+            return
+
+        self._save_to_shelf(location)
+
+    def _save_to_shelf(self, location: Optional[str] = None):
+        """
+        Writes all changed tracks into the shelf at the specified location
+        """
         if not self._dirty:
             for track in self.tracks.values():
-                if track._track._dirty:
+                if track._is_dirty():
                     self._dirty = True
                     break
 
@@ -267,16 +487,13 @@ class TrackDB:
             if 'tracks' == attr:
                 for k, track in self.tracks.items():
                     key = "tracks-%s" % track._key
-                    if track._track._dirty or key not in pdata:
-                        pdata[key] = (
-                            track._track._pickles(),
-                            track._key,
-                            deepcopy(track._attrs),
-                        )
+                    if track._is_dirty() or key not in pdata:
+                        pdata[key] = track._get_data()
             else:
                 pdata[attr] = deepcopy(getattr(self, attr))
 
         pdata['_dbversion'] = self._dbversion
+        serial = pdata['_serial'] = pdata.get('_serial', 0) + 1
 
         for key in self._deleted_keys:
             key = "tracks-%s" % key
@@ -287,11 +504,90 @@ class TrackDB:
         pdata.close()
 
         for track in self.tracks.values():
-            track._track._dirty = False
+            if track._is_dirty():
+                track._track._dirty = False
+
+        if self._snapshot_location and location == self.location:
+            self._write_snapshot(serial)
+
+        if self._journal is not None and location == self.location:
+            # everything in the journal is in the shelf now
+            self._journal_changes.clear()
+            self._journal_removed = []
+            self._journal.clear()
 
         self._dirty = False
         self._saving = False
 
+    def _write_journal(self) -> None:
+        """
+        Appends the changes made since the last save to the journal
+        """
+        if not self._dirty and not self._journal_changes:
+            return
+
+        records = [('del', key) for key in self._journal_removed]
+        for key, (track, tags) in self._journal_changes.items():
+            if tags is None:
+                holder = self.tracks.get(track.get_loc_for_io())
+                attrs = deepcopy(holder._attrs) if holder is not None else {}
+                records.append(('add', key, (track._pickles(), key, attrs)))
+            else:
+                values, removed = track._pickles_tags(tags)
+                records.append(('tags', key, values, removed))
+
+        attrs = {}
+        for attr in self.pickle_attrs:
+            if attr != 'tracks':
+                attrs[attr] = deepcopy(getattr(self, attr))
+        records.append(('attrs', attrs))
+
+        logger.debug("Journaling %d %s DB records.", len(records), self.name)
+        try:
+            self._journal.append(records)
+        except Exception:
+            logger.exception("Failed to write the %s DB journal.", self.name)
+            return
+
+        self._journal_changes.clear()
+        self._journal_removed = []
+        self._dirty = False
+
+    def _schedule_journal_merge(self) -> None:
+        if self._journal_merge_id is None:
+            self._journal_merge_id = GLib.idle_add(
+                self._merge_journal, priority=GLib.PRIORITY_LOW
+            )
+
+    @common.synchronized
+    def _merge_journal(self) -> bool:
+        """
+        Writes the journaled changes into the shelf and empties the journal
+        """
+        self._journal_merge_id = None
+        logger.debug("Merging %s DB journal.", self.name)
+        # the journal may contain removals only, which the shelf
+        # would otherwise not consider to be changes
+        self._dirty = True
+        self._save_to_shelf(self.location)
+        return False
+
+    @common.synchronized
+    def _on_track_tags_changed(self, type, track: Track, tags: Set[str]) -> None:
+        """
+        Remembers which tags of our tracks have to be journaled
+        """
+        holder = self.tracks.get(track.get_loc_for_io())
+        if holder is None or holder._track is not track:
+            return
+        try:
+            changed = self._journal_changes[holder._key][1]
+        except KeyError:
+            self._journal_changes[holder._key] = (track, set(tags))
+        else:
+            if changed is not None:
+                changed.update(tags)
+
     def get_track_by_loc(self, loc: str) -> Optional[Track]:
         """
         returns the track having the given loc. if no such track exists,
@@ -339,6 +635,8 @@ class TrackDB:
                 continue
             locations += [location]
             self.tracks[location] = TrackHolder(tr, self._key)
+            if self._journal is not None:
+                self._journal_changes[self._key] = (tr, None)
             self._key += 1
 
         if locations:
@@ -363,7 +661,11 @@ class TrackDB:
         for tr in tracks:
             location = tr.get_loc_for_io()
             locations += [location]
-            self._deleted_keys.append(self.tracks[location]._key)
+            key = self.tracks[location]._key
+            self._deleted_keys.append(key)
+            if self._journal is not None:
+                self._journal_changes.pop(key, None)
+                self._journal_removed.append(key)
             del self.tracks[location]
 
         event.log_event('tracks_removed', self, locations)
@@ -24,7 +24,7 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from typing import Callable, Iterable, List, Optional, TypeVar
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, TypeVar
 
 from gi.repository import Gio
 from gi.repository import GLib
@@ -96,6 +96,39 @@ def get_tracks_from_uri(uri: str) -> List[Track]:
     return tracks
 
 
+def get_sort_keys(
+    fields: Sequence[str],
+    items: Iterable[_T],
+    trackfunc: Optional[Callable[[_T], Track]] = None,
+    artist_compilations: bool = False,
+) -> List[Tuple[Any, ...]]:
+    """
+    Gets the sort keys of many tracks at once.
+
+    :param fields: tag names to sort by
+    :param items: the tracks, alternatively use *trackfunc*
+    :param trackfunc: function to get a *Track*
+        from an item in the *items* iterable
+    :returns: one tuple of sort values per item, in the same order
+    """
+    if trackfunc is None:
+        tracks = items
+    else:
+        tracks = map(trackfunc, items)
+    keys = []
+    for tr in tracks:
+        get_tag_sort = tr.get_tag_sort
+        keys.append(
+            tuple(
+                [
+                    get_tag_sort(field, artist_compilations=artist_compilations)
+                    for field in fields
+                ]
+            )
+        )
+    return keys
+
+
 def sort_tracks(
     fields: Iterable[str],
     items: Iterable[_T],
@@ -113,13 +146,10 @@ def sort_tracks(
         from an item in the *items* iterable
     :param reverse: whether to sort in reversed order
     """
-    if trackfunc is None:
-        trackfunc = lambda tr: tr
-    keyfunc = lambda tr: [
-        trackfunc(tr).get_tag_sort(field, artist_compilations=artist_compilations)
-        for field in fields
-    ]
-    return sorted(items, key=keyfunc, reverse=reverse)
+    items = list(items)
+    keys = get_sort_keys(fields, items, trackfunc, artist_compilations)
+    order = sorted(range(len(items)), key=keys.__getitem__, reverse=reverse)
+    return [items[i] for i in order]
 
 
 def sort_result_tracks(fields, trackiter, reverse=False, artist_compilations=False):
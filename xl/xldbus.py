@@ -103,6 +103,7 @@ def check_exit(options, args):
             'GetVolume',
             'Query',
             'FormatQuery',
+            'GetEventProfile',
         ]:
             if getattr(options, command):
                 return "command"
@@ -193,6 +194,10 @@ def run_commands(options, iface):
             print(getattr(iface, command)(argument))
             comm = True
 
+    if options.GetEventProfile:
+        print(iface.GetEventProfile())
+        comm = True
+
     to_implement = ('GuiQuery',)
     for command in to_implement:
         if getattr(options, command):
@@ -669,6 +674,19 @@ class DbusManager(dbus.service.Object):
 
         return player.PLAYER.get_state()
 
+    @dbus.service.method('org.exaile.Exaile', None, 's')
+    def GetEventProfile(self):
+        """
+        Returns how often and how long the event callbacks were called,
+        if Exaile was started with --eventprofile
+
+        :returns: the times as a text table
+        :rtype: string
+        """
+        if event.EVENT_MANAGER.profile is None:
+            return _('Event profiling is disabled, start Exaile with --eventprofile')
+        return event.EVENT_MANAGER.profile.get_report()
+
     @dbus.service.signal('org.exaile.Exaile')
     def StateChanged(self):
         """
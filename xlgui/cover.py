@@ -24,6 +24,8 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+import concurrent.futures
+import hashlib
 import logging
 import os
 import os.path
@@ -38,7 +40,7 @@ from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 
-from xl import common, event, providers, settings, xdg
+from xl import common, covers, event, providers, settings, xdg
 from xl.covers import MANAGER as COVER_MANAGER
 from xl.nls import gettext as _
 from xlgui.widgets import dialogs, menu
@@ -64,6 +66,84 @@ def save_pixbuf(pixbuf, path, type_):
     pixbuf.savev(path, type_, [None], [])
 
 
+class CoverPixbufCache:
+    """
+    Keeps covers scaled to the sizes they are displayed at
+
+    Scaling a cover means decoding the full-size image, so widgets
+    showing many covers or showing the same cover repeatedly should
+    get their pixbufs from here. The most recently used pixbufs are kept
+    in memory, and every scaled cover is also saved on disk as a small
+    PNG file, up to the size set by the 'covers/thumbnail_cache_size'
+    option (in MiB).
+    """
+
+    def __init__(self, location, max_pixbufs=256):
+        """
+        :param location: the directory to store scaled covers in
+        :param max_pixbufs: the number of pixbufs to keep in memory
+        """
+        self.location = location
+        self.__pixbufs = common.LimitedCache(max_pixbufs)
+        self.__lock = threading.Lock()
+        self.__disk = None
+
+    def __get_disk_cache(self):
+        if self.__disk is None:
+            max_size = settings.get_option('covers/thumbnail_cache_size', 64)
+            self.__disk = covers.Cacher(self.location, max_size * 1024 * 1024)
+        return self.__disk
+
+    def get_pixbuf(self, data, size, keep_ratio=True, upscale=False):
+        """
+        Gets a scaled cover
+
+        The parameters are the same as for
+        :func:`xlgui.guiutil.pixbuf_from_data`, except that a size is
+        required.
+
+        :returns: the scaled cover, or None if the data can't be loaded
+        :rtype: :class:`GdkPixbuf.Pixbuf`
+        """
+        if not data:
+            return None
+
+        key = '%s-%dx%d-%d%d' % (
+            hashlib.sha256(data).hexdigest(),
+            size[0],
+            size[1],
+            keep_ratio,
+            upscale,
+        )
+        with self.__lock:
+            try:
+                return self.__pixbufs[key]
+            except KeyError:
+                pass
+
+        disk = self.__get_disk_cache()
+        pixbuf = pixbuf_from_data(disk.get(key))
+        if pixbuf is None:
+            pixbuf = pixbuf_from_data(data, size, keep_ratio, upscale)
+            if pixbuf is None:
+                return None
+            try:
+                success, thumbnail = pixbuf.save_to_bufferv('png', [], [])
+            except GLib.Error:
+                logger.warning("Could not save scaled cover", exc_info=True)
+            else:
+                if success:
+                    disk.add(thumbnail, key)
+
+        with self.__lock:
+            self.__pixbufs[key] = pixbuf
+        return pixbuf
+
+
+#: scaled covers, shared by everything that displays covers
+PIXBUF_CACHE = CoverPixbufCache(os.path.join(xdg.get_cache_dir(), 'covers'))
+
+
 class CoverManager(GObject.GObject):
     """
     Cover manager window
@@ -97,7 +177,7 @@ class CoverManager(GObject.GObject):
         self.outstanding_text = _('{outstanding} covers left to fetch')
         self.completed_text = _('All covers fetched')
         self.cover_size = (90, 90)
-        self.default_cover_pixbuf = pixbuf_from_data(
+        self.default_cover_pixbuf = PIXBUF_CACHE.get_pixbuf(
             COVER_MANAGER.get_default_cover(), self.cover_size
         )
 
@@ -171,6 +251,7 @@ class CoverManager(GObject.GObject):
         outstanding = []
         # Speed up the following loop
         get_cover = COVER_MANAGER.get_cover
+        get_pixbuf = PIXBUF_CACHE.get_pixbuf
         default_cover_pixbuf = self.default_cover_pixbuf
         cover_size = self.cover_size
 
@@ -181,13 +262,11 @@ class CoverManager(GObject.GObject):
                 return
 
             cover_data = get_cover(self.album_tracks[album][0], set_only=True)
-            cover_pixbuf = pixbuf_from_data(cover_data) if cover_data else None
+            thumbnail_pixbuf = get_pixbuf(
+                cover_data, cover_size, keep_ratio=False, upscale=True
+            )
 
-            try:
-                thumbnail_pixbuf = cover_pixbuf.scale_simple(
-                    *cover_size, interp_type=GdkPixbuf.InterpType.BILINEAR
-                )
-            except AttributeError:  # cover_pixbuf is None
+            if thumbnail_pixbuf is None:
                 thumbnail_pixbuf = default_cover_pixbuf
                 outstanding.append(album)
 
@@ -207,28 +286,60 @@ class CoverManager(GObject.GObject):
         self.emit('fetch-started', len(self.outstanding))
 
         # Speed up the following loop
-        get_cover = COVER_MANAGER.get_cover
+        resolve = COVER_MANAGER.resolver.resolve
         save = COVER_MANAGER.save
 
-        for i, album in enumerate(self.outstanding[:]):
-            if self.stopper.is_set():
+        # Search again for albums for which a recent search failed, e.g.
+        # because the network was down
+        COVER_MANAGER.resolver.forget_misses()
+
+        # Only hand a few albums at a time to the resolver, so that
+        # stopping does not have to wait for every album to be searched
+        albums = iter(self.outstanding[:])
+        max_pending = COVER_MANAGER.resolver.max_workers * 2
+        pending = []
+        progress = 0
+        fetched = 0
+
+        while True:
+            if not self.stopper.is_set():
+                for album in albums:
+                    pending.append((resolve(self.album_tracks[album][0]), album))
+                    if len(pending) >= max_pending:
+                        break
+
+            if not pending:
                 # Allow for "fetch-completed" signal to be emitted
                 break
 
-            cover_data = get_cover(self.album_tracks[album][0], save_cover=True)
-            cover_pixbuf = pixbuf_from_data(cover_data) if cover_data else None
+            done, _not_done = concurrent.futures.wait(
+                {future for future, album in pending},
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
 
-            self.emit('fetch-progress', i + 1)
+            for future, album in [p for p in pending if p[0] in done]:
+                pending.remove((future, album))
+                progress += 1
 
-            if not cover_pixbuf:
-                continue
+                try:
+                    cover_data = future.result()
+                except Exception:
+                    logger.exception('Failed to fetch cover for %s - %s', *album)
+                    cover_data = None
+                cover_pixbuf = pixbuf_from_data(cover_data) if cover_data else None
+
+                self.emit('fetch-progress', progress)
 
-            self.outstanding.remove(album)
-            self.emit('cover-fetched', album, cover_pixbuf)
+                if not cover_pixbuf:
+                    continue
+
+                self.outstanding.remove(album)
+                self.emit('cover-fetched', album, cover_pixbuf)
 
-            if i % 50 == 0:
-                logger.debug('Saving cover database')
-                save()
+                fetched += 1
+                if fetched % 50 == 0:
+                    logger.debug('Saving cover database')
+                    save()
 
         logger.debug('Saving cover database')
         save()
@@ -730,7 +841,7 @@ class CoverWidget(Gtk.EventBox):
 
             self.cover_data = stream.read()
             width = settings.get_option('gui/cover_width', 100)
-            pixbuf = pixbuf_from_data(self.cover_data, (width, width))
+            pixbuf = PIXBUF_CACHE.get_pixbuf(self.cover_data, (width, width))
 
             if pixbuf is not None:
                 self.image.set_from_pixbuf(pixbuf)
@@ -746,7 +857,7 @@ class CoverWidget(Gtk.EventBox):
             return
 
         width = settings.get_option('gui/cover_width', 100)
-        pixbuf = pixbuf_from_data(cover_data, (width, width))
+        pixbuf = PIXBUF_CACHE.get_pixbuf(cover_data, (width, width))
         self.image.set_from_pixbuf(pixbuf)
         self.set_drag_source_enabled(True)
         self.cover_data = cover_data
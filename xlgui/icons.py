@@ -36,7 +36,7 @@ from typing import Optional, Union
 from gi.repository import GdkPixbuf, GLib, Gtk
 
 from xl import common, covers, settings
-from xlgui.guiutil import pixbuf_from_data
+from xlgui import cover
 
 logger = logging.getLogger(__name__)
 
@@ -742,8 +742,8 @@ class IconManager:
         :return: GdkPixbuf.Pixbuf or None if none found
         """
         cover_width = settings.get_option('gui/cover_width', 100)
-        as_pixbuf = lambda data: pixbuf_from_data(
-            data=data, size=(cover_width, cover_width)
+        as_pixbuf = lambda data: cover.PIXBUF_CACHE.get_pixbuf(
+            data, (cover_width, cover_width)
         )
         get_cover_for_tracks = covers.MANAGER.get_cover_for_tracks
         db_string_list = []
@@ -160,6 +160,129 @@ DEFAULT_ORDERS = [
 ]
 
 
+class HierarchyNode:
+    """
+    A node of the collection tree, holding the tracks shown below it
+
+    The children of a node are worked out from its own tracks the first
+    time they are needed and then kept, so expanding a node or getting
+    its tracks doesn't search the whole collection again.
+    """
+
+    __slots__ = (
+        'order',
+        'depth',
+        'tracks',
+        'display',
+        'match_query',
+        'sort_value',
+        'expand',
+        '_children',
+    )
+
+    def __init__(
+        self, order, depth, tracks, display=None, match_query=None, sort_value=None
+    ):
+        """
+        :param order: the :class:`Order` of the tree
+        :param depth: the level of the order the children of this node
+            are grouped by
+        :param tracks: the :class:`xl.trax.SearchResultTrack` objects
+            below this node. They must be sorted by the tags of the
+            first level if depth is 0.
+        :param display: the text shown for this node
+        :param match_query: a search query matching the tracks of this
+            node within its parent
+        :param sort_value: the value used to place separators between
+            the nodes of the first level
+        """
+        self.order = order
+        self.depth = depth
+        self.tracks = tracks
+        self.display = display
+        self.match_query = match_query
+        self.sort_value = sort_value
+        #: whether this node contains tracks matching the search
+        #: keyword on a tag of a lower level
+        self.expand = False
+        self._children = None
+
+    def get_tracks(self):
+        """
+        :returns: the tracks below this node
+        """
+        return [srtr.track for srtr in self.tracks]
+
+    def get_children(self):
+        """
+        :returns: the list of child nodes, empty at the bottom of the tree
+        """
+        if self._children is None:
+            self._children = self.__group()
+        return self._children
+
+    def __group(self):
+        depth = self.depth
+        if depth >= len(self.order):
+            return []  # at the bottom of the tree
+
+        tags = self.order.get_sort_tags(depth)
+        srtrs = self.tracks
+        # sort only if we are not on top level, because tracks are
+        # already sorted by fist order
+        if depth > 0:
+            srtrs = trax.sort_result_tracks(tags, srtrs)
+        bottom = depth == len(self.order) - 1
+
+        alltags = []
+        for i in range(depth + 1, len(self.order)):
+            alltags.extend(self.order.get_sort_tags(i))
+
+        children = []
+        node = None
+        last_val = ''
+        last_dval = ''
+        last_matchq = ''
+
+        for srtr in srtrs:
+            # The value returned by get_tag_sort() may be of other
+            # typa than str (e.g., an int for track number), hence
+            # explicit conversion via str() is necessary.
+            stagvals = [str(srtr.track.get_tag_sort(x)) for x in tags]
+            stagval = " ".join(stagvals)
+            if last_val != stagval or bottom:
+                tagval = self.order.format_track(depth, srtr.track)
+                match_query = " ".join(
+                    [srtr.track.get_tag_search(t, format=True) for t in tags]
+                )
+                if bottom:
+                    match_query += " " + srtr.track.get_tag_search("__loc", format=True)
+
+                # Different *sort tags can cause stagval to not match
+                # but the below code will produce identical entries in
+                # the displayed tree.  This condition checks to ensure
+                # that new entries are added if and only if they will
+                # display different results, avoiding that problem.
+                if match_query != last_matchq or tagval != last_dval or bottom:
+                    last_val = stagval
+                    last_dval = tagval
+                    last_matchq = match_query
+                    node = HierarchyNode(
+                        self.order,
+                        depth + 1,
+                        [],
+                        tagval,
+                        match_query,
+                        srtr.track.get_tag_sort(tags[0]),
+                    )
+                    children.append(node)
+            node.tracks.append(srtr)
+            if not node.expand:
+                node.expand = any(t in srtr.on_tags for t in alltags)
+
+        return children
+
+
 class CollectionPanel(panel.Panel):
     """
     The collection panel
@@ -211,6 +334,7 @@ class CollectionPanel(panel.Panel):
         self.order = None
         self.tracks = []
         self.sorted_tracks = []
+        self.hierarchy = None
 
         event.add_ui_callback(
             self._check_collection_empty, 'libraries_modified', collection
@@ -267,7 +391,7 @@ class CollectionPanel(panel.Panel):
             }
         )
         self.tree.connect('key-release-event', self.on_key_released)
-        event.add_ui_callback(self.refresh_tags_in_tree, 'track_tags_changed')
+        event.add_batch_callback(self.refresh_tags_in_tree, 'track_tags_changed')
         event.add_ui_callback(
             self.refresh_tracks_in_tree, 'tracks_added', self.collection
         )
@@ -424,7 +548,8 @@ class CollectionPanel(panel.Panel):
             (lambda m, i, d: m.get_value(i, 1) is None), None
         )
 
-        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object)
+        # icon, text, search query, HierarchyNode
+        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object, object)
 
         self.tree.connect("row-expanded", self.on_expanded)
 
@@ -432,12 +557,28 @@ class CollectionPanel(panel.Panel):
         """
         finds tracks matching a given iter.
         """
+        node = self.model.get_value(iter, 3)
+        if node is not None:
+            return node.get_tracks()
         self.load_subtree(iter)
         search = self.get_node_search_terms(iter)
         matcher = trax.TracksMatcher(search)
-        srtrs = trax.search_tracks(self.tracks, [matcher])
+        srtrs = trax.search_tracks(
+            self.tracks, [matcher], index=self._get_search_index()
+        )
         return [x.track for x in srtrs]
 
+    def _get_search_index(self):
+        """
+        Gets the search index of the collection, if it should be used
+        """
+        if not settings.get_option('collection/use_search_index', True):
+            return None
+        try:
+            return self.collection.get_search_index()
+        except AttributeError:  # not an xl.collection.Collection
+            return None
+
     def append_to_playlist(self, item=None, event=None, replace=False):
         """
         Adds items to the current playlist
@@ -485,13 +626,16 @@ class CollectionPanel(panel.Panel):
 
         return " ".join(queries)
 
-    def refresh_tags_in_tree(self, type, track, tags):
-        if (
-            settings.get_option('gui/sync_on_tag_change', True)
-            and bool(tags & self.order.all_sort_tags())
-            and self.collection.loc_is_member(track.get_loc_for_io())
-        ):
-            self._refresh_tags_in_tree()
+    def refresh_tags_in_tree(self, type, changes):
+        if not settings.get_option('gui/sync_on_tag_change', True):
+            return
+        sort_tags = self.order.all_sort_tags()
+        for track, tags in changes:
+            if tags & sort_tags and self.collection.loc_is_member(
+                track.get_loc_for_io()
+            ):
+                self._refresh_tags_in_tree()
+                return
 
     def refresh_tracks_in_tree(self, type, obj, loc):
         self._refresh_tags_in_tree()
@@ -547,9 +691,14 @@ class CollectionPanel(panel.Panel):
 
         self.tracks = list(
             trax.search_tracks_from_string(
-                self.sorted_tracks, keyword, case_sensitive=False, keyword_tags=tags
+                self.sorted_tracks,
+                keyword,
+                case_sensitive=False,
+                keyword_tags=tags,
+                index=self._get_search_index(),
             )
         )
+        self.hierarchy = HierarchyNode(self.order, 0, self.tracks)
 
         self.load_subtree(None)
 
@@ -608,18 +757,15 @@ class CollectionPanel(panel.Panel):
         if previously_loaded:
             return
 
-        search = self.get_node_search_terms(parent)
-
-        try:
-            tags = self.order.get_sort_tags(depth)
-            matchers = [trax.TracksMatcher(search)]
-            srtrs = trax.search_tracks(self.tracks, matchers)
-            # sort only if we are not on top level, because tracks are
-            # already sorted by fist order
-            if depth > 0:
-                srtrs = trax.sort_result_tracks(tags, srtrs)
-        except IndexError:
+        if depth >= len(self.order):
             return  # at the bottom of the tree
+        if parent is None:
+            node = self.hierarchy
+        else:
+            node = self.model.get_value(parent, 3)
+        children = node.get_children()
+
+        tags = self.order.get_sort_tags(depth)
         try:
             image = getattr(self, "%s_image" % tags[-1])
         except Exception:
@@ -630,86 +776,30 @@ class CollectionPanel(panel.Panel):
 
         display_counts = settings.get_option('gui/display_track_counts', True)
         draw_seps = settings.get_option('gui/draw_separators', True)
-        last_char = ''
-        last_val = ''
-        last_dval = ''
-        last_matchq = ''
-        count = 0
-        first = True
-        path = None
-        expanded = False
+        last_char = None
         to_expand = []
 
-        for srtr in srtrs:
-            # The value returned by get_tag_sort() may be of other
-            # typa than str (e.g., an int for track number), hence
-            # explicit conversion via str() is necessary.
-            stagvals = [str(srtr.track.get_tag_sort(x)) for x in tags]
-            stagval = " ".join(stagvals)
-            if last_val != stagval or bottom:
-                tagval = self.order.format_track(depth, srtr.track)
-                match_query = " ".join(
-                    [srtr.track.get_tag_search(t, format=True) for t in tags]
-                )
-                if bottom:
-                    match_query += " " + srtr.track.get_tag_search("__loc", format=True)
-
-                # Different *sort tags can cause stagval to not match
-                # but the below code will produce identical entries in
-                # the displayed tree.  This condition checks to ensure
-                # that new entries are added if and only if they will
-                # display different results, avoiding that problem.
-                if match_query != last_matchq or tagval != last_dval or bottom:
-                    if display_counts and path and not bottom:
-                        iter = self.model.get_iter(path)
-                        val = self.model.get_value(iter, 1)
-                        val = "%s (%s)" % (val, count)
-                        self.model.set_value(iter, 1, val)
-                        count = 0
-
-                    last_val = stagval
-                    last_dval = tagval
-                    if depth == 0 and draw_seps:
-                        val = srtr.track.get_tag_sort(tags[0])
-                        char = first_meaningful_char(val)
-                        if first:
-                            last_char = char
-                        else:
-                            if char != last_char and last_char != '':
-                                self.model.append(parent, [None, None, None])
-                            last_char = char
-                    first = False
-
-                    last_matchq = match_query
-                    iter = self.model.append(parent, [image, tagval, match_query])
-                    path = self.model.get_path(iter)
-                    expanded = False
-                    if not bottom:
-                        self.model.append(iter, [None, None, None])
-            count += 1
-            if not expanded:
-                alltags = []
-                for i in range(depth + 1, len(self.order)):
-                    alltags.extend(self.order.get_sort_tags(i))
-                for t in alltags:
-                    if t in srtr.on_tags:
-                        # keep original path intact for following block
-                        newpath = path
-                        if depth > 0:
-                            # for some reason, nested iters are always
-                            # off by one in the terminal entry.
-                            newpath = Gtk.TreePath.new_from_indices(
-                                newpath[:-1] + [newpath[-1] - 1]
-                            )
-                        to_expand.append(newpath)
-                        expanded = True
-
-        if display_counts and path and not bottom:
-            iter = self.model.get_iter(path)
-            val = self.model.get_value(iter, 1)
-            val = "%s (%s)" % (val, count)
-            self.model.set_value(iter, 1, val)
-            count = 0
+        for child in children:
+            if depth == 0 and draw_seps:
+                char = first_meaningful_char(child.sort_value)
+                if last_char is not None and char != last_char and last_char != '':
+                    self.model.append(parent, [None, None, None, None])
+                last_char = char
+
+            tagval = child.display
+            if display_counts and not bottom:
+                tagval = "%s (%s)" % (tagval, len(child.tracks))
+            iter = self.model.append(parent, [image, tagval, child.match_query, child])
+            if not bottom:
+                self.model.append(iter, [None, None, None, None])
+
+            if child.expand:
+                path = self.model.get_path(iter)
+                if depth > 0:
+                    # for some reason, nested iters are always
+                    # off by one in the terminal entry.
+                    path = Gtk.TreePath.new_from_indices(path[:-1] + [path[-1] - 1])
+                to_expand.append(path)
 
         if (
             settings.get_option("gui/expand_enabled", True)
@@ -791,6 +881,10 @@ class CollectionDragTreeView(DragTreeView):
         :return: list of tracks [xl.trax.Track]
         """
         it = self.get_model().get_iter(path)
+        node = self.get_model().get_value(it, 3)
+        if node is not None:
+            yield from node.get_tracks()
+            return
         search = self.container.get_node_search_terms(it)
         matcher = trax.TracksMatcher(search)
         for i in trax.search_tracks(self.container.tracks, [matcher]):
@@ -31,6 +31,8 @@ from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Pango
 
+import contextlib
+import itertools
 import logging
 import sys
 
@@ -1177,23 +1179,12 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
 
     def _setup_models(self):
         self.model = PlaylistModel(self.playlist, [], self.player, self)
-        self.__setup_model_hook = self.model.connect(
-            'data-loading', self._on_after_model_loading
-        )
+        self.model.connect('row-inserted', self.on_row_inserted)
 
         self.modelfilter = self.model.filter_new()
         self.modelfilter.set_visible_func(self._modelfilter_visible_func)
         self.set_model(self.modelfilter)
 
-    def _on_after_model_loading(self, ar1, now_loading):
-        """
-        This is necessary to ensure that row-insert is connected after the initial loading
-        due to threaded PlaylistModel::_load_data_thread and playlists greater than 500 tracks
-        """
-        if not now_loading:
-            self.model.connect('row-inserted', self.on_row_inserted)
-            self.model.disconnect(self.__setup_model_hook)
-
     def _modelfilter_visible_func(self, model, iter, data):
         if self._filter_matcher is not None:
             track = model.get_value(iter, 0)
@@ -1812,9 +1803,9 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         )
 
 
-class PlaylistModel(Gtk.ListStore):
+class PlaylistModel(GObject.Object, Gtk.TreeModel):
     """
-    This ListStore contains all the information needed to render a playlist
+    This model contains all the information needed to render a playlist
     via a PlaylistView. There are five columns:
 
     * xl.trax.Track
@@ -1830,6 +1821,20 @@ class PlaylistModel(Gtk.ListStore):
     The cache keys are populated by the playlist columns. This arrangement
     ensures that we don't have to recreate the playlist model each time the
     columns are changed.
+
+    Rows aren't stored anywhere: the model only keeps the list of tracks of
+    the playlist (as of the last event it handled), and computes the values
+    of a row when the view asks for them, which it only does for the rows
+    that are visible. The tag caches are kept for a limited number of
+    tracks. This way opening a huge playlist doesn't need any work per
+    track apart from copying the list and indexing the positions of each
+    track, which lets tag changes redraw only the rows of the changed
+    tracks.
+
+    The positions in that index aren't updated when rows are inserted or
+    removed before them. Instead the edits are logged, and a position is
+    only moved through the edits made after it was indexed when it is
+    looked up. The index is rebuilt once the log gets long.
     """
 
     __gsignals__ = {
@@ -1845,21 +1850,47 @@ class PlaylistModel(Gtk.ListStore):
 
     PARAM_COLS = (COL_PIXBUF, COL_SENSITIVE, COL_WEIGHT)
 
+    COLUMN_TYPES = (
+        GObject.TYPE_PYOBJECT,
+        GObject.TYPE_PYOBJECT,
+        GdkPixbuf.Pixbuf.__gtype__,
+        GObject.TYPE_BOOLEAN,
+        Pango.Weight.__gtype__,
+    )
+
+    #: Number of tracks for which the formatted tags are kept
+    CACHE_SIZE = 1000
+
+    #: Changes to more rows than this detach the model from the view
+    #: while they are applied (see the data-loading signal)
+    BULK_UPDATE_SIZE = 500
+
+    #: Number of logged edits after which the track index is rebuilt
+    EDIT_LOG_SIZE = 100
+
     def __init__(self, playlist, column_names, player, parent):
-        # columns: Track, Pixbuf, dict (cache)
-        Gtk.ListStore.__init__(
-            self, object, object, GdkPixbuf.Pixbuf, bool, Pango.Weight
-        )
+        GObject.Object.__init__(self)
         self.playlist = playlist
         self.player = player
 
         self._set_columns(column_names)
 
         self.data_loading = False
-        self.data_load_queue = []
 
-        self._redraw_timer = None
-        self._redraw_queue = []
+        self._tracks = list(playlist)
+        # While the signals for a range of changed rows are emitted, the
+        # rows they haven't announced yet: (start, rows, count, skip)
+        # means the view sees _tracks[:start] + rows[:count] +
+        # _tracks[start + skip:]
+        self._pending = None
+        self._cache = common.LimitedCache(self.CACHE_SIZE)
+        # (start, delta) of the rows inserted (delta > 0) or removed
+        # (delta < 0) since the index was built
+        self._edits = []
+        # xl.trax.Track -> list of (position, number of edits made
+        # before the position was indexed) of its rows
+        self._track_positions = {}
+        self._build_index()
 
         event.add_ui_callback(
             self.on_tracks_added, "playlist_tracks_added", playlist, destroy_with=parent
@@ -1906,16 +1937,13 @@ class PlaylistModel(Gtk.ListStore):
             self.player,
             destroy_with=parent,
         )
-        event.add_ui_callback(
+        event.add_batch_callback(
             self.on_track_tags_changed, "track_tags_changed", destroy_with=parent
         )
 
         event.add_ui_callback(self.on_option_set, "gui_option_set", destroy_with=parent)
 
         self._setup_icons()
-        self.on_tracks_added(
-            None, self.playlist, list(enumerate(self.playlist))
-        )  # populate the list
 
     def _set_columns(self, column_names):
         self.column_names = set(column_names)
@@ -1964,12 +1992,7 @@ class PlaylistModel(Gtk.ListStore):
 
     def _refresh_icons(self):
         self._setup_icons()
-        itr = self.get_iter_first()
-        position = 0
-        while itr:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(position))
-            itr = self.iter_next(itr)
-            position += 1
+        self._update_row_params_range(0, self._get_length())
 
     def on_option_set(self, typ, obj, data):
         if data == "gui/playlist_font":
@@ -1996,7 +2019,7 @@ class PlaylistModel(Gtk.ListStore):
 
             if (
                 playlist.current_position == rowidx
-                and playlist[rowidx] == self.player.current
+                and self._get_track(rowidx) == self.player.current
             ):
 
                 # this row is the current track, set a special icon
@@ -2023,122 +2046,298 @@ class PlaylistModel(Gtk.ListStore):
         return pixbuf, sensitive, weight
 
     def update_row_params(self, position):
-        itr = self.iter_nth_child(None, position)
-        if itr is not None:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(position))
-
-    ### Event callbacks to keep the model in sync with the playlist ###
+        if 0 <= position < self._get_length():
+            path = Gtk.TreePath((position,))
+            self.row_changed(path, self.get_iter(path))
+
+    def _get_track(self, position):
+        pending = self._pending
+        if pending is None:
+            return self._tracks[position]
+        start, rows, count, skip = pending
+        if position < start:
+            return self._tracks[position]
+        position -= start
+        if position < count:
+            return rows[position]
+        return self._tracks[start + skip + position - count]
+
+    def _get_length(self):
+        pending = self._pending
+        if pending is None:
+            return len(self._tracks)
+        return len(self._tracks) + pending[2] - pending[3]
+
+    def _get_cache(self, track):
+        try:
+            return self._cache[track]
+        except KeyError:
+            cache = self._cache[track] = {}
+            return cache
 
-    def on_tracks_added(self, event_type, playlist, tracks):
-        self._load_data(tracks)
+    ### Gtk.TreeModel implementation ###
+    #
+    # An iter only holds the position of its row, so iters don't survive
+    # changes to the list; this is fine as long as the flags don't promise
+    # otherwise.
+    #
 
-    def on_tracks_removed(self, event_type, playlist, tracks):
-        for position, track in reversed(tracks):
-            self.remove(self.iter_nth_child(None, position))
+    def _create_iter(self, position):
+        itr = Gtk.TreeIter()
+        itr.user_data = position
+        return itr
+
+    @staticmethod
+    def _get_position(itr):
+        # position 0 is a NULL pointer, which may come back as None
+        return itr.user_data or 0
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self):
+        return len(self.COLUMN_TYPES)
+
+    def do_get_column_type(self, column):
+        return self.COLUMN_TYPES[column]
+
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and 0 <= indices[0] < self._get_length():
+            return True, self._create_iter(indices[0])
+        return False, None
+
+    def do_get_path(self, itr):
+        return Gtk.TreePath((self._get_position(itr),))
+
+    def do_get_value(self, itr, column):
+        position = self._get_position(itr)
+        if column == self.COL_TRACK:
+            return self._get_track(position)
+        elif column == self.COL_CACHE:
+            return self._get_cache(self._get_track(position))
+        return self._compute_row_params(position)[column - self.COL_PIXBUF]
+
+    def do_iter_next(self, itr):
+        position = self._get_position(itr) + 1
+        if position < self._get_length():
+            itr.user_data = position
+            return True
+        return False
 
-    def on_current_position_changed(self, event_type, playlist, positions):
-        for position in positions:
-            if position < 0:
-                continue
-            self.update_row_params(position)
+    def do_iter_previous(self, itr):
+        position = self._get_position(itr) - 1
+        if position >= 0:
+            itr.user_data = position
+            return True
+        return False
 
-    def on_spat_position_changed(self, event_type, playlist, positions):
-        pos = min(positions)
+    def do_iter_children(self, parent):
+        if parent is None and self._get_length():
+            return True, self._create_iter(0)
+        return False, None
 
-        if pos < 0:
-            pos = 0
-            itr = self.get_iter_first()
-        else:
-            itr = self.iter_nth_child(None, pos)
+    def do_iter_has_child(self, itr):
+        return False
 
-        while itr:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(pos))
-            itr = self.iter_next(itr)
-            pos += 1
+    def do_iter_n_children(self, itr):
+        if itr is None:
+            return self._get_length()
+        return 0
 
-    def on_playback_state_change(self, event_type, player_obj, track):
-        position = self.playlist.current_position
-        if position < 0 or position >= len(self):
-            return
-        self.update_row_params(position)
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < self._get_length():
+            return True, self._create_iter(n)
+        return False, None
 
-    def on_track_tags_changed(self, type, track, tags):
-        if (
-            not track
-            or not settings.get_option('gui/sync_on_tag_change', True)
-            or not (tags & self.column_names)
-        ):
-            return
+    def do_iter_parent(self, child):
+        return False, None
 
-        if self._redraw_timer:
-            GLib.source_remove(self._redraw_timer)
-        self._redraw_queue.append(track)
-        self._redraw_timer = GLib.timeout_add(100, self._on_track_tags_changed)
+    ### Event callbacks to keep the model in sync with the playlist ###
 
-    def _on_track_tags_changed(self):
-        self._redraw_timer = None
-        redraw_queue = set(self._redraw_queue)
-        self._redraw_queue = []
+    def on_tracks_added(self, event_type, playlist, tracks):
+        # The positions are ascending and final, so inserting the ranges one
+        # after the other puts every track in its place. Each row-inserted
+        # signal must only see the rows inserted so far.
+        if not tracks:
+            return
+        with self._bulk_update(len(tracks)):
+            for start, rows in self._get_ranges(tracks):
+                count = len(rows)
+                self._tracks[start:start] = rows
+                self._log_edit(start, count)
+                for offset in range(count):
+                    position = start + offset
+                    self._pending = (position + 1, (), 0, count - offset - 1)
+                    self._index_position(position)
+                    path = Gtk.TreePath((position,))
+                    self.row_inserted(path, self.get_iter(path))
+                self._pending = None
 
-        COL_TRACK = self.COL_TRACK
-        COL_CACHE = self.COL_CACHE
+    def on_tracks_removed(self, event_type, playlist, tracks):
+        # The positions are from before the removal, so remove the ranges
+        # starting from the end to keep the others valid
+        if not tracks:
+            return
+        with self._bulk_update(len(tracks)):
+            for start, rows in reversed(self._get_ranges(tracks)):
+                count = len(rows)
+                del self._tracks[start : start + count]
+                self._log_edit(start, -count)
+                for offset in reversed(range(count)):
+                    self._pending = (start, rows, offset, 0)
+                    self.row_deleted(Gtk.TreePath((start + offset,)))
+                self._pending = None
+                for track in set(rows):
+                    self._get_track_positions(track)
+
+    @staticmethod
+    def _get_ranges(tracks):
+        """
+        Groups the (position, track) pairs of an event into ranges of
+        consecutive positions
+
+        :returns: list of (start, tracks) in ascending order
+        """
+        ranges = []
+        rows = None
+        end = None
+        for position, track in tracks:
+            if position != end:
+                rows = []
+                ranges.append((position, rows))
+            rows.append(track)
+            end = position + 1
+        return ranges
+
+    def _build_index(self):
+        """
+        Indexes the positions of all rows and empties the edit log
+        """
+        self._edits = []
+        self._track_positions = track_positions = {}
+        for position, track in enumerate(self._tracks):
+            try:
+                track_positions[track].append((position, 0))
+            except KeyError:
+                track_positions[track] = [(position, 0)]
+
+    def _log_edit(self, start, delta):
+        if len(self._edits) >= self.EDIT_LOG_SIZE:
+            # _tracks already contains the edit
+            self._build_index()
+        else:
+            self._edits.append((start, delta))
 
-        for row in self:
-            if row[COL_TRACK] in redraw_queue:
-                row[COL_CACHE].clear()
-                self.row_changed(row.path, row.iter)
+    def _index_position(self, position):
+        """
+        Adds a row that was inserted after the last logged edit
+        """
+        generation = len(self._edits)
+        if generation == 0:
+            # the index was just rebuilt and includes the row
+            return
+        track = self._tracks[position]
+        try:
+            self._track_positions[track].append((position, generation))
+        except KeyError:
+            self._track_positions[track] = [(position, generation)]
 
-    #
-    # Loading data into the playlist:
-    #
-    # - Profiler reveals that most of the playlist loading time is spent in two
-    #   places
-    #   - Formatting values
-    #   - Converting them to GValue objects for insert into the treeview
-    #
-    # Now, the program is annoyingly blocked when this happens, so we need to
-    # process new tracks on a different thread, and show some kind of loading
-    # indicator instead. That's what these four functions help us do.
-    #
+    def _get_track_positions(self, track):
+        """
+        Moves the indexed positions of a track through the logged edits
 
-    def _load_data(self, tracks):
+        :returns: the current positions of the rows of the track
+        """
+        entries = self._track_positions.get(track)
+        if not entries:
+            return []
+        edits = self._edits
+        generation = len(edits)
+        positions = []
+        for position, indexed in entries:
+            for start, delta in itertools.islice(edits, indexed, None):
+                if position < start:
+                    continue
+                if delta < 0 and position < start - delta:
+                    # the row was removed
+                    break
+                position += delta
+            else:
+                positions.append(position)
+        if positions:
+            self._track_positions[track] = [
+                (position, generation) for position in positions
+            ]
+        else:
+            del self._track_positions[track]
+        return positions
 
-        # Don't allow race condition between adds.. there's probably a race
-        # condition for removal
-        if self.data_loading:
-            self.data_load_queue.extend(tracks)
+    @contextlib.contextmanager
+    def _bulk_update(self, count):
+        """
+        Lets the playlist page detach the model from the view while a
+        large number of rows change, which is much faster than updating
+        the view for each row
+        """
+        if count <= self.BULK_UPDATE_SIZE or self.data_loading:
+            yield
             return
 
         self.data_loading = True
         self.emit('data-loading', True)
+        try:
+            yield
+        finally:
+            self.data_loading = False
+            self.emit('data-loading', False)
+
+    def on_current_position_changed(self, event_type, playlist, positions):
+        for position in positions:
+            if position < 0:
+                continue
+            self.update_row_params(position)
 
-        if len(tracks) > 500:
-            self._load_data_thread(tracks)
+    def on_spat_position_changed(self, event_type, playlist, positions):
+        # Only the rows between the old and the new position change. If
+        # either is unset (-1), every row after the other one changes.
+        valid = [pos for pos in positions if pos >= 0]
+        if not valid:
+            return
+        pos = min(valid)
+        if len(valid) == len(positions):
+            end = max(valid) + 1
         else:
-            render_data = self._load_data_fn(tracks)
-            self._load_data_done(render_data)
-
-    @common.threaded
-    def _load_data_thread(self, tracks):
-        render_data = self._load_data_fn(tracks)
-        GLib.idle_add(self._load_data_done, render_data)
-
-    def _load_data_fn(self, tracks):
-        indices = (0, 1, 2, 3, 4)
-        return [
-            (position, indices, (track, {}) + self._compute_row_params(position))
-            for position, track in tracks
-        ]
+            end = len(self)
+        self._update_row_params_range(pos, end)
 
-    def _load_data_done(self, render_data):
-        for args in render_data:
-            self.insert_with_valuesv(*args)
+    def _update_row_params_range(self, start, end):
+        """
+        Recomputes the params of the rows from start to end (exclusive)
+        """
+        for position in range(start, min(end, self._get_length())):
+            path = Gtk.TreePath((position,))
+            self.row_changed(path, self.get_iter(path))
 
-        self.data_loading = False
-        self.emit('data-loading', False)
+    def on_playback_state_change(self, event_type, player_obj, track):
+        self.update_row_params(self.playlist.current_position)
+
+    def on_track_tags_changed(self, type, changes):
+        if not settings.get_option('gui/sync_on_tag_change', True):
+            return
 
-        if self.data_load_queue:
-            tracks = self.data_load_queue
-            self.data_load_queue = []
+        # Tracks whose tags weren't cached haven't been drawn recently, so
+        # they can't be visible
+        column_names = self.column_names
+        redraw = set()
+        for track, tags in changes:
+            if track in self._cache and tags & column_names:
+                del self._cache[track]
+                redraw.add(track)
+        if not redraw:
+            return
 
-            self._load_data(tracks)
+        for track in redraw:
+            for position in sorted(self._get_track_positions(track)):
+                path = Gtk.TreePath((position,))
+                self.row_changed(path, self.get_iter(path))